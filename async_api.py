@@ -0,0 +1,271 @@
+#!/usr/bin/env python3
+"""
+Async (ASGI) serving mode for the recipe API.
+
+Serves the same /health, /ready, /metrics and /recipe-query contract as
+full_api.py, but section prompts run as coroutines on one shared, pooled
+AsyncOpenAI client instead of holding a worker thread each. Generations are
+capped per process; once the wait queue is full, requests are rejected
+immediately with 429 and a Retry-After header. Each worker process has its
+own cap, so run one worker to keep ASYNC_MAX_GENERATIONS a server-wide limit:
+
+    uvicorn async_api:app --host 0.0.0.0 --port 5000
+"""
+
+import asyncio
+import contextlib
+import math
+import os
+import time
+
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.responses import JSONResponse, Response
+from starlette.routing import Route
+
+import full_api as sync_api
+from full_api import FULL_SYSTEM_AVAILABLE
+
+if FULL_SYSTEM_AVAILABLE:
+    from tools import clients, generator, metrics, retrieval, startup
+    from tools.article_cache import AsyncSingleFlight, article_key
+
+# Article generations running at once in this process
+ASYNC_MAX_GENERATIONS = int(os.environ.get('ASYNC_MAX_GENERATIONS', 32))
+# Requests allowed to wait for a generation slot before new ones get 429
+ASYNC_MAX_QUEUE = int(os.environ.get('ASYNC_MAX_QUEUE', 64))
+# Longest a queued request waits for a slot before it gets 429 (seconds)
+ASYNC_QUEUE_TIMEOUT = float(os.environ.get('ASYNC_QUEUE_TIMEOUT', 30))
+
+class Overloaded(Exception):
+    def __init__(self, retry_after):
+        super().__init__('Too many article generations in progress')
+        self.retry_after = retry_after
+
+class GenerationLimiter:
+    """Per-process cap on concurrent generations with a bounded wait queue.
+
+    ``slot()`` admits up to ``max_active`` generations; up to ``max_queue``
+    more wait in line. Anything beyond that, or a wait longer than
+    ``queue_timeout``, raises ``Overloaded`` with a Retry-After estimate
+    based on the recent average generation time. Nothing is shared between
+    worker processes: N workers admit up to N × ``max_active`` generations.
+    """
+
+    def __init__(self, max_active=ASYNC_MAX_GENERATIONS, max_queue=ASYNC_MAX_QUEUE,
+                 queue_timeout=ASYNC_QUEUE_TIMEOUT):
+        self.max_active = max_active
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.active = 0
+        self.waiting = 0
+        self.rejected = 0
+        self.average_seconds = None
+        self._semaphore = asyncio.Semaphore(max_active)
+
+    def retry_after(self):
+        """Seconds until a slot is likely to free up for a new request"""
+        average = self.average_seconds or 10.0
+        rounds = (self.waiting + 1) / self.max_active
+        return max(1, math.ceil(average * rounds))
+
+    def _reject(self):
+        self.rejected += 1
+        return Overloaded(self.retry_after())
+
+    @contextlib.asynccontextmanager
+    async def slot(self):
+        if self.active + self.waiting >= self.max_active + self.max_queue:
+            raise self._reject()
+
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), self.queue_timeout)
+        except asyncio.TimeoutError:
+            raise self._reject() from None
+        finally:
+            self.waiting -= 1
+
+        self.active += 1
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.active -= 1
+            self._semaphore.release()
+            elapsed = time.perf_counter() - started
+            if self.average_seconds is None:
+                self.average_seconds = elapsed
+            else:
+                self.average_seconds = 0.8 * self.average_seconds + 0.2 * elapsed
+
+    def stats(self):
+        return {
+            'active': self.active,
+            'waiting': self.waiting,
+            'max_active': self.max_active,
+            'max_queue': self.max_queue,
+            'rejected': self.rejected,
+        }
+
+limiter = GenerationLimiter()
+article_flights = AsyncSingleFlight() if FULL_SYSTEM_AVAILABLE else None
+_fallback_client = None
+
+def fallback_client():
+    """Shared AsyncOpenAI client for fallback generation"""
+    global _fallback_client
+    if FULL_SYSTEM_AVAILABLE:
+        return clients.get_async_client()
+    if _fallback_client is None:
+        from openai import AsyncOpenAI
+        _fallback_client = AsyncOpenAI(api_key=os.environ.get('OPENAI_API_KEY'))
+    return _fallback_client
+
+async def health_check(request):
+    """Same payload as full_api's /health, plus the generation limiter's state"""
+    status = "full" if FULL_SYSTEM_AVAILABLE else "simple"
+    corpus_loader = sync_api.corpus_loader
+    payload = {
+        'status': 'healthy',
+        'message': f'Recipe API server is running ({status} mode, async)',
+        'full_system': FULL_SYSTEM_AVAILABLE,
+        'ready': corpus_loader is None or corpus_loader.ready,
+        'generations': limiter.stats()
+    }
+    if FULL_SYSTEM_AVAILABLE:
+        payload['corpus'] = corpus_loader.status()
+        payload['query_cache'] = retrieval.query_cache.stats()
+        payload['article_cache'] = dict(sync_api.article_cache.stats(),
+                                        coalesced=article_flights.coalesced)
+        payload['startup'] = dict(startup.report(), first_health=startup.mark('first_health'))
+    return JSONResponse(payload)
+
+async def readiness_check(request):
+    """Readiness probe: 503 until the recipe corpus is loaded"""
+    corpus_loader = sync_api.corpus_loader
+    if corpus_loader is not None and not corpus_loader.ready:
+        return JSONResponse({'ready': False, 'corpus': corpus_loader.status()}, status_code=503)
+    return JSONResponse({'ready': True})
+
+async def prometheus_metrics(request):
+    """Stage latencies, token usage and cache lookups in Prometheus text format"""
+    if not FULL_SYSTEM_AVAILABLE:
+        return Response('', media_type='text/plain')
+    return Response(sync_api.metrics_text(), media_type='text/plain; version=0.0.4')
+
+async def build_article(query, data, corpus, refresh):
+    """Async ``full_api.build_article``: retrieval in a thread, generation as coroutines"""
+    top_recipes = await asyncio.to_thread(sync_api.find_recipes, query, data, corpus)
+
+    library = sync_api.section_library(data, corpus)
+    key = article_key(query, top_recipes, version=corpus.version, fast=library is not None)
+    cached = sync_api.cached_article(key, refresh)
+    if cached is not None:
+        return cached
+
+    async with limiter.slot():
+        print("Generating professional article...")
+        article_content = await generator.agenerate_professional_article(
+            query, top_recipes, library=library
+        )
+    sync_api.article_cache.put(key, article_content)
+    return {'html': article_content, 'cached': False}
+
+async def generate_fallback(query):
+    async with limiter.slot():
+        response = await fallback_client().chat.completions.create(
+            model='gpt-3.5-turbo',
+            messages=[{'role': 'user', 'content': sync_api.fallback_prompt(query)}],
+            temperature=0.7,
+            max_tokens=2000
+        )
+    return response.choices[0].message.content or ''
+
+async def recipe_query(request):
+    """Handle recipe queries"""
+    trace = None
+    if FULL_SYSTEM_AVAILABLE:
+        trace = metrics.start_request('recipe_query', request.headers.get('X-Request-ID'))
+    response = await _recipe_query(request)
+    if trace is not None:
+        response.headers['X-Request-ID'] = trace.request_id
+        metrics.finish_request(trace, response.status_code)
+    return response
+
+async def _recipe_query(request):
+    try:
+        data = await request.json()
+        query = data.get('query', '')
+
+        if not query:
+            return JSONResponse({'error': 'Query is required'}, status_code=400)
+
+        print(f"Processing query: {query}")
+
+        # Try full system first
+        if FULL_SYSTEM_AVAILABLE:
+            corpus = await asyncio.to_thread(sync_api.get_corpus)
+
+            if corpus is not None:
+                refresh = sync_api.wants_refresh(data, request.headers)
+                article, shared = await article_flights.do(
+                    sync_api.flight_key(query, data, corpus, refresh),
+                    lambda: build_article(query, data, corpus, refresh)
+                )
+                if shared:
+                    print("Shared the result of an identical in-flight query")
+                startup.mark('first_query')
+
+                return JSONResponse({
+                    'success': True,
+                    'html': article['html'],
+                    'cached': article['cached'] or shared,
+                    'summary': 'Professional article generated with full recipe database'
+                })
+
+        # Fallback to simple generation
+        print("Using fallback generation")
+        return JSONResponse({
+            'success': True,
+            'html': await generate_fallback(query),
+            'summary': 'Article generated (fallback mode)'
+        })
+
+    except Overloaded as e:
+        print(f"Rejecting query, generation queue is full (retry after {e.retry_after}s)")
+        return JSONResponse(
+            {'error': 'Server is busy, retry later', 'retry_after': e.retry_after},
+            status_code=429, headers={'Retry-After': str(e.retry_after)}
+        )
+    except Exception as e:
+        print(f"Error processing recipe query: {str(e)}")
+        return JSONResponse({'error': 'Failed to generate recipe content', 'details': str(e)},
+                            status_code=500)
+
+@contextlib.asynccontextmanager
+async def lifespan(app):
+    if FULL_SYSTEM_AVAILABLE:
+        sync_api.start_corpus()
+    yield
+    if FULL_SYSTEM_AVAILABLE:
+        await clients.close_async_client()
+    if _fallback_client is not None:
+        await _fallback_client.close()
+
+app = Starlette(
+    routes=[
+        Route('/health', health_check, methods=['GET']),
+        Route('/ready', readiness_check, methods=['GET']),
+        Route('/metrics', prometheus_metrics, methods=['GET']),
+        Route('/recipe-query', recipe_query, methods=['POST']),
+    ],
+    middleware=[Middleware(CORSMiddleware, allow_origins=['*'], allow_methods=['*'], allow_headers=['*'])],
+    lifespan=lifespan,
+)
+
+if __name__ == '__main__':
+    import uvicorn
+    port = int(os.environ.get('PORT', 5000))
+    uvicorn.run(app, host='0.0.0.0', port=port)
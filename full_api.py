@@ -4,63 +4,307 @@ Full Python API server for recipe generation with FAISS
 Deploy this on Render to handle recipe queries with full database
 """
 
-from flask import Flask, request, jsonify
+from flask import Flask, Response, g, request, jsonify, stream_with_context
 from flask_cors import CORS
+import gc
+import importlib.util
 import os
+import re
+import sqlite3
 import sys
 import json
+import threading
+import time
 
 # Add the recipe-writer directory to Python path
 sys.path.append(os.path.join(os.path.dirname(__file__), 'recipe writing', 'recipe-writer'))
 
 try:
-    from tools import airtable_sync, embeddings, vector_store, retrieval, generator
+    from tools import retrieval, generator
+    from tools import clients, jobs, metrics, snapshots, startup
+    from tools.article_cache import ArticleCache, SingleFlight, article_key
+    from tools.embedding_cache import normalize_query
+    from tools.facets import normalize_filters
+    from tools.corpus import CorpusLoader
+    # faiss and openai are imported on first use, so check they are installed
+    for _module in ('faiss', 'openai'):
+        if importlib.util.find_spec(_module) is None:
+            raise ImportError(f"No module named '{_module}'")
     FULL_SYSTEM_AVAILABLE = True
+    startup.mark('imports')
     print("Full recipe system loaded successfully")
 except ImportError as e:
     print(f"Full system not available: {e}")
     FULL_SYSTEM_AVAILABLE = False
 
+# When to load the corpus (see start_corpus; importing this module loads nothing):
+#   background - at startup in a thread; /health answers while it loads (default)
+#   sync       - before serving; with `gunicorn --preload full_api:app` and a
+#                when_ready hook this happens before workers fork, so they
+#                share the index memory
+#   lazy       - on the first query
+CORPUS_PRELOAD = os.environ.get('CORPUS_PRELOAD', 'background')
+# How often to look for a newly published snapshot (0 disables hot swapping)
+SNAPSHOT_POLL_SECONDS = float(os.environ.get('SNAPSHOT_POLL_SECONDS', 30))
+# Largest number of queries accepted by /recipe-query/batch
+BATCH_QUERY_LIMIT = int(os.environ.get('BATCH_QUERY_LIMIT', 100))
+# Required in the X-Admin-Token header of /admin requests when set
+ADMIN_TOKEN = os.environ.get('ADMIN_TOKEN')
+# Threads per process running queued /recipe-jobs (0 only accepts jobs,
+# leaving them to other processes sharing the job database)
+JOB_WORKERS = int(os.environ.get('JOB_WORKERS', 2))
+# Reuse pre-written recipe sections from the snapshot's section library by
+# default; requests can override it with "fast"
+FAST_ARTICLES = os.environ.get('FAST_ARTICLES', '').lower() in ('1', 'true', 'yes')
+
 app = Flask(__name__)
 CORS(app)
 
-# Global variables for caching
-recipes_cache = None
-index_cache = None
-id_to_recipe_cache = None
+corpus_loader = CorpusLoader() if FULL_SYSTEM_AVAILABLE else None
+article_cache = ArticleCache() if FULL_SYSTEM_AVAILABLE else None
+# Identical /recipe-query requests in flight share one retrieval + generation
+article_flights = SingleFlight() if FULL_SYSTEM_AVAILABLE else None
+
+def get_corpus():
+    """Loaded corpus (waits for a load in progress), or None if unavailable"""
+    if corpus_loader is None:
+        return None
+    return corpus_loader.get()
+
+_corpus_started_pid = None
+_corpus_start_lock = threading.Lock()
+
+def start_corpus():
+    """Load the corpus as CORPUS_PRELOAD says and watch for snapshots, once per process.
+
+    Called by the first request a process handles, by ``python full_api.py``
+    before serving and by async_api's startup; for CORPUS_PRELOAD=sync under
+    ``gunicorn --preload``, call it from a ``when_ready`` hook so workers
+    fork with the corpus loaded.
+    """
+    global _corpus_started_pid
+    if corpus_loader is None or _corpus_started_pid == os.getpid():
+        return
+    with _corpus_start_lock:
+        if _corpus_started_pid == os.getpid():
+            return
+        if CORPUS_PRELOAD == 'sync':
+            corpus_loader.get()
+            clients.warm_up()
+            # Keep the garbage collector from touching (and so copying) the
+            # loaded objects in forked workers
+            gc.freeze()
+        elif CORPUS_PRELOAD == 'background':
+            corpus_loader.start()
+            # Import the OpenAI SDK while the corpus loads, not on the first query
+            threading.Thread(target=clients.warm_up, name='client-warm-up', daemon=True).start()
+        if SNAPSHOT_POLL_SECONDS > 0:
+            corpus_loader.watch(SNAPSHOT_POLL_SECONDS)
+        _corpus_started_pid = os.getpid()
+
+def requested_count(query):
+    """Number of recipes to retrieve (default to 5 if no number found in the query)"""
+    numbers = re.findall(r'\d+', query)
+    return int(numbers[0]) if numbers else 5
+
+def public_recipe(recipe):
+    """Recipe fields safe to send to clients (drops the embedding vector)"""
+    return {key: value for key, value in recipe.items() if key != 'embedding'}
 
-def load_recipe_data():
-    """Load recipe data and embeddings"""
-    global recipes_cache, index_cache, id_to_recipe_cache
-    
+def json_line(payload):
+    return json.dumps(payload) + '\n'
+
+# Probes and scrapes are not traced, so they don't flood the request log
+UNTRACED_ENDPOINTS = {'health_check', 'readiness_check', 'prometheus_metrics'}
+
+@app.before_request
+def start_trace():
+    g.trace = None
+    if FULL_SYSTEM_AVAILABLE and request.endpoint not in UNTRACED_ENDPOINTS:
+        g.trace = metrics.start_request(request.endpoint or request.path,
+                                        request.headers.get('X-Request-ID'))
+
+@app.after_request
+def finish_trace(response):
+    trace = g.get('trace')
+    if trace is not None:
+        response.headers['X-Request-ID'] = trace.request_id
+        # Streamed responses finish their trace when the stream ends
+        if not response.is_streamed:
+            metrics.finish_request(trace, response.status_code)
+    return response
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    """Stage latencies, token usage and cache lookups in Prometheus text format"""
     if not FULL_SYSTEM_AVAILABLE:
-        return None, None, None
-        
-    if recipes_cache is None:
+        return Response('', mimetype='text/plain')
+    return Response(metrics_text(), mimetype='text/plain; version=0.0.4')
+
+def metrics_text():
+    lines = [metrics.render()]
+    corpus = corpus_loader.corpus
+    lines.append('# TYPE recipe_corpus_ready gauge\n'
+                 f'recipe_corpus_ready {int(corpus_loader.ready)}\n')
+    if corpus is not None:
+        lines.append('# TYPE recipe_corpus_recipes gauge\n'
+                     f'recipe_corpus_recipes {len(corpus.recipes)}\n')
+    store = job_store
+    if store is not None:
+        # Scrapes only, so a busy job database never fails a health probe
         try:
-            print("Loading recipes with embeddings...")
-            recipes_cache = embeddings.load_embeddings()
-            
-            print("Loading FAISS index...")
-            index_cache = vector_store.load_faiss_index()
-            id_to_recipe_cache = vector_store.get_id_to_recipe(recipes_cache)
-            
-            print(f"Loaded {len(recipes_cache)} recipes")
-        except Exception as e:
-            print(f"Error loading recipe data: {e}")
-            return None, None, None
-    
-    return recipes_cache, index_cache, id_to_recipe_cache
+            counts = store.counts()
+        except sqlite3.Error as e:
+            print(f"Could not count jobs: {e}")
+        else:
+            lines.append('# TYPE recipe_jobs gauge\n' + ''.join(
+                f'recipe_jobs{{status="{status}"}} {counts.get(status, 0)}\n'
+                for status in (jobs.QUEUED, jobs.RUNNING, jobs.DONE, jobs.FAILED, jobs.EXPIRED)
+            ))
+    return ''.join(lines)
 
 @app.route('/health', methods=['GET'])
 def health_check():
-    """Health check endpoint"""
+    """Health check endpoint.
+
+    Always 200 while the process is alive; ``ready`` says whether the recipe
+    corpus has finished loading (see /ready for a probe that fails until then).
+    """
     status = "full" if FULL_SYSTEM_AVAILABLE else "simple"
-    return jsonify({
+    payload = {
         'status': 'healthy', 
         'message': f'Recipe API server is running ({status} mode)',
-        'full_system': FULL_SYSTEM_AVAILABLE
-    })
+        'full_system': FULL_SYSTEM_AVAILABLE,
+        'ready': corpus_loader is None or corpus_loader.ready
+    }
+    if FULL_SYSTEM_AVAILABLE:
+        payload['corpus'] = corpus_loader.status()
+        payload['query_cache'] = retrieval.query_cache.stats()
+        payload['article_cache'] = dict(article_cache.stats(), coalesced=article_flights.coalesced)
+        payload['startup'] = dict(startup.report(), first_health=startup.mark('first_health'))
+    return jsonify(payload)
+
+@app.route('/ready', methods=['GET'])
+def readiness_check():
+    """Readiness probe: 503 until the recipe corpus is loaded"""
+    if corpus_loader is not None and not corpus_loader.ready:
+        return jsonify({'ready': False, 'corpus': corpus_loader.status()}), 503
+    return jsonify({'ready': True})
+
+def admin_authorized():
+    return not ADMIN_TOKEN or request.headers.get('X-Admin-Token') == ADMIN_TOKEN
+
+@app.route('/admin/snapshot', methods=['GET'])
+def snapshot_status():
+    """Active corpus snapshot, its load time, and the latest published version"""
+    if not admin_authorized():
+        return jsonify({'error': 'Unauthorized'}), 401
+    if corpus_loader is None:
+        return jsonify({'error': 'Full recipe system not available'}), 503
+
+    payload = corpus_loader.status()
+    payload['published_version'] = snapshots.current_version()
+    corpus = corpus_loader.corpus
+    if corpus is not None and corpus.version:
+        try:
+            payload['manifest'] = snapshots.open_snapshot(corpus.version).manifest()
+        except OSError:
+            pass
+    return jsonify(payload)
+
+@app.route('/admin/snapshot/reload', methods=['POST'])
+def snapshot_reload():
+    """Check for a new snapshot now instead of waiting for the next poll"""
+    if not admin_authorized():
+        return jsonify({'error': 'Unauthorized'}), 401
+    if corpus_loader is None:
+        return jsonify({'error': 'Full recipe system not available'}), 503
+
+    threading.Thread(target=corpus_loader.refresh, daemon=True).start()
+    return jsonify({'reloading': True, 'published_version': snapshots.current_version()}), 202
+
+def wants_refresh(data, headers=None):
+    """Forced regeneration: ``"refresh": true`` in the body or ``Cache-Control: no-cache``"""
+    headers = request.headers if headers is None else headers
+    return bool(data.get('refresh')) or 'no-cache' in headers.get('Cache-Control', '')
+
+def flight_key(query, data, corpus, refresh):
+    """Requests with the same key are identical and can share one article"""
+    return json.dumps([
+        normalize_query(query), data.get('category'), data.get('tags'),
+        data.get('diversify'), section_library(data, corpus) is not None,
+        corpus.version, refresh
+    ], default=str)
+
+def find_recipes(query, data, corpus):
+    """Retrieve the recipes for an article request"""
+    k = requested_count(query)
+    print(f"Searching for {k} recipes...")
+    top_recipes = retrieval.search_recipes(
+        query, corpus.index, corpus.id_to_recipe,
+        category=data.get('category'), tags=data.get('tags'),
+        k=k, facets=corpus.facets, lexical=corpus.lexical,
+        diversify=data.get('diversify', retrieval.MMR_ENABLED)
+    )
+    print(f"Found {len(top_recipes)} matching recipes")
+    return top_recipes
+
+def section_library(data, corpus):
+    """Section library to reuse for a fast-mode request, else None"""
+    if data.get('fast', FAST_ARTICLES):
+        return corpus.sections
+    return None
+
+def cached_article(key, refresh):
+    """Cached article for ``key`` as a response dict, or None"""
+    if refresh:
+        return None
+    article_content = article_cache.get(key)
+    if article_content is None:
+        return None
+    print("Serving cached article")
+    return {'html': article_content, 'cached': True}
+
+_fallback_client = None
+
+def fallback_client():
+    """Shared OpenAI client for fallback generation"""
+    global _fallback_client
+    if FULL_SYSTEM_AVAILABLE:
+        return clients.get_client()
+    if _fallback_client is None:
+        from openai import OpenAI
+        _fallback_client = OpenAI(api_key=os.environ.get('OPENAI_API_KEY'))
+    return _fallback_client
+
+def fallback_prompt(query):
+    return f"""
+Write a professional article about "{query}". 
+
+Create a compelling article with:
+- An engaging introduction
+- 3-5 recipe sections with descriptions  
+- Cooking tips
+- A conclusion
+
+Format the response as HTML with proper headings and paragraphs.
+"""
+
+def build_article(query, data, corpus, refresh):
+    """Retrieve recipes and generate the article, reusing a cached article if possible"""
+    top_recipes = find_recipes(query, data, corpus)
+    library = section_library(data, corpus)
+
+    key = article_key(query, top_recipes, version=corpus.version, fast=library is not None)
+    cached = cached_article(key, refresh)
+    if cached is not None:
+        return cached
+
+    # Generate professional article
+    print("Generating professional article...")
+    article_content = generator.generate_professional_article(query, top_recipes, library=library)
+    article_cache.put(key, article_content)
+    return {'html': article_content, 'cached': False}
 
 @app.route('/recipe-query', methods=['POST'])
 def recipe_query():
@@ -76,50 +320,30 @@ def recipe_query():
         
         # Try full system first
         if FULL_SYSTEM_AVAILABLE:
-            recipes, index, id_to_recipe = load_recipe_data()
+            corpus = get_corpus()
             
-            if recipes and index and id_to_recipe:
-                # Extract number from query (default to 5 if no number found)
-                import re
-                numbers = re.findall(r'\d+', query)
-                k = int(numbers[0]) if numbers else 5
-                
-                # Retrieve recipes
-                print(f"Searching for {k} recipes...")
-                top_recipes = retrieval.search_recipes(query, index, id_to_recipe, k=k)
-                
-                print(f"Found {len(top_recipes)} matching recipes")
-                
-                # Generate professional article
-                print("Generating professional article...")
-                article_content = generator.generate_professional_article(query, top_recipes)
+            if corpus is not None:
+                refresh = wants_refresh(data)
+                article, shared = article_flights.do(
+                    flight_key(query, data, corpus, refresh),
+                    lambda: build_article(query, data, corpus, refresh)
+                )
+                if shared:
+                    print("Shared the result of an identical in-flight query")
+                startup.mark('first_query')
                 
                 return jsonify({
                     'success': True,
-                    'html': article_content,
+                    'html': article['html'],
+                    'cached': article['cached'] or shared,
                     'summary': 'Professional article generated with full recipe database'
                 })
         
         # Fallback to simple generation
         print("Using fallback generation")
-        from openai import OpenAI
-        client = OpenAI(api_key=os.environ.get('OPENAI_API_KEY'))
-        
-        prompt = f"""
-Write a professional article about "{query}". 
-
-Create a compelling article with:
-- An engaging introduction
-- 3-5 recipe sections with descriptions  
-- Cooking tips
-- A conclusion
-
-Format the response as HTML with proper headings and paragraphs.
-"""
-        
-        response = client.chat.completions.create(
+        response = fallback_client().chat.completions.create(
             model='gpt-3.5-turbo',
-            messages=[{'role': 'user', 'content': prompt}],
+            messages=[{'role': 'user', 'content': fallback_prompt(query)}],
             temperature=0.7,
             max_tokens=2000
         )
@@ -136,6 +360,256 @@ Format the response as HTML with proper headings and paragraphs.
         print(f"Error processing recipe query: {str(e)}")
         return jsonify({'error': 'Failed to generate recipe content', 'details': str(e)}), 500
 
+@app.route('/recipe-query/batch', methods=['POST'])
+def recipe_query_batch():
+    """Retrieve recipes for many queries at once.
+
+    Body: ``{"queries": [...], "generate": false}`` where each query is a
+    string or ``{"query", "k", "category", "tags"}``. All queries are
+    embedded together and searched with batched index searches. With
+    ``generate`` an article is also written for each query.
+    """
+    data = request.get_json() or {}
+    raw_queries = data.get('queries') or []
+
+    if not isinstance(raw_queries, list) or not raw_queries:
+        return jsonify({'error': 'queries must be a non-empty list'}), 400
+    if len(raw_queries) > BATCH_QUERY_LIMIT:
+        return jsonify({'error': f'At most {BATCH_QUERY_LIMIT} queries per batch'}), 400
+
+    searches = []
+    for item in raw_queries:
+        if not isinstance(item, (str, dict)):
+            return jsonify({'error': 'Every query must be a string or an object'}), 400
+        search = {'query': item} if isinstance(item, str) else dict(item)
+        if not search.get('query') or not isinstance(search['query'], str):
+            return jsonify({'error': 'Every query needs a non-empty query string'}), 400
+        try:
+            normalize_filters(search.get('category'), search.get('tags'))
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        search.setdefault('k', requested_count(search['query']))
+        searches.append(search)
+
+    corpus = get_corpus()
+    if corpus is None:
+        return jsonify({'error': 'Recipe database is not available'}), 503
+
+    try:
+        print(f"Processing batch of {len(searches)} queries")
+        recipe_lists = retrieval.search_recipes_batch(
+            searches, corpus.index, corpus.id_to_recipe, facets=corpus.facets,
+            lexical=corpus.lexical, diversify=data.get('diversify', retrieval.MMR_ENABLED)
+        )
+
+        articles = None
+        if data.get('generate'):
+            print("Generating articles...")
+            articles = generator.generate_professional_articles(
+                [(s['query'], recipes) for s, recipes in zip(searches, recipe_lists)],
+                library=section_library(data, corpus)
+            )
+
+        results = []
+        for i, (search, recipes) in enumerate(zip(searches, recipe_lists)):
+            result = {'query': search['query'], 'recipes': [public_recipe(r) for r in recipes]}
+            if articles is not None:
+                result['html'] = articles[i]
+            results.append(result)
+
+        return jsonify({'success': True, 'results': results})
+    except Exception as e:
+        print(f"Error processing recipe batch: {str(e)}")
+        return jsonify({'error': 'Failed to process recipe batch', 'details': str(e)}), 500
+
+@app.route('/recipe-query/stream', methods=['POST'])
+def recipe_query_stream():
+    """Stream a recipe article as JSON lines while it is being generated.
+
+    Emits a ``recipes`` event with the retrieved recipes as soon as the search
+    finishes, then one ``section`` event per article section in completion
+    order (``position`` is its index in the final article), then ``done``.
+    Failures after the stream has started are reported as an ``error`` event.
+    """
+    data = request.get_json() or {}
+    query = data.get('query', '')
+
+    if not query:
+        return jsonify({'error': 'Query is required'}), 400
+
+    corpus = get_corpus()
+    if corpus is None:
+        return jsonify({'error': 'Recipe database is not available'}), 503
+
+    print(f"Streaming query: {query}")
+    trace = g.trace
+
+    def events():
+        status = 200
+        try:
+            k = requested_count(query)
+            top_recipes = retrieval.search_recipes(
+                query, corpus.index, corpus.id_to_recipe,
+                category=data.get('category'), tags=data.get('tags'),
+                k=k, facets=corpus.facets, lexical=corpus.lexical,
+                diversify=data.get('diversify', retrieval.MMR_ENABLED)
+            )
+            yield json_line({
+                'type': 'recipes',
+                'recipes': [public_recipe(r) for r in top_recipes]
+            })
+
+            # intro + one section per recipe + cooking tips + conclusion
+            total = len(top_recipes) + 3
+            sections = generator.iter_article_sections(
+                query, top_recipes, library=section_library(data, corpus)
+            )
+            for position, kind, html in sections:
+                yield json_line({
+                    'type': 'section',
+                    'position': position,
+                    'kind': kind,
+                    'total': total,
+                    'html': html
+                })
+
+            yield json_line({'type': 'done', 'sections': total})
+        except Exception as e:
+            status = 500
+            print(f"Error streaming recipe query: {str(e)}")
+            yield json_line({
+                'type': 'error',
+                'error': 'Failed to generate recipe content',
+                'details': str(e)
+            })
+        finally:
+            metrics.finish_request(trace, status)
+
+    return Response(
+        stream_with_context(events()),
+        mimetype='application/x-ndjson',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+def run_article_job(store, job_id, query, params, deadline):
+    """Job worker body: retrieval and generation, storing each section as it finishes"""
+    trace = metrics.start_request('recipe_job', job_id)
+    status = 'failed'
+    try:
+        corpus = get_corpus()
+        if corpus is None:
+            raise RuntimeError('Recipe database is not available')
+
+        top_recipes = find_recipes(query, params, corpus)
+        # intro + one section per recipe + cooking tips + conclusion
+        total = len(top_recipes) + 3
+        store.set_recipes(job_id, [public_recipe(r) for r in top_recipes], total)
+
+        library = section_library(params, corpus)
+        key = article_key(query, top_recipes, version=corpus.version, fast=library is not None)
+        cached = cached_article(key, params.get('refresh'))
+        if cached is not None:
+            store.finish(job_id, cached['html'], cached=True)
+            status = 'done'
+            return
+
+        sections = [None] * total
+        for position, kind, html in generator.iter_article_sections(query, top_recipes, library=library):
+            store.add_section(job_id, position, kind, html)
+            sections[position] = html
+            if time.time() > deadline:
+                raise jobs.DeadlineExceeded(job_id)
+
+        article_content = generator.assemble_article(sections)
+        article_cache.put(key, article_content)
+        store.finish(job_id, article_content)
+        status = 'done'
+    finally:
+        metrics.finish_request(trace, status)
+
+job_store = None
+job_workers = None
+_job_workers_pid = None
+_job_workers_lock = threading.Lock()
+
+def start_job_workers():
+    """Open the job database and start this process's job workers, once per process.
+
+    Called for the first request a process handles (or from a gunicorn
+    ``post_fork`` hook), never at import: a ``gunicorn --preload`` master,
+    async_api or a script importing this module runs no jobs.
+    """
+    global job_store, job_workers, _job_workers_pid
+    if _job_workers_pid == os.getpid():
+        return
+    with _job_workers_lock:
+        if _job_workers_pid == os.getpid():
+            return
+        job_store = jobs.JobStore()
+        job_workers = jobs.JobWorkerPool(job_store, run_article_job, JOB_WORKERS)
+        if JOB_WORKERS > 0:
+            job_workers.start()
+        _job_workers_pid = os.getpid()
+
+@app.before_request
+def ensure_started():
+    if FULL_SYSTEM_AVAILABLE:
+        start_corpus()
+        start_job_workers()
+
+@app.route('/recipe-jobs', methods=['POST'])
+def submit_recipe_job():
+    """Queue an article for background generation and return its job id at once.
+
+    Body: the /recipe-query fields plus ``priority`` (a lane from
+    ``JOB_PRIORITIES``, default ``normal``) and ``deadline_seconds``.
+    Poll ``GET /recipe-jobs/<job_id>`` for progress and the article.
+    """
+    if job_store is None:
+        return jsonify({'error': 'Full recipe system not available'}), 503
+
+    data = request.get_json() or {}
+    query = data.get('query', '')
+    if not query:
+        return jsonify({'error': 'Query is required'}), 400
+
+    params = {name: data[name] for name in ('category', 'tags', 'diversify', 'fast') if name in data}
+    params['refresh'] = wants_refresh(data)
+    try:
+        job_id = job_store.submit(
+            query, params, priority=data.get('priority', 'normal'),
+            deadline_seconds=data.get('deadline_seconds')
+        )
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    job_workers.notify()
+
+    print(f"Queued job {job_id}: {query}")
+    status_url = f'/recipe-jobs/{job_id}'
+    return jsonify({
+        'success': True,
+        'job_id': job_id,
+        'status': jobs.QUEUED,
+        'status_url': status_url
+    }), 202, {'Location': status_url}
+
+@app.route('/recipe-jobs/<job_id>', methods=['GET'])
+def recipe_job_status(job_id):
+    """Job status, the sections finished so far, and the article once done"""
+    if job_store is None:
+        return jsonify({'error': 'Full recipe system not available'}), 503
+    job = job_store.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(job)
+
+if FULL_SYSTEM_AVAILABLE:
+    startup.mark('app')
+
 if __name__ == '__main__':
+    if FULL_SYSTEM_AVAILABLE:
+        # Load the corpus and resume queued jobs without waiting for the first request
+        start_corpus()
+        start_job_workers()
     port = int(os.environ.get('PORT', 5000))
     app.run(host='0.0.0.0', port=port, debug=False)
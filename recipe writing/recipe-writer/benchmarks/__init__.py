@@ -0,0 +1 @@
+# Offline benchmarks: fake OpenAI server, synthetic corpus and benchmark runner
@@ -0,0 +1,175 @@
+"""
+Local stand-in for the OpenAI API, so the pipeline can be measured offline.
+
+Serves /v1/embeddings and /v1/chat/completions over HTTP. The real
+``openai`` client talks to it through ``base_url``, so retries, headers
+and connection handling are exercised as in production. Embeddings and
+completions are deterministic functions of their input. Latency, 429s
+and 5xx errors can be configured.
+"""
+
+import base64
+import hashlib
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+from openai import OpenAI
+
+WORDS = (
+    "simmer roast braise whisk fold sear glaze toast crisp tender bright smoky "
+    "herb garlic citrus butter pepper honey savory fresh golden silky rustic warm"
+).split()
+
+def fake_embedding(text, dim):
+    """Unit-length vector seeded by the text, identical across runs"""
+    seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "little")
+    vector = np.random.default_rng(seed).standard_normal(dim).astype("float32")
+    return vector / np.linalg.norm(vector)
+
+def fake_completion(prompt, words):
+    """Paragraph of ``words`` words seeded by the prompt"""
+    rng = random.Random(hashlib.sha256(prompt.encode("utf-8")).digest())
+    return " ".join(rng.choice(WORDS) for _ in range(words)).capitalize() + "."
+
+class FakeOpenAIServer:
+    """Threaded HTTP server speaking the subset of the OpenAI API the pipeline uses.
+
+    ``latency`` (seconds, plus up to ``jitter``) is added to every response.
+    ``rate_limit_rate`` and ``error_rate`` are the chances that a request is
+    answered with a 429 (with ``retry-after-ms``) or a 500. Counts per
+    endpoint are kept in ``stats``.
+    """
+
+    def __init__(self, dim=256, latency=0.0, jitter=0.0, rate_limit_rate=0.0,
+                 error_rate=0.0, completion_words=120, seed=0):
+        self.dim = dim
+        self.latency = latency
+        self.jitter = jitter
+        self.rate_limit_rate = rate_limit_rate
+        self.error_rate = error_rate
+        self.completion_words = completion_words
+        self.stats = {"embeddings": 0, "chat": 0, "rate_limited": 0, "errors": 0}
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._httpd = None
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def client(self, **kwargs):
+        """OpenAI client pointed at this server"""
+        return OpenAI(api_key="fake", base_url=self.url, **kwargs)
+
+    def start(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                status, payload, headers = server._respond(self.path, body)
+                data = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        self._httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._httpd.daemon_threads = True
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._httpd is not None:
+            self._httpd.shutdown()
+            self._httpd.server_close()
+            self._httpd = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+        return False
+
+    def _respond(self, path, body):
+        with self._lock:
+            roll = self._random.random()
+            delay = self.latency + self._random.random() * self.jitter
+        time.sleep(delay)
+
+        headers = {
+            "x-ratelimit-limit-requests": "100000",
+            "x-ratelimit-remaining-requests": "99999",
+            "x-ratelimit-limit-tokens": "100000000",
+            "x-ratelimit-remaining-tokens": "99999999",
+        }
+        if roll < self.rate_limit_rate:
+            self._count("rate_limited")
+            error = {"error": {"message": "Rate limit reached", "type": "requests", "code": "rate_limit_exceeded"}}
+            return 429, error, {"retry-after-ms": "50"}
+        if roll < self.rate_limit_rate + self.error_rate:
+            self._count("errors")
+            return 500, {"error": {"message": "Server error", "type": "server_error"}}, {}
+
+        if path.endswith("/embeddings"):
+            self._count("embeddings")
+            return 200, self._embeddings(body), headers
+        if path.endswith("/chat/completions"):
+            self._count("chat")
+            return 200, self._chat(body), headers
+        return 404, {"error": {"message": f"Unknown path {path}"}}, {}
+
+    def _count(self, name):
+        with self._lock:
+            self.stats[name] += 1
+
+    def _embeddings(self, body):
+        inputs = body["input"]
+        if isinstance(inputs, str):
+            inputs = [inputs]
+        as_base64 = body.get("encoding_format") == "base64"
+        data = []
+        for i, text in enumerate(inputs):
+            vector = fake_embedding(text, self.dim)
+            embedding = base64.b64encode(vector.tobytes()).decode("ascii") if as_base64 else vector.tolist()
+            data.append({"object": "embedding", "index": i, "embedding": embedding})
+        tokens = sum(len(text) // 4 + 1 for text in inputs)
+        return {"object": "list", "data": data, "model": body.get("model"),
+                "usage": {"prompt_tokens": tokens, "total_tokens": tokens}}
+
+    def _chat(self, body):
+        prompt = "\n".join(m.get("content") or "" for m in body.get("messages", []))
+        text = fake_completion(prompt, self.completion_words)
+        prompt_tokens = len(prompt) // 4 + 1
+        completion_tokens = self.completion_words
+        return {
+            "id": "chatcmpl-fake",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model"),
+            "choices": [{"index": 0, "finish_reason": "stop",
+                         "message": {"role": "assistant", "content": text}}],
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                      "total_tokens": prompt_tokens + completion_tokens},
+        }
+
+def install(client):
+    """Make ``client`` the pipeline's shared OpenAI client"""
+    from tools import clients
+    clients.set_client(client)
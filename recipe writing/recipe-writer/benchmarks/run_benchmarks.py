@@ -0,0 +1,532 @@
+#!/usr/bin/env python3
+"""
+Offline benchmarks of the recipe pipeline against a local fake OpenAI server.
+
+Generates synthetic corpora of each size and measures load_corpus
+(time and memory), build_faiss_index, search_recipes latency (unfiltered,
+category- and tag-filtered), search throughput of the single index
+against 1..N shard worker processes, end-to-end /recipe-query latency and
+throughput of full_api.py under concurrent load, and cold starts of
+full_api.py in a fresh process. No API keys or network access are needed;
+all data lives in a temporary directory.
+
+Results are written as JSON. With --baseline, metrics that got worse than
+--tolerance compared to an earlier results file are listed and the exit
+status is 1. It is also 1 when a cold start misses --startup-targets.
+
+Usage: python benchmarks/run_benchmarks.py [--sizes 1000,10000,100000]
+         [--suites load,build,search,shards,api,startup] [--api-size 10000] [--concurrency 1,8,32]
+         [--shards 1,2,4] [--shard-clients 8]
+         [--latency-ms 50] [--json-metadata] [--startup-targets health=1,query=3]
+         [--out results.json] [--baseline previous.json]
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import platform
+import re
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+import types
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+RECIPE_WRITER = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+REPO_ROOT = os.path.dirname(os.path.dirname(RECIPE_WRITER))
+sys.path.append(RECIPE_WRITER)
+
+SUITES = ("load", "build", "search", "shards", "api", "startup")
+
+def int_list(value):
+    return [int(v) for v in value.split(",") if v]
+
+def install_config(workdir, dim, hybrid=False, recipe_catalog=True):
+    """Stand-in ``config`` module pointing every data file into ``workdir``.
+
+    Must run before anything from ``tools`` is imported.
+    """
+    os.makedirs(workdir, exist_ok=True)
+    config = types.ModuleType("config")
+    config.OPENAI_API_KEY = "fake"
+    config.AIRTABLE_API_KEY = "fake"
+    config.AIRTABLE_BASE_ID = "fake"
+    config.AIRTABLE_TABLE_NAME = "Recipes"
+    config.EMBEDDING_MODEL = "text-embedding-3-small"
+    config.LLM_MODEL = "gpt-4-turbo"
+    config.TOP_K = 10
+    config.BATCH_SIZE = 100
+    config.RECIPES_JSON = os.path.join(workdir, "recipes.json")
+    config.EMBEDDINGS_JSON = os.path.join(workdir, "recipes_with_embeddings.json")
+    config.FAISS_INDEX_FILE = os.path.join(workdir, "recipes.index")
+    config.SNAPSHOT_DIR = os.path.join(workdir, "snapshots")
+    config.HYBRID_SEARCH = hybrid
+    config.RECIPE_CATALOG = recipe_catalog
+    # Every request should pay for its model calls
+    config.QUERY_CACHE_DIR = None
+    config.COMPLETION_CACHE = None
+    sys.modules["config"] = config
+    return config
+
+def write_config_file(config, workdir):
+    """Save the stand-in config as ``workdir/config.py`` for child processes"""
+    with open(os.path.join(workdir, "config.py"), "w") as f:
+        for name in dir(config):
+            if name.isupper():
+                f.write(f"{name} = {getattr(config, name)!r}\n")
+
+@contextlib.contextmanager
+def quiet():
+    """Silence the pipeline's progress prints while timing it"""
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        yield
+
+def rss_bytes():
+    """Resident set size of this process (0 where /proc is unavailable)"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        return 0
+
+def latency_stats(seconds, wall=None):
+    ms = np.asarray(seconds) * 1000
+    stats = {
+        "count": len(ms),
+        "mean_ms": float(ms.mean()),
+        "p50_ms": float(np.percentile(ms, 50)),
+        "p95_ms": float(np.percentile(ms, 95)),
+        "p99_ms": float(np.percentile(ms, 99)),
+        "max_ms": float(ms.max()),
+    }
+    if wall:
+        stats["qps"] = len(ms) / wall
+    return stats
+
+def bench_load():
+    """Time and memory of loading the corpus a server searches (needs the index built)"""
+    from tools import corpus as corpus_module
+
+    rss_before = rss_bytes()
+    start = time.perf_counter()
+    with quiet():
+        corpus = corpus_module.load_corpus()
+    seconds = time.perf_counter() - start
+    rss_delta = rss_bytes() - rss_before
+    del corpus
+
+    tracemalloc.start()
+    with quiet():
+        corpus = corpus_module.load_corpus()
+    heap_peak, heap_now = tracemalloc.get_traced_memory()[::-1]
+    tracemalloc.stop()
+    del corpus
+    return {"load_seconds": seconds, "rss_delta_bytes": rss_delta,
+            "python_heap_peak_bytes": heap_peak, "python_heap_resident_bytes": heap_now}
+
+def bench_build(index_type):
+    from tools import embeddings, vector_store
+
+    vectors, recipes = embeddings.load_embedding_store()
+    start = time.perf_counter()
+    with quiet():
+        vector_store.build_faiss_index(recipes, vectors, index_type=index_type)
+    seconds = time.perf_counter() - start
+    return {"index_type": index_type or vector_store.FAISS_INDEX_TYPE, "build_seconds": seconds,
+            "index_bytes": os.path.getsize(vector_store.FAISS_INDEX_FILE)}
+
+def bench_search(query_count):
+    from tools import corpus as corpus_module, retrieval
+    from benchmarks.synthetic_corpus import make_queries
+
+    with quiet():
+        corpus = corpus_module.load_corpus()
+    queries = make_queries(query_count)
+    # Embed up front so the timings below are retrieval only
+    retrieval.query_cache.clear()
+    start = time.perf_counter()
+    retrieval.embed_queries([query for query, _, _ in queries])
+    embed_seconds = time.perf_counter() - start
+
+    timings = {"unfiltered": [], "category": [], "tag": []}
+    for query, category, tags in queries:
+        kind = "category" if category else "tag" if tags else "unfiltered"
+        start = time.perf_counter()
+        retrieval.search_recipes(query, corpus.index, corpus.id_to_recipe,
+                                 category=category, tags=tags, facets=corpus.facets,
+                                 lexical=corpus.lexical)
+        timings[kind].append(time.perf_counter() - start)
+
+    results = {kind: latency_stats(t, sum(t)) for kind, t in timings.items() if t}
+    results["embed_queries_seconds"] = embed_seconds
+    return results
+
+def bench_shards(shard_counts, query_count, clients, workdir, k=10):
+    """Search throughput of the single index and of each shard count, from ``clients`` threads.
+
+    Queries are perturbed corpus vectors searched one per call, as a server
+    does; every result is compared with the single index's.
+    """
+    from tools import embeddings, shards, vector_store
+
+    # Shard workers import the config file written to the work directory
+    if workdir not in sys.path:
+        sys.path.append(workdir)
+    vectors, recipes = embeddings.load_embedding_store()
+    rng = np.random.default_rng(7)
+    rows = rng.integers(0, len(recipes), query_count)
+    queries = np.asarray(vectors[rows], dtype="float32")
+    queries += rng.normal(0, 0.01, queries.shape).astype("float32")
+    single = vector_store.load_faiss_index()
+    expected = single.search(queries, k)[1]
+
+    def run(index):
+        def search(i):
+            start = time.perf_counter()
+            ids = index.search(queries[i:i + 1], k)[1][0]
+            return time.perf_counter() - start, bool((ids == expected[i]).all())
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(clients) as pool:
+            timings = list(pool.map(search, range(query_count)))
+        stats = latency_stats([seconds for seconds, _ in timings], time.perf_counter() - start)
+        stats["exact_fraction"] = sum(exact for _, exact in timings) / query_count
+        return stats
+
+    results = {"single": run(single)}
+    for count in shard_counts:
+        with quiet():
+            shards.build_shards(recipes, vectors, count)
+        index = shards.load_sharded_index()
+        try:
+            stats = run(index)
+        finally:
+            index.close()
+        stats["speedup"] = stats["qps"] / results["single"]["qps"]
+        results[f"{count}_shards"] = stats
+    return results
+
+def start_api(client):
+    """Import full_api with the corpus loaded up front and serve it on a free port"""
+    from werkzeug.serving import WSGIRequestHandler, make_server
+    from benchmarks import fake_openai
+
+    os.environ.setdefault("CORPUS_PRELOAD", "sync")
+    os.environ.setdefault("SNAPSHOT_POLL_SECONDS", "0")
+    sys.path.insert(0, REPO_ROOT)
+    with quiet():
+        import full_api
+        full_api.start_corpus()
+    fake_openai.install(client)
+
+    class QuietHandler(WSGIRequestHandler):
+        def log_request(self, *args, **kwargs):
+            pass
+
+    server = make_server("127.0.0.1", 0, full_api.app, threaded=True, request_handler=QuietHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}"
+
+def bench_api(base_url, concurrency, request_count, offset=0):
+    import requests
+    from benchmarks.synthetic_corpus import make_queries
+
+    local = threading.local()
+    queries = make_queries(request_count, seed=1000 + offset)
+
+    def send(query):
+        if not hasattr(local, "session"):
+            local.session = requests.Session()
+        start = time.perf_counter()
+        resp = local.session.post(f"{base_url}/recipe-query", json={"query": query[0]}, timeout=300)
+        return time.perf_counter() - start, resp.status_code
+
+    start = time.perf_counter()
+    with quiet(), ThreadPoolExecutor(max_workers=concurrency) as pool:
+        outcomes = list(pool.map(send, queries))
+    wall = time.perf_counter() - start
+
+    ok = [seconds for seconds, status in outcomes if status == 200]
+    stats = latency_stats(ok) if ok else {"count": 0}
+    stats.update({"concurrency": concurrency, "requests": request_count,
+                  "errors": request_count - len(ok), "rps": len(ok) / wall})
+    return stats
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def child_env(workdir, openai_url):
+    """Environment of a full_api.py child using the benchmark config and fake API"""
+    env = dict(os.environ, PYTHONPATH=workdir, OPENAI_BASE_URL=openai_url, OPENAI_API_KEY="fake",
+               CORPUS_PRELOAD="background", SNAPSHOT_POLL_SECONDS="0")
+    env.pop("PYTHONSTARTUP", None)
+    return env
+
+def import_profile(env, top=8):
+    """Seconds to import full_api in a fresh interpreter and the slowest top-level packages"""
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", "import full_api"],
+                          cwd=REPO_ROOT, env=dict(env, CORPUS_PRELOAD="lazy", JOB_WORKERS="0"),
+                          capture_output=True, text=True, check=True)
+    packages, total = {}, 0
+    for line in proc.stderr.splitlines():
+        match = re.match(r"import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)", line)
+        if match is None:
+            continue
+        self_us, cumulative_us, indent, name = match.groups()
+        package = name.split(".")[0]
+        packages[package] = packages.get(package, 0) + int(self_us)
+        if name == "full_api":
+            total = int(cumulative_us)
+    slowest = sorted(packages.items(), key=lambda item: -item[1])[:top]
+    return {"import_seconds": total / 1e6,
+            "slowest_packages_ms": {name: us / 1000 for name, us in slowest}}
+
+def bench_startup(env, runs):
+    """Cold starts of ``python full_api.py``, timed from spawning the process.
+
+    ``health_seconds`` is the first 200 from /health; ``query_seconds`` is
+    the first answered /recipe-query, sent as soon as /health responds (so
+    it includes waiting for the corpus). Medians over ``runs`` starts.
+    """
+    import requests
+
+    health, query, marks = [], [], []
+    for _ in range(runs):
+        port = free_port()
+        base_url = f"http://127.0.0.1:{port}"
+        start = time.perf_counter()
+        proc = subprocess.Popen([sys.executable, "full_api.py"], cwd=REPO_ROOT,
+                                env=dict(env, PORT=str(port)),
+                                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            while True:
+                if proc.poll() is not None:
+                    raise RuntimeError(f"full_api.py exited with status {proc.returncode}")
+                try:
+                    if requests.get(f"{base_url}/health", timeout=1).status_code == 200:
+                        break
+                except requests.ConnectionError:
+                    pass
+                if time.perf_counter() - start > 120:
+                    raise RuntimeError("full_api.py did not answer /health within 120s")
+                time.sleep(0.005)
+            health.append(time.perf_counter() - start)
+
+            resp = requests.post(f"{base_url}/recipe-query", json={"query": "5 summer grilling recipes"},
+                                 timeout=300)
+            resp.raise_for_status()
+            query.append(time.perf_counter() - start)
+            marks.append(requests.get(f"{base_url}/health", timeout=5).json().get("startup", {}))
+        finally:
+            proc.terminate()
+            proc.wait()
+
+    events = {event for m in marks for event in m}
+    return {
+        "runs": runs,
+        "health_seconds": statistics.median(health),
+        "query_seconds": statistics.median(query),
+        "server_marks_seconds": {event: statistics.median(m[event] for m in marks if event in m)
+                                 for event in sorted(events)},
+    }
+
+def parse_targets(value):
+    """``"health=1,query=3"`` -> {"health_seconds": 1.0, "query_seconds": 3.0}"""
+    targets = {}
+    for item in value.split(","):
+        if item:
+            name, seconds = item.split("=")
+            targets[f"{name.strip()}_seconds"] = float(seconds)
+    return targets
+
+def flatten(results, prefix=""):
+    """Numeric leaves as {"path.to.metric": value}; lists are keyed by rows/concurrency"""
+    flat = {}
+    if isinstance(results, dict):
+        for key, value in results.items():
+            flat.update(flatten(value, f"{prefix}{key}."))
+    elif isinstance(results, list):
+        for item in results:
+            key = item.get("rows") if "rows" in item and "concurrency" not in item else item.get("concurrency")
+            flat.update(flatten(item, f"{prefix}{key}."))
+    elif isinstance(results, (int, float)) and not isinstance(results, bool):
+        flat[prefix[:-1]] = results
+    return flat
+
+def regressions(results, baseline, tolerance):
+    """Metrics at least ``tolerance`` (a fraction) worse than in ``baseline``"""
+    current = flatten({"sizes": results["sizes"], "api": results["api"],
+                       "startup": results.get("startup", {})})
+    previous = flatten({"sizes": baseline.get("sizes", []), "api": baseline.get("api", []),
+                        "startup": baseline.get("startup", {})})
+    worse = []
+    for name, value in sorted(current.items()):
+        old = previous.get(name)
+        if not old:
+            continue
+        if name.endswith(("_ms", "_seconds", "_bytes")):
+            change = value / old - 1
+        elif name.endswith(("qps", "rps")):
+            change = old / value - 1 if value else float("inf")
+        else:
+            continue
+        if change > tolerance:
+            worse.append((name, old, value, change))
+    return worse
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=RECIPE_WRITER, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline pipeline benchmarks")
+    parser.add_argument("--sizes", type=int_list, default=[1000, 10000, 100000],
+                        help="Corpus sizes for the load/build/search suites (up to 1000000)")
+    parser.add_argument("--suites", default=",".join(SUITES))
+    parser.add_argument("--dim", type=int, default=256, help="Embedding dimension")
+    parser.add_argument("--index-type", default=None, help="FAISS index type (default: FAISS_INDEX_TYPE)")
+    parser.add_argument("--hybrid", action="store_true", help="Benchmark hybrid lexical + dense search")
+    parser.add_argument("--json-metadata", action="store_true",
+                        help="Keep recipe metadata in JSON loaded into memory instead of the SQLite catalog")
+    parser.add_argument("--queries", type=int, default=300, help="Search queries per corpus size")
+    parser.add_argument("--shards", type=int_list, default=[1, 2, 4],
+                        help="Shard counts compared with the single index by the shards suite")
+    parser.add_argument("--shard-clients", type=int, default=8,
+                        help="Threads issuing searches in the shards suite")
+    parser.add_argument("--api-size", type=int, default=10000, help="Corpus size behind the API suite")
+    parser.add_argument("--concurrency", type=int_list, default=[1, 8, 32])
+    parser.add_argument("--requests", type=int, default=100, help="Requests per concurrency level")
+    parser.add_argument("--latency-ms", type=float, default=50, help="Fake API latency per call")
+    parser.add_argument("--jitter-ms", type=float, default=20)
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="Fraction of fake calls answered 429")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of fake calls answered 500")
+    parser.add_argument("--startup-runs", type=int, default=5, help="Cold starts measured by the startup suite")
+    parser.add_argument("--startup-targets", type=parse_targets, default="health=1,query=3",
+                        help="Cold-start targets in seconds from process spawn")
+    parser.add_argument("--workdir", help="Directory for generated data (default: a temporary one)")
+    parser.add_argument("--out", default=os.path.join(RECIPE_WRITER, "benchmarks", "results",
+                                                      time.strftime("%Y%m%dT%H%M%S") + ".json"))
+    parser.add_argument("--baseline", help="Earlier results file to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed slowdown before a metric is flagged")
+    args = parser.parse_args()
+    suites = set(args.suites.split(","))
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix="recipe-bench-")
+    os.makedirs(workdir, exist_ok=True)
+    config = install_config(workdir, args.dim, args.hybrid, not args.json_metadata)
+    write_config_file(config, workdir)
+
+    from benchmarks import fake_openai
+    from benchmarks.synthetic_corpus import write_corpus
+
+    server = fake_openai.FakeOpenAIServer(
+        dim=args.dim, latency=args.latency_ms / 1000, jitter=args.jitter_ms / 1000,
+        rate_limit_rate=args.rate_limit_rate, error_rate=args.error_rate,
+    ).start()
+    client = server.client()
+    fake_openai.install(client)
+
+    results = {
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "settings": vars(args),
+        "sizes": [],
+        "api": [],
+    }
+
+    for size in args.sizes if suites & {"load", "build", "search", "shards"} else []:
+        print(f"\n== {size} recipes ==")
+        entry = {"rows": size, "dim": args.dim}
+        start = time.perf_counter()
+        write_corpus(size, args.dim)
+        entry["generate_seconds"] = time.perf_counter() - start
+
+        entry["build_faiss_index"] = bench_build(args.index_type)
+        print(f"build_faiss_index: {entry['build_faiss_index']['build_seconds']:.3f}s")
+        if "load" in suites:
+            entry["load_corpus"] = bench_load()
+            print(f"load_corpus: {entry['load_corpus']['load_seconds']:.3f}s, "
+                  f"heap {entry['load_corpus']['python_heap_resident_bytes'] / 2**20:.1f} MiB")
+        if "search" in suites:
+            entry["search_recipes"] = bench_search(args.queries)
+            for kind in ("unfiltered", "category", "tag"):
+                s = entry["search_recipes"][kind]
+                print(f"search_recipes {kind:<10}: p50 {s['p50_ms']:.2f}ms  p95 {s['p95_ms']:.2f}ms")
+        if "shards" in suites:
+            entry["sharded_search"] = bench_shards(args.shards, args.queries, args.shard_clients, workdir)
+            for name, s in entry["sharded_search"].items():
+                print(f"search {name:<9}: {s['qps']:.0f} q/s  p50 {s['p50_ms']:.2f}ms  "
+                      f"speedup {s.get('speedup', 1):.2f}x  exact {s['exact_fraction']:.0%}")
+        results["sizes"].append(entry)
+
+    if suites & {"api", "startup"}:
+        write_corpus(args.api_size, args.dim)
+        bench_build(args.index_type)
+
+    missed = []
+    if "startup" in suites:
+        print(f"\n== full_api.py cold start on {args.api_size} recipes ==")
+        env = child_env(workdir, server.url)
+        startup = import_profile(env)
+        startup.update(bench_startup(env, args.startup_runs))
+        startup["targets"] = args.startup_targets
+        results["startup"] = startup
+        slowest = ", ".join(f"{name} {ms:.0f}ms" for name, ms in startup["slowest_packages_ms"].items())
+        print(f"import full_api: {startup['import_seconds']:.3f}s ({slowest})")
+        for name, target in args.startup_targets.items():
+            ok = startup[name] <= target
+            print(f"{name}: {startup[name]:.3f}s (target {target:g}s) {'ok' if ok else 'MISSED'}")
+            if not ok:
+                missed.append(name)
+
+    if "api" in suites:
+        print(f"\n== /recipe-query on {args.api_size} recipes ==")
+        api_server, base_url = start_api(client)
+        try:
+            for i, concurrency in enumerate(args.concurrency):
+                stats = bench_api(base_url, concurrency, args.requests, offset=i)
+                stats["rows"] = args.api_size
+                results["api"].append(stats)
+                print(f"concurrency {concurrency:>3}: {stats['rps']:.1f} req/s, "
+                      f"p50 {stats.get('p50_ms', 0):.0f}ms, p95 {stats.get('p95_ms', 0):.0f}ms, "
+                      f"{stats['errors']} errors")
+        finally:
+            api_server.shutdown()
+
+    server.stop()
+    results["fake_openai"] = server.stats
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+    with open(args.out, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"\nResults written to {args.out}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            worse = regressions(results, json.load(f), args.tolerance)
+        for name, old, new, change in worse:
+            print(f"REGRESSION {name}: {old:.4g} -> {new:.4g} (+{change:.0%})")
+        if worse:
+            sys.exit(1)
+        print("No regressions against the baseline")
+    if missed:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""
+Synthetic recipe corpus for benchmarks, from a thousand to millions of rows.
+
+Recipes are assembled from word lists. Their vectors are drawn around a
+fixed set of cluster centres, so nearest-neighbour structure looks more
+like real embeddings than uniform noise. Everything is written in chunks
+straight to the binary embedding store and the recipe catalog (or JSON
+metadata), so memory stays flat while the corpus is generated.
+"""
+
+import json
+import os
+import random
+
+import numpy as np
+
+from tools import catalog, embeddings
+
+ADJECTIVES = ["Crispy", "Smoky", "Creamy", "Spicy", "Zesty", "Rustic", "Golden", "Herbed",
+              "Garlicky", "Sticky", "Charred", "Lemony", "Hearty", "Light", "Slow-Cooked"]
+PROTEINS = ["Chicken", "Salmon", "Shrimp", "Tofu", "Beef", "Pork", "Lamb", "Chickpea",
+            "Mushroom", "Cod", "Turkey", "Lentil", "Halloumi", "Eggplant", "Tuna"]
+DISHES = ["Tacos", "Curry", "Pasta", "Salad", "Stir-Fry", "Skewers", "Soup", "Bowl",
+          "Casserole", "Burgers", "Risotto", "Flatbread", "Stew", "Noodles", "Sandwich"]
+CUISINES = ["Italian", "Mexican", "Chinese", "Indian", "French", "Thai", "Japanese",
+            "Mediterranean", "American", "Spanish"]
+COURSES = ["Main Dish", "Side Dish", "Appetizer", "Dessert", "Breakfast", "Soup"]
+SEASONS = ["Summer", "Winter", "Spring", "Fall"]
+TAGS = ["grill", "seafood", "healthy", "pasta", "bbq", "vegan", "vegetarian", "gluten-free",
+        "quick", "weeknight", "one-pot", "spicy", "kid-friendly", "make-ahead", "low-carb",
+        "dairy-free", "comfort-food", "holiday", "picnic", "meal-prep"]
+
+def make_recipe(i, rng):
+    title = f"{rng.choice(ADJECTIVES)} {rng.choice(PROTEINS)} {rng.choice(DISHES)}"
+    cuisine = rng.choice(CUISINES)
+    return {
+        "id": f"rec{i:010d}",
+        "title": f"{title} #{i}",
+        "description": f"A {cuisine.lower()} {title.lower()} with {rng.choice(ADJECTIVES).lower()} "
+                       f"{rng.choice(PROTEINS).lower()}, ready in {rng.randint(10, 120)} minutes.",
+        "category": f"{rng.choice(SEASONS)}, {cuisine}, {rng.choice(COURSES)}",
+        "tags": rng.sample(TAGS, rng.randint(2, 4)),
+        "url": f"https://example.com/recipes/{i}",
+        "image_url": f"https://example.com/images/{i}.jpg",
+    }
+
+def write_corpus(n, dim, matrix_path=embeddings.EMBEDDINGS_MATRIX,
+                 meta_path=embeddings.EMBEDDINGS_META, seed=0, chunk=50_000,
+                 catalog_path=catalog.CATALOG_PATH):
+    """Write ``n`` synthetic recipes and ``dim``-dimensional vectors to the embedding store.
+
+    Metadata goes to the catalog when ``RECIPE_CATALOG`` is on, one bulk
+    upsert per chunk, else to the JSON file.
+    """
+    os.makedirs(os.path.dirname(os.path.abspath(matrix_path)), exist_ok=True)
+    matrix = np.lib.format.open_memmap(f"{matrix_path}.tmp", mode="w+", dtype="float32", shape=(n, dim))
+    chunks = _generate(n, dim, matrix, seed, chunk)
+
+    if catalog.RECIPE_CATALOG:
+        meta, stale = catalog_path, meta_path
+        if os.path.exists(f"{meta}.tmp"):
+            os.remove(f"{meta}.tmp")
+        store = catalog.RecipeCatalog(f"{meta}.tmp")
+        for start, recipes in chunks:
+            store.upsert(recipes, rows=range(start, start + len(recipes)))
+        store.close()
+    else:
+        meta, stale = meta_path, catalog_path
+        with open(f"{meta}.tmp", "w") as f:
+            f.write("[")
+            for start, recipes in chunks:
+                for j, r in enumerate(recipes):
+                    f.write("," if start or j else "")
+                    json.dump(r, f, separators=(",", ":"))
+            f.write("]")
+    matrix.flush()
+    del matrix
+    os.replace(f"{matrix_path}.tmp", matrix_path)
+    os.replace(f"{meta}.tmp", meta)
+    if os.path.exists(stale):
+        os.remove(stale)
+
+def _generate(n, dim, matrix, seed, chunk):
+    """Fill ``matrix`` chunk by chunk, yielding (start, recipes) for each chunk"""
+    rng = random.Random(seed)
+    vector_rng = np.random.default_rng(seed)
+    centres = vector_rng.standard_normal((min(1024, max(16, n // 500)), dim)).astype("float32")
+    for start in range(0, n, chunk):
+        stop = min(n, start + chunk)
+        rows = centres[vector_rng.integers(len(centres), size=stop - start)]
+        rows = rows + 0.35 * vector_rng.standard_normal(rows.shape).astype("float32")
+        matrix[start:stop] = rows / np.linalg.norm(rows, axis=1, keepdims=True)
+
+        recipes = [make_recipe(i, rng) for i in range(start, stop)]
+        for r in recipes:
+            r["content_hash"] = embeddings.content_hash(r)
+        embeddings.assign_ids(recipes)
+        yield start, recipes
+
+def make_queries(count, seed=1):
+    """(query, category, tags) tuples; about a third filtered by category, a third by tag"""
+    rng = random.Random(seed)
+    queries = []
+    for i in range(count):
+        query = f"{rng.randint(3, 12)} {rng.choice(ADJECTIVES).lower()} {rng.choice(PROTEINS).lower()} " \
+                f"{rng.choice(DISHES).lower()} ideas #{i}"
+        if i % 3 == 1:
+            queries.append((query, rng.choice(CUISINES), None))
+        elif i % 3 == 2:
+            queries.append((query, None, [rng.choice(TAGS)]))
+        else:
+            queries.append((query, None, None))
+    return queries
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+Benchmark approximate FAISS index types against the exact flat index.
+Reports recall@k, single-query QPS, build time and serialized index size.
+Usage: python scripts/benchmark_index.py [--types flat,ivf_flat,ivf_pq,hnsw]
+         [--nprobe 1,8,32] [--ef-search 16,64,128] [--queries 500] [--k 10] [--json out.json]
+"""
+
+import argparse
+import json
+import sys
+import os
+import time
+
+import faiss
+import numpy as np
+
+# Add parent directory to path to import tools
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tools import embeddings, vector_store
+from config import *
+
+def int_list(value):
+    return [int(v) for v in value.split(",") if v]
+
+def sample_queries(vectors, count, seed=0):
+    """Corpus rows with a little noise, so queries are realistic but not exact hits"""
+    rng = np.random.default_rng(seed)
+    rows = rng.choice(vectors.shape[0], size=min(count, vectors.shape[0]), replace=False)
+    queries = np.asarray(vectors[np.sort(rows)], dtype="float32")
+    scale = 0.05 * float(np.linalg.norm(queries, axis=1).mean()) / np.sqrt(queries.shape[1])
+    return queries + rng.normal(0, scale, size=queries.shape).astype("float32")
+
+def measure(index, queries, k, truth):
+    start = time.perf_counter()
+    found = np.vstack([index.search(queries[i:i + 1], k)[1] for i in range(len(queries))])
+    elapsed = time.perf_counter() - start
+    recall = np.mean([len(np.intersect1d(f, t)) / k for f, t in zip(found, truth)])
+    return float(recall), len(queries) / elapsed
+
+def configurations(types, nprobes, ef_searches):
+    for index_type in types:
+        if index_type in ("ivf_flat", "ivf_pq"):
+            for nprobe in nprobes:
+                yield index_type, {"nprobe": nprobe}
+        elif index_type == "hnsw":
+            for ef in ef_searches:
+                yield index_type, {"efSearch": ef}
+        else:
+            yield index_type, {}
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark FAISS index types")
+    parser.add_argument("--types", default=",".join(vector_store.INDEX_TYPES))
+    parser.add_argument("--nprobe", type=int_list, default=[1, 8, 32])
+    parser.add_argument("--ef-search", type=int_list, default=[16, 64, 128])
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--k", type=int, default=TOP_K)
+    parser.add_argument("--json", help="Also write results to this file")
+    args = parser.parse_args()
+
+    print("Loading embeddings...")
+    vectors, recipes = embeddings.load_embedding_store()
+    ids = np.arange(len(recipes), dtype="int64")
+    queries = sample_queries(vectors, args.queries)
+    print(f"{len(recipes)} vectors, {len(queries)} queries, k={args.k}")
+
+    exact, _ = vector_store.create_index(vectors, ids, "flat")
+    truth = exact.search(queries, args.k)[1]
+
+    results = []
+    built = {}
+    for index_type, search_params in configurations(args.types.split(","), args.nprobe, args.ef_search):
+        if index_type not in built:
+            start = time.perf_counter()
+            try:
+                index, params = vector_store.create_index(vectors, ids, index_type)
+            except ValueError as e:
+                print(f"Skipping {index_type}: {e}")
+                built[index_type] = None
+                continue
+            build_seconds = time.perf_counter() - start
+            size = faiss.serialize_index(index).nbytes
+            built[index_type] = (index, params, build_seconds, size)
+        if built[index_type] is None:
+            continue
+
+        index, params, build_seconds, size = built[index_type]
+        vector_store.set_search_params(index, search_params)
+        recall, qps = measure(index, queries, args.k, truth)
+        results.append({
+            "type": index_type,
+            "params": {**params, **search_params},
+            f"recall@{args.k}": recall,
+            "qps": qps,
+            "build_seconds": build_seconds,
+            "size_bytes": size,
+        })
+
+    print(f"\n{'type':<10} {'params':<44} {'recall':>8} {'qps':>10} {'build s':>8} {'size MB':>8}")
+    for r in results:
+        params = ", ".join(f"{k}={v}" for k, v in r["params"].items())
+        print(f"{r['type']:<10} {params:<44} {r[f'recall@{args.k}']:>8.3f} {r['qps']:>10.0f} "
+              f"{r['build_seconds']:>8.2f} {r['size_bytes'] / 1e6:>8.1f}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"vectors": len(recipes), "queries": len(queries), "k": args.k,
+                       "results": results}, f, indent=2)
+        print(f"\nResults written to {args.json}")
+
+if __name__ == "__main__":
+    main()
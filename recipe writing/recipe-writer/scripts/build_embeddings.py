@@ -15,18 +15,27 @@ from config import *
 
 def main():
     print("Fetching latest recipes from Airtable...")
-    recipes = airtable_sync.fetch_airtable_records()
+    airtable_sync.fetch_airtable_records()
+    recipes = airtable_sync.load_records()
     
     print(f"Found {len(recipes)} recipes")
     print("Generating embeddings...")
     
+    # Reuse vectors from the last run for unchanged recipes
+    try:
+        previous = embeddings.load_embeddings()
+    except (OSError, ValueError):
+        previous = None
+    
     # Generate embeddings
-    recipes_with_embeddings = embeddings.generate_embeddings(recipes)
+    recipes_with_embeddings = embeddings.generate_embeddings(recipes, previous)
     
     # Save embeddings
-    embeddings.save_embeddings(recipes_with_embeddings)
+    embeddings.save_embeddings(recipes_with_embeddings,
+                               source_catalog=airtable_sync.AIRTABLE_CATALOG)
+    embeddings.clear_checkpoint()
     
-    print(f"Embeddings saved to {EMBEDDINGS_JSON}")
+    print(f"Embeddings saved to {embeddings.EMBEDDINGS_MATRIX}")
 
 if __name__ == "__main__":
     main()
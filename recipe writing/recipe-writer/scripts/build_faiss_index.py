@@ -1,28 +1,42 @@
 #!/usr/bin/env python3
 """
 Script to build FAISS index from recipes with embeddings.
-Usage: python scripts/build_faiss_index.py
+Usage: python scripts/build_faiss_index.py [--shards N]
+  --shards: Split the index into N shards searched by worker processes (default: FAISS_SHARDS)
 """
 
-import json
 import sys
 import os
+import argparse
 
 # Add parent directory to path to import tools
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from tools import vector_store, embeddings
+from tools import vector_store, embeddings, shards
 from config import *
 
 def main():
+    parser = argparse.ArgumentParser(description='Build the FAISS index')
+    parser.add_argument('--shards', type=int, default=shards.FAISS_SHARDS,
+                        help='Number of index shards (0 or 1 builds a single index)')
+    args = parser.parse_args()
+
     print("Loading recipes with embeddings...")
-    recipes = embeddings.load_embeddings()
+    vectors, recipes = embeddings.load_embedding_store()
     
     print(f"Found {len(recipes)} recipes with embeddings")
+
+    if args.shards > 1:
+        print(f"Building FAISS index in {args.shards} shards...")
+        manifest = shards.build_shards(recipes, vectors, args.shards)
+        print(f"FAISS shards saved to {shards.shard_dir()}")
+        print(f"Shards contain {manifest['ntotal']} vectors ({', '.join(map(str, manifest['sizes']))})")
+        return
+
     print("Building FAISS index...")
     
-    # Build FAISS index
-    index = vector_store.build_faiss_index(recipes)
+    # Build FAISS index straight from the memory-mapped matrix
+    index = vector_store.build_faiss_index(recipes, vectors)
     
     print(f"FAISS index saved to {FAISS_INDEX_FILE}")
     print(f"Index contains {index.ntotal} vectors")
@@ -0,0 +1,39 @@
+#!/usr/bin/env python3
+"""
+Script to pre-write recipe sections for fast articles.
+Usage: python scripts/build_section_library.py [--cuisines italian,mexican]
+
+Sections already in the library for unchanged recipes are kept; only new
+or edited recipes are sent to the LLM. (scripts/sync_from_airtable.py
+does this for each snapshot when SECTION_LIBRARY is on.)
+"""
+
+import sys
+import os
+import argparse
+
+# Add parent directory to path to import tools
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tools import embeddings, section_library
+from config import *
+
+def main():
+    parser = argparse.ArgumentParser(description='Pre-write recipe sections for fast articles')
+    parser.add_argument('--cuisines', help='Comma-separated cuisines to write for every recipe '
+                                           '(default: SECTION_LIBRARY_CUISINES)')
+    args = parser.parse_args()
+    cuisines = args.cuisines.split(',') if args.cuisines else section_library.SECTION_LIBRARY_CUISINES
+
+    print("Loading recipes...")
+    _, recipes = embeddings.load_embedding_store()
+
+    print(f"Writing sections for {len(recipes)} recipes...")
+    path = section_library.SECTION_LIBRARY_PATH
+    stats = section_library.build_library(recipes, path, previous_path=path, cuisines=cuisines)
+
+    print(f"Reused {stats['reused']} and generated {stats['generated']} sections")
+    print(f"Section library saved to {path}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,29 @@
+#!/usr/bin/env python3
+"""
+One-shot conversion of recipes_with_embeddings.json to the binary embedding store.
+Usage: python scripts/convert_embeddings.py [path/to/recipes_with_embeddings.json]
+"""
+
+import sys
+import os
+
+# Add parent directory to path to import tools
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tools import catalog, embeddings
+from config import *
+
+def main():
+    path = sys.argv[1] if len(sys.argv) > 1 else EMBEDDINGS_JSON
+
+    print(f"Loading {path}...")
+    recipes = embeddings.load_embeddings_json(path)
+
+    print(f"Converting {len(recipes)} recipes...")
+    embeddings.save_embeddings(recipes)
+
+    print(f"Vectors saved to {embeddings.EMBEDDINGS_MATRIX}")
+    print(f"Metadata saved to {catalog.CATALOG_PATH if catalog.RECIPE_CATALOG else embeddings.EMBEDDINGS_META}")
+
+if __name__ == "__main__":
+    main()
@@ -13,7 +13,7 @@ import argparse
 # Add parent directory to path to import tools
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from tools import airtable_sync, embeddings, vector_store, retrieval, generator, html_formatter
+from tools import airtable_sync, corpus, retrieval, generator, html_formatter
 from config import *
 
 def main():
@@ -29,14 +29,9 @@ def main():
         print("Run: python scripts/build_embeddings.py && python scripts/build_faiss_index.py")
         return
 
-    # Load recipes with embeddings
-    print("Loading recipes with embeddings...")
-    recipes = embeddings.load_embeddings()
-
-    # Load FAISS index
-    print("Loading FAISS index...")
-    index = vector_store.load_faiss_index()
-    id_to_recipe = vector_store.get_id_to_recipe(recipes)
+    # Load recipes with embeddings and the FAISS index (latest snapshot if published)
+    loaded = corpus.load_corpus()
+    index, id_to_recipe = loaded.index, loaded.id_to_recipe
 
     # User query
     query = "12 italian dinners you don't wanna miss"
@@ -48,7 +43,8 @@ def main():
     k = int(numbers[0]) if numbers else 5
 
     # Retrieve recipes
-    top_recipes = retrieval.search_recipes(query, index, id_to_recipe, k=k)
+    top_recipes = retrieval.search_recipes(query, index, id_to_recipe, k=k, facets=loaded.facets,
+                                           lexical=loaded.lexical)
     
     print(f"Found {len(top_recipes)} matching recipes")
 
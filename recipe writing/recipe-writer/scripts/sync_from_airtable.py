@@ -1,36 +1,122 @@
 #!/usr/bin/env python3
 """
 Complete workflow script to sync from Airtable and rebuild everything.
-Usage: python scripts/sync_from_airtable.py
+Usage: python scripts/sync_from_airtable.py [--full] [--sweep]
+  --full: Download the whole table instead of only records changed since the last sync
+  --sweep: Check for deleted records now instead of every AIRTABLE_SWEEP_SECONDS
 """
 
 import sys
 import os
+import argparse
 
 # Add parent directory to path to import tools
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from tools import airtable_sync, embeddings, vector_store
+from tools import airtable_sync, embeddings, section_library, shards, snapshots, vector_store
 from config import *
 
+def load_previous():
+    """Recipes and index from the last sync, or (None, None, None) on a first run.
+
+    Prefers the published snapshot and falls back to the unversioned files.
+    The third value is the path the index was loaded from. With sharding on
+    the index itself is not loaded (the shards are updated one at a time).
+    """
+    snapshot = snapshots.current_snapshot()
+    index_path = snapshot.index_path if snapshot is not None else FAISS_INDEX_FILE
+    try:
+        if snapshot is not None:
+            previous = embeddings.load_embeddings(snapshot.matrix_path, snapshot.meta_path,
+                                                  snapshot.catalog_path)
+        else:
+            previous = embeddings.load_embeddings()
+        if shards.FAISS_SHARDS > 1:
+            return previous, None, index_path
+        return previous, vector_store.load_faiss_index(index_path), index_path
+    except (OSError, RuntimeError, ValueError) as e:
+        print(f"No previous embeddings or index found ({e}), starting from scratch")
+        return None, None, None
+
 def main():
+    parser = argparse.ArgumentParser(description='Sync recipes from Airtable and publish a snapshot')
+    parser.add_argument('--full', action='store_true',
+                        help='Download the whole table instead of a delta')
+    parser.add_argument('--sweep', action='store_true', default=None,
+                        help='List every record id to find deleted records')
+    args = parser.parse_args()
+
     print("=== Airtable Sync Workflow ===")
     
+    previous, index, previous_index_path = load_previous()
+    current = snapshots.current_snapshot()
+    previous_sections = current.sections_path if current else section_library.SECTION_LIBRARY_PATH
+    
     # Step 1: Fetch latest recipes from Airtable
     print("\n1. Fetching latest recipes from Airtable...")
-    recipes = airtable_sync.fetch_airtable_records()
+    airtable_sync.fetch_airtable_records(full=args.full, sweep=args.sweep)
+    recipes = airtable_sync.load_records()
     
-    # Step 2: Generate embeddings
+    # Step 2: Generate embeddings for new or edited recipes only
     print("\n2. Generating embeddings...")
-    recipes_with_embeddings = embeddings.generate_embeddings(recipes)
-    embeddings.save_embeddings(recipes_with_embeddings)
+    recipes_with_embeddings = embeddings.generate_embeddings(recipes, previous)
     
-    # Step 3: Build FAISS index
-    print("\n3. Building FAISS index...")
-    index = vector_store.build_faiss_index(recipes_with_embeddings)
+    # Step 3: Write a new snapshot (embeddings, metadata, index, section
+    # library, manifest); it only becomes visible to servers once it is complete
+    print("\n3. Writing snapshot...")
+    with snapshots.SnapshotWriter() as writer:
+        snapshot = writer.snapshot
+        embeddings.save_embeddings(recipes_with_embeddings, snapshot.matrix_path,
+                                   snapshot.meta_path, snapshot.catalog_path,
+                                   source_catalog=airtable_sync.AIRTABLE_CATALOG)
+        embeddings.clear_checkpoint()
+        vectors, recipes_with_embeddings = embeddings.load_embedding_store(
+            snapshot.matrix_path, snapshot.meta_path, snapshot.catalog_path
+        )
+        if shards.FAISS_SHARDS > 1:
+            if previous is None:
+                manifest = shards.build_shards(recipes_with_embeddings, vectors,
+                                               path=snapshot.index_path)
+            else:
+                manifest, stats = shards.update_shards(
+                    previous, recipes_with_embeddings, vectors,
+                    path=snapshot.index_path, source_path=previous_index_path
+                )
+                print(f"Added {stats['added']} and removed {stats['removed']} vectors")
+                writer.manifest["changes"] = stats
+            vector_count = manifest["ntotal"]
+            index_meta = manifest
+        elif index is None:
+            index = vector_store.build_faiss_index(
+                recipes_with_embeddings, vectors, path=snapshot.index_path
+            )
+        else:
+            index, stats = vector_store.update_faiss_index(
+                index, previous, recipes_with_embeddings, vectors,
+                path=snapshot.index_path, source_path=previous_index_path
+            )
+            print(f"Added {stats['added']} and removed {stats['removed']} vectors")
+            writer.manifest["changes"] = stats
+        if index is not None:
+            vector_count = index.ntotal
+            index_meta = vector_store.load_index_meta(snapshot.index_path)
+        writer.manifest.update({
+            "recipes": len(recipes_with_embeddings),
+            "vectors": vector_count,
+            "index": index_meta,
+        })
+        if section_library.SECTION_LIBRARY:
+            # Reusable recipe sections for fast articles; only new or edited
+            # recipes cost LLM calls
+            print("Writing section library...")
+            stats = section_library.build_library(
+                recipes_with_embeddings, snapshot.sections_path, previous_sections
+            )
+            print(f"Reused {stats['reused']} and generated {stats['generated']} sections")
+            writer.manifest["sections"] = stats
     
-    print(f"\n✅ Complete! Index contains {index.ntotal} vectors")
-    print("You can now run queries with: python scripts/run_query.py")
+    print(f"\n✅ Complete! Published snapshot {writer.version}, index contains {vector_count} vectors")
+    print("Running servers pick it up automatically; queries: python scripts/run_query.py")
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,33 @@
+import os
+import sys
+import tempfile
+
+RECIPE_WRITER = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DATA_DIR = tempfile.mkdtemp(prefix="recipe-tests-")
+
+# Every data file points into a temporary directory. The config is written
+# as a file (like benchmarks/run_benchmarks.py does) so that child processes
+# such as shard workers import the same settings.
+CONFIG = {
+    "OPENAI_API_KEY": "test",
+    "AIRTABLE_API_KEY": "test",
+    "AIRTABLE_BASE_ID": "test",
+    "AIRTABLE_TABLE_NAME": "Recipes",
+    "EMBEDDING_MODEL": "text-embedding-3-small",
+    "LLM_MODEL": "gpt-4-turbo",
+    "TOP_K": 10,
+    "BATCH_SIZE": 100,
+    "RECIPES_JSON": os.path.join(DATA_DIR, "recipes.json"),
+    "EMBEDDINGS_JSON": os.path.join(DATA_DIR, "recipes_with_embeddings.json"),
+    "FAISS_INDEX_FILE": os.path.join(DATA_DIR, "recipes.index"),
+    "SNAPSHOT_DIR": os.path.join(DATA_DIR, "snapshots"),
+    "QUERY_CACHE_DIR": None,
+    "COMPLETION_CACHE": None,
+}
+
+with open(os.path.join(DATA_DIR, "config.py"), "w") as f:
+    for name, value in CONFIG.items():
+        f.write(f"{name} = {value!r}\n")
+
+sys.path[:0] = [DATA_DIR, RECIPE_WRITER]
+sys.modules.pop("config", None)
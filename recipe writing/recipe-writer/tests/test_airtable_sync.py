@@ -0,0 +1,133 @@
+import pytest
+
+from tools import airtable_sync, catalog, embeddings
+
+def airtable_record(record_id, title, tags=("easy",)):
+    return {"id": record_id, "fields": {"Title": title, "Description": f"About {title}",
+                                        "Category": "Dinner", "Tags": list(tags)}}
+
+class FakeAirtable:
+    """Pages of records for _iter_pages, remembering the params of each listing"""
+
+    def __init__(self, table, changed=None):
+        self.table = table
+        self.changed = changed
+        self.calls = []
+
+    def __call__(self, params=None):
+        params = params or {}
+        self.calls.append(params)
+        records = self.changed if "filterByFormula" in params else self.table
+        for start in range(0, len(records), 2):
+            yield records[start:start + 2]
+
+@pytest.fixture
+def sync(monkeypatch, tmp_path):
+    checkpoints = []
+    monkeypatch.setattr(airtable_sync, "load_checkpoint",
+                        lambda: checkpoints[-1] if checkpoints else None)
+    monkeypatch.setattr(airtable_sync, "save_checkpoint", checkpoints.append)
+    path = str(tmp_path / "recipes.sqlite3")
+
+    def run(airtable, full=False, sweep=None):
+        monkeypatch.setattr(airtable_sync, "_iter_pages", airtable)
+        airtable_sync.fetch_airtable_records(full=full, sweep=sweep, path=path)
+        return airtable_sync.load_records(path)
+    run.path = path
+    return run
+
+def by_record(recipes):
+    return {r["id"]: r for r in recipes}
+
+def test_first_sync_fills_the_catalog(sync):
+    table = [airtable_record(f"rec{i}", f"Dish {i}") for i in range(5)]
+    recipes = sync(FakeAirtable(table))
+
+    assert sorted(by_record(recipes)) == [f"rec{i}" for i in range(5)]
+    assert airtable_sync.load_records(sync.path) == recipes
+    dish = by_record(recipes)["rec3"]
+    assert dish["title"] == "Dish 3" and dish["tags"] == ["easy"]
+    assert dish["content_hash"] == embeddings.content_hash(dish)
+
+def test_delta_sync_upserts_changes_and_deletes_removed_records(sync):
+    table = [airtable_record(f"rec{i}", f"Dish {i}") for i in range(5)]
+    before = by_record(sync(FakeAirtable(table)))
+
+    table = [record for record in table if record["id"] != "rec1"]
+    changed = [airtable_record("rec2", "Dish 2, now spicy", tags=("spicy",)),
+               airtable_record("rec9", "New dish")]
+    airtable = FakeAirtable(table + [changed[1]], changed)
+    after = by_record(sync(airtable, sweep=True))
+
+    assert sorted(after) == ["rec0", "rec2", "rec3", "rec4", "rec9"]
+    assert after["rec2"]["title"] == "Dish 2, now spicy"
+    assert after["rec2"]["tags"] == ["spicy"]
+    assert after["rec2"]["content_hash"] != before["rec2"]["content_hash"]
+    # Records keep their faiss_id across syncs and edits
+    assert all(after[i]["faiss_id"] == before[i]["faiss_id"] for i in ("rec0", "rec2", "rec4"))
+    assert [call.get("fields[]") for call in airtable.calls] == ["Title", None]
+
+def test_record_created_during_a_delta_sync_is_kept(sync):
+    sync(FakeAirtable([airtable_record("rec0", "Dish 0")]))
+    created = airtable_record("rec1", "Brand new")
+    # The id listing ran before rec1 existed
+    recipes = sync(FakeAirtable([airtable_record("rec0", "Dish 0")], [created]), sweep=True)
+    assert sorted(by_record(recipes)) == ["rec0", "rec1"]
+
+def test_delta_sync_sweeps_for_deletions_only_when_due(sync, monkeypatch):
+    table = [airtable_record(f"rec{i}", f"Dish {i}") for i in range(3)]
+    sync(FakeAirtable(table))
+
+    # Right after a full sync no id listing is due: only the changes are fetched
+    airtable = FakeAirtable(table[1:], [airtable_record("rec2", "Dish 2, edited")])
+    recipes = by_record(sync(airtable))
+    assert all("filterByFormula" in call for call in airtable.calls)
+    assert sorted(recipes) == ["rec0", "rec1", "rec2"]
+
+    monkeypatch.setattr(airtable_sync, "AIRTABLE_SWEEP_SECONDS", 0)
+    airtable = FakeAirtable(table[1:], [])
+    assert sorted(by_record(sync(airtable))) == ["rec1", "rec2"]
+    assert airtable.calls[0] == {"fields[]": "Title"}
+
+def test_sync_returns_only_changed_ids(sync, monkeypatch):
+    monkeypatch.setattr(airtable_sync, "_iter_pages",
+                        FakeAirtable([airtable_record(f"rec{i}", f"Dish {i}") for i in range(4)]))
+    first = airtable_sync.fetch_airtable_records(path=sync.path)
+    assert len(first["changed"]) == 4 and first["total"] == 4
+    ids = by_record(airtable_sync.load_records(sync.path))
+
+    monkeypatch.setattr(airtable_sync, "_iter_pages",
+                        FakeAirtable([], [airtable_record("rec1", "Dish 1, edited")]))
+    result = airtable_sync.fetch_airtable_records(sweep=True, path=sync.path)
+    assert result["changed"] == [ids["rec1"]["faiss_id"]]
+    assert sorted(result["deleted"]) == sorted(ids[i]["faiss_id"] for i in ("rec0", "rec2", "rec3"))
+    assert result["total"] == 1
+
+def test_full_sync_removes_records_missing_from_the_table(sync):
+    sync(FakeAirtable([airtable_record(f"rec{i}", f"Dish {i}") for i in range(4)]))
+    recipes = sync(FakeAirtable([airtable_record("rec3", "Dish 3")]), full=True)
+    assert list(by_record(recipes)) == ["rec3"]
+
+def test_export_json_writes_the_synced_records(sync, tmp_path):
+    sync(FakeAirtable([airtable_record("rec0", "Dish 0")]))
+    path = str(tmp_path / "recipes.json")
+    assert airtable_sync.export_json(path, sync.path) == 1
+    with open(path) as f:
+        assert f.read().count('"id": "rec0"') == 1
+
+def test_saved_catalog_is_a_copy_of_the_synced_one(sync, tmp_path):
+    recipes = sync(FakeAirtable([airtable_record(f"rec{i}", f"Dish {i}") for i in range(5)]))
+    for row, recipe in enumerate(recipes):
+        recipe["embedding"] = [float(row), 1.0]
+    matrix_path, catalog_path = str(tmp_path / "m.npy"), str(tmp_path / "c.sqlite3")
+    embeddings.save_embeddings(recipes, matrix_path, str(tmp_path / "m.json"), catalog_path,
+                               source_catalog=sync.path)
+
+    loaded = embeddings.load_embeddings(matrix_path, str(tmp_path / "m.json"), catalog_path)
+    assert [r["faiss_id"] for r in loaded] == [r["faiss_id"] for r in recipes]
+    assert [r["embedding"][0] for r in loaded] == list(range(5))
+    assert loaded[2]["title"] == recipes[2]["title"]
+
+    with pytest.raises(ValueError):
+        catalog.copy_catalog(sync.path, str(tmp_path / "bad.sqlite3"),
+                             [r["faiss_id"] for r in recipes[:3]])
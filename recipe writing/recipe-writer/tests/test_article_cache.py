@@ -0,0 +1,116 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from tools.article_cache import AsyncSingleFlight, SingleFlight
+
+CALLERS = 8
+
+def run_threads(flight, key, fn, callers=CALLERS):
+    """Call ``flight.do(key, fn)`` from ``callers`` threads started together"""
+    start = threading.Barrier(callers)
+    outcomes = [None] * callers
+
+    def call(i):
+        start.wait()
+        try:
+            outcomes[i] = flight.do(key, fn)
+        except Exception as e:
+            outcomes[i] = e
+
+    threads = [threading.Thread(target=call, args=(i,)) for i in range(callers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(10)
+    return outcomes
+
+def test_concurrent_callers_share_one_call():
+    flight = SingleFlight()
+    calls = []
+
+    def compute():
+        calls.append(1)
+        time.sleep(0.2)
+        return "article"
+
+    outcomes = run_threads(flight, "key", compute)
+    assert len(calls) == 1
+    assert sorted(shared for _, shared in outcomes) == [False] + [True] * (CALLERS - 1)
+    assert all(result == "article" for result, _ in outcomes)
+    assert flight.coalesced == CALLERS - 1
+    assert flight.in_flight() == 0
+
+def test_waiters_get_the_leaders_exception():
+    flight = SingleFlight()
+    calls = []
+
+    def fail():
+        calls.append(1)
+        time.sleep(0.2)
+        raise RuntimeError("boom")
+
+    outcomes = run_threads(flight, "key", fail)
+    assert len(calls) == 1
+    assert all(isinstance(o, RuntimeError) for o in outcomes)
+    # Nothing is remembered: the next call runs again
+    assert flight.do("key", lambda: "retry") == ("retry", False)
+
+def test_different_keys_run_separately():
+    flight = SingleFlight()
+    gate = threading.Event()
+    results = {}
+
+    def call(key):
+        results[key] = flight.do(key, lambda: gate.wait(5) and key)
+
+    threads = [threading.Thread(target=call, args=(key,)) for key in ("a", "b")]
+    for thread in threads:
+        thread.start()
+    deadline = time.time() + 5
+    while flight.in_flight() < 2 and time.time() < deadline:
+        time.sleep(0.01)
+    assert flight.in_flight() == 2
+    gate.set()
+    for thread in threads:
+        thread.join(5)
+    assert results == {"a": ("a", False), "b": ("b", False)}
+
+def test_async_callers_share_one_call():
+    flight = AsyncSingleFlight()
+    calls = []
+
+    async def compute():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return "article"
+
+    async def run():
+        return await asyncio.gather(*(flight.do("key", compute) for _ in range(CALLERS)))
+
+    outcomes = asyncio.run(run())
+    assert len(calls) == 1
+    assert [shared for _, shared in outcomes] == [False] + [True] * (CALLERS - 1)
+    assert all(result == "article" for result, _ in outcomes)
+    assert flight.in_flight() == 0
+
+def test_async_cancelled_leader_still_serves_waiters():
+    flight = AsyncSingleFlight()
+
+    async def compute():
+        await asyncio.sleep(0.05)
+        return "article"
+
+    async def run():
+        leader = asyncio.create_task(flight.do("key", compute))
+        await asyncio.sleep(0)
+        waiter = asyncio.create_task(flight.do("key", compute))
+        await asyncio.sleep(0)
+        leader.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        return await waiter
+
+    assert asyncio.run(run()) == ("article", True)
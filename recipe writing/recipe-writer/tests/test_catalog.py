@@ -0,0 +1,73 @@
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from tools import catalog
+
+def make_recipes(n):
+    return [{"id": f"rec{i}", "faiss_id": i * 3, "title": f"Recipe {i}",
+             "category": "Soup" if i % 2 else "Salad", "tags": [f"t{i % 7}", "easy"],
+             "servings": i}
+            for i in range(n)]
+
+def test_get_many_spans_several_chunks(tmp_path):
+    path = str(tmp_path / "catalog.sqlite3")
+    recipes = make_recipes(1200)
+    catalog.write_catalog(recipes, path)
+
+    ids = [r["faiss_id"] for r in reversed(recipes)] + [1, 2, 10 ** 9]
+    assert len(ids) > 2 * catalog._CHUNK
+    reader = catalog.RecipeCatalog(path, readonly=True)
+    try:
+        found = reader.get_many(ids)
+    finally:
+        reader.close()
+
+    # Unknown ids are left out; everything else comes back whole
+    assert sorted(found) == [r["faiss_id"] for r in recipes]
+    for recipe in recipes:
+        assert found[recipe["faiss_id"]] == recipe
+
+def test_lazy_recipes_get_many_keeps_order(tmp_path):
+    path = str(tmp_path / "catalog.sqlite3")
+    recipes = make_recipes(1100)
+    catalog.write_catalog(recipes, path)
+    vectors = np.arange(len(recipes) * 4, dtype="float32").reshape(-1, 4)
+
+    lazy = catalog.LazyRecipes(catalog.RecipeCatalog(path, readonly=True), vectors)
+    ids = [r["faiss_id"] for r in recipes][::-1]
+    found = lazy.get_many(ids)
+
+    assert [r["faiss_id"] for r in found] == ids
+    row = len(recipes) - 1
+    assert found[0]["title"] == recipes[row]["title"]
+    assert found[0]["tags"] == recipes[row]["tags"]
+    np.testing.assert_array_equal(found[0]["embedding"], vectors[row])
+    np.testing.assert_array_equal(lazy.vectors_for(ids[:2]), vectors[[row, row - 1]])
+    assert 3 in lazy and 4 not in lazy
+    lazy.catalog.close()
+
+def test_readonly_catalog_path_with_uri_characters(tmp_path):
+    directory = tmp_path / "100% ?fresh #1"
+    directory.mkdir()
+    path = str(directory / "catalog.sqlite3")
+    recipes = make_recipes(5)
+    catalog.write_catalog(recipes, path)
+    assert catalog.read_catalog(path) == recipes
+
+def test_readonly_catalog_outlives_its_deleted_file(tmp_path):
+    directory = tmp_path / "snapshot"
+    directory.mkdir()
+    path = str(directory / "catalog.sqlite3")
+    recipes = make_recipes(20)
+    catalog.write_catalog(recipes, path)
+
+    reader = catalog.RecipeCatalog(path, readonly=True)
+    shutil.rmtree(directory)
+    # Every thread shares the connection opened before the snapshot was pruned
+    with ThreadPoolExecutor(4) as pool:
+        results = list(pool.map(lambda i: reader.get_many([i * 3]), range(20)))
+    assert [found[i * 3] for i, found in enumerate(results)] == recipes
+    assert len(reader) == 20
+    reader.close()
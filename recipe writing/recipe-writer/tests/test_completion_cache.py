@@ -0,0 +1,80 @@
+import asyncio
+import itertools
+
+import pytest
+
+from tools import completion_cache
+from tools.completion_cache import CompletionCache, FileBackend, MemoryBackend, SQLiteBackend
+
+@pytest.fixture(params=["memory", "sqlite", "files"])
+def backend(request, tmp_path):
+    if request.param == "memory":
+        return MemoryBackend()
+    if request.param == "sqlite":
+        return SQLiteBackend(str(tmp_path / "completions.sqlite3"))
+    return FileBackend(str(tmp_path / "completions"))
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1_000_000.0]
+    monkeypatch.setattr(completion_cache.time, "time", lambda: now[0])
+    return now
+
+def counter():
+    numbers = itertools.count(1)
+    return lambda: f"text {next(numbers)}"
+
+def test_single_variant_is_reused(backend):
+    cache = CompletionCache(backend, variants=1)
+    create = counter()
+    texts = [cache.get_or_create("m", "prompt", 0.7, create) for _ in range(3)]
+    assert texts == ["text 1", "text 1", "text 1"]
+    assert cache.stats()["hits"] == 2 and cache.stats()["misses"] == 1
+
+def test_variants_are_created_then_rotated(backend):
+    cache = CompletionCache(backend, variants=3)
+    create = counter()
+    texts = [cache.get_or_create("m", "prompt", 0.7, create) for _ in range(7)]
+    assert texts == ["text 1", "text 2", "text 3", "text 1", "text 2", "text 3", "text 1"]
+    # Model, prompt and temperature all address the entry
+    assert cache.get_or_create("m", "prompt", 0.2, create) == "text 4"
+    assert cache.get_or_create("other", "prompt", 0.7, create) == "text 5"
+
+def test_entries_expire_after_ttl(backend, clock):
+    cache = CompletionCache(backend, ttl=60)
+    create = counter()
+    assert cache.get_or_create("m", "prompt", 0.7, create) == "text 1"
+    clock[0] += 59
+    assert cache.get_or_create("m", "prompt", 0.7, create) == "text 1"
+    clock[0] += 2
+    assert cache.get_or_create("m", "prompt", 0.7, create) == "text 2"
+    clock[0] += 30
+    assert cache.get_or_create("m", "prompt", 0.7, create) == "text 2"
+
+def test_ttl_counts_from_the_first_variant(backend, clock):
+    cache = CompletionCache(backend, ttl=60, variants=2)
+    create = counter()
+    cache.get_or_create("m", "prompt", 0.7, create)
+    clock[0] += 50
+    assert cache.get_or_create("m", "prompt", 0.7, create) == "text 2"
+    clock[0] += 20
+    assert cache.get_or_create("m", "prompt", 0.7, create) == "text 3"
+
+def test_backend_is_trimmed_to_max_entries(backend):
+    cache = CompletionCache(backend, max_entries=2)
+    create = counter()
+    for prompt in ("a", "b", "c"):
+        cache.get_or_create("m", prompt, 0.7, create)
+    assert cache.stats()["entries"] == 2
+
+def test_async_lookup_rotates_variants(backend):
+    cache = CompletionCache(backend, variants=2)
+    create = counter()
+
+    async def acreate():
+        return create()
+
+    async def run():
+        return [await cache.aget_or_create("m", "prompt", 0.7, acreate) for _ in range(4)]
+
+    assert asyncio.run(run()) == ["text 1", "text 2", "text 1", "text 2"]
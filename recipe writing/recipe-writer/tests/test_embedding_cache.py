@@ -0,0 +1,61 @@
+import os
+import time
+
+import numpy as np
+
+from tools.embedding_cache import QueryEmbeddingCache
+
+
+def disk_files(directory):
+    return sorted(name for _, _, names in os.walk(directory) for name in names)
+
+
+def test_expired_disk_entry_is_not_promoted(tmp_path):
+    cache = QueryEmbeddingCache(ttl=60, directory=str(tmp_path))
+    cache.put("Spicy Ramen", np.ones(4))
+    path = cache._path(cache.key("spicy ramen"))
+    old = time.time() - 120
+    os.utime(path, (old, old))
+
+    fresh = QueryEmbeddingCache(ttl=60, directory=str(tmp_path))
+    assert fresh.get("spicy ramen") is None
+    assert not os.path.exists(path)
+    assert fresh.stats()["memory_entries"] == 0
+
+
+def test_disk_hit_keeps_its_age_in_memory(tmp_path):
+    cache = QueryEmbeddingCache(ttl=60, directory=str(tmp_path))
+    cache.put("pho", np.ones(4))
+    path = cache._path(cache.key("pho"))
+    old = time.time() - 50
+    os.utime(path, (old, old))
+
+    fresh = QueryEmbeddingCache(ttl=60, directory=str(tmp_path))
+    assert fresh.get("pho") is not None
+    _, stored_at = fresh._entries[fresh.key("pho")]
+    assert time.monotonic() - stored_at >= 50
+
+
+def test_directory_is_capped_oldest_first(tmp_path):
+    cache = QueryEmbeddingCache(ttl=3600, directory=str(tmp_path), disk_entries=10)
+    for i in range(25):
+        cache.put(f"query {i}", np.full(4, i))
+        path = cache._path(cache.key(f"query {i}"))
+        os.utime(path, (time.time() - 1000 + i, time.time() - 1000 + i))
+    assert len(disk_files(tmp_path)) <= 10 + 1
+
+    cache.prune()
+    assert len(disk_files(tmp_path)) == 10
+    fresh = QueryEmbeddingCache(ttl=3600, directory=str(tmp_path))
+    assert fresh.get("query 24") is not None
+    assert fresh.get("query 0") is None
+
+
+def test_prune_removes_expired_files(tmp_path):
+    cache = QueryEmbeddingCache(ttl=60, directory=str(tmp_path))
+    cache.put("old", np.ones(4))
+    cache.put("new", np.ones(4))
+    path = cache._path(cache.key("old"))
+    os.utime(path, (time.time() - 120, time.time() - 120))
+    assert cache.prune() == 1
+    assert disk_files(tmp_path) == [os.path.basename(cache._path(cache.key("new")))]
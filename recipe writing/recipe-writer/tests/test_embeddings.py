@@ -0,0 +1,75 @@
+import json
+
+import numpy as np
+import pytest
+
+from tools import embeddings
+
+def make_recipes(n):
+    return [{"id": f"rec{i}", "title": f"Recipe {i}", "description": f"Dish number {i}",
+             "tags": ["quick"]} for i in range(n)]
+
+def fake_vector(recipe):
+    seed = int(recipe["title"].split()[-1])
+    return np.random.default_rng(seed).standard_normal(4).astype("float32").tolist()
+
+@pytest.fixture
+def api(monkeypatch):
+    """Fake embedding API: two recipes per batch, optionally failing after some batches"""
+    state = {"embedded": [], "fail_after": None}
+
+    def embed_batch(batch, tokens, limiter):
+        if state["fail_after"] is not None and len(state["embedded"]) >= state["fail_after"]:
+            raise RuntimeError("API down")
+        state["embedded"].append([r["title"] for r in batch])
+        return [fake_vector(r) for r in batch]
+
+    pack_batches = embeddings.pack_batches
+    monkeypatch.setattr(embeddings, "_embed_batch", embed_batch)
+    monkeypatch.setattr(embeddings, "pack_batches", lambda recipes: pack_batches(recipes, max_inputs=2))
+    return state
+
+def test_interrupted_run_resumes_from_checkpoint(api, tmp_path):
+    checkpoint = str(tmp_path / "embeddings.checkpoint.jsonl")
+    api["fail_after"] = 2
+    with pytest.raises(RuntimeError):
+        embeddings.generate_embeddings(make_recipes(7), checkpoint_path=checkpoint, concurrency=1)
+    assert len(embeddings.load_checkpoint(checkpoint)) == 4
+
+    api["fail_after"] = None
+    api["embedded"].clear()
+    recipes = embeddings.generate_embeddings(make_recipes(7), checkpoint_path=checkpoint,
+                                             concurrency=1)
+    # Only the three recipes missing from the checkpoint reach the API
+    assert sorted(t for batch in api["embedded"] for t in batch) == ["Recipe 4", "Recipe 5", "Recipe 6"]
+    for r in recipes:
+        np.testing.assert_allclose(r["embedding"], fake_vector(r), rtol=1e-6)
+    assert len(embeddings.load_checkpoint(checkpoint)) == 7
+
+def test_edited_recipe_is_embedded_again(api, tmp_path):
+    checkpoint = str(tmp_path / "embeddings.checkpoint.jsonl")
+    embeddings.generate_embeddings(make_recipes(3), checkpoint_path=checkpoint, concurrency=1)
+    api["embedded"].clear()
+    recipes = make_recipes(3)
+    recipes[1]["description"] = "Now with more garlic"
+    embeddings.generate_embeddings(recipes, checkpoint_path=checkpoint, concurrency=1)
+    assert api["embedded"] == [["Recipe 1"]]
+
+def test_checkpoint_skips_torn_lines_and_other_models(api, tmp_path):
+    checkpoint = tmp_path / "embeddings.checkpoint.jsonl"
+    embeddings.generate_embeddings(make_recipes(2), checkpoint_path=str(checkpoint), concurrency=1)
+    entry = json.loads(checkpoint.read_text().splitlines()[0])
+    other = dict(entry, model="another-model", hashes=["x" * 64, "y" * 64])
+    with open(checkpoint, "a") as f:
+        f.write(json.dumps(other) + "\n")
+        f.write(json.dumps(entry)[:40])  # interrupted mid-write
+
+    known = embeddings.load_checkpoint(str(checkpoint))
+    assert sorted(known) == sorted(embeddings.content_hash(r) for r in make_recipes(2))
+
+def test_clear_checkpoint(api, tmp_path):
+    checkpoint = str(tmp_path / "embeddings.checkpoint.jsonl")
+    embeddings.generate_embeddings(make_recipes(2), checkpoint_path=checkpoint, concurrency=1)
+    embeddings.clear_checkpoint(checkpoint)
+    embeddings.clear_checkpoint(checkpoint)
+    assert embeddings.load_checkpoint(checkpoint) == {}
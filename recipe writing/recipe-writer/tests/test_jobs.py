@@ -0,0 +1,111 @@
+import time
+
+import pytest
+
+from tools import jobs
+
+@pytest.fixture
+def db_path(tmp_path):
+    return str(tmp_path / "jobs.sqlite3")
+
+def test_claim_expires_queued_job_past_deadline(db_path):
+    store = jobs.JobStore(db_path)
+    job_id = store.submit("late dinner", deadline_seconds=0.05)
+    time.sleep(0.1)
+
+    assert store.claim() is None
+    job = store.get(job_id)
+    assert job["status"] == jobs.EXPIRED
+    assert job["error"] == "Deadline exceeded"
+    assert job["attempts"] == 0
+
+def test_claim_expires_lapsed_running_job_past_deadline(db_path):
+    store = jobs.JobStore(db_path, lease_seconds=0.05)
+    job_id = store.submit("slow dinner", deadline_seconds=0.1)
+    assert store.claim()[0] == job_id
+    time.sleep(0.15)
+
+    # Both the lease and the deadline have passed: expired, not run again
+    assert jobs.JobStore(db_path).claim() is None
+    assert store.get(job_id)["status"] == jobs.EXPIRED
+
+def test_lapsed_lease_is_reclaimed_by_another_worker(db_path):
+    first = jobs.JobStore(db_path, lease_seconds=0.05)
+    second = jobs.JobStore(db_path, lease_seconds=60)
+    job_id = first.submit("pasta", {"k": 3})
+    assert first.claim()[0] == job_id
+    time.sleep(0.1)
+
+    claimed = second.claim()
+    assert claimed[:3] == (job_id, "pasta", {"k": 3})
+    assert second.get(job_id)["attempts"] == 2
+
+    # The first worker lost the job and can no longer write to it
+    with pytest.raises(jobs.LeaseLost):
+        first.add_section(job_id, 0, "intro", "<p>stale</p>")
+    second.add_section(job_id, 0, "intro", "<p>fresh</p>")
+    second.finish(job_id, "<p>fresh</p>")
+    job = second.get(job_id)
+    assert job["status"] == jobs.DONE
+    assert job["sections"] == [{"position": 0, "kind": "intro", "html": "<p>fresh</p>"}]
+
+def test_live_lease_is_not_reclaimed(db_path):
+    first = jobs.JobStore(db_path, lease_seconds=60)
+    first.submit("soup")
+    assert first.claim() is not None
+    assert jobs.JobStore(db_path).claim() is None
+
+def test_claim_order_follows_priority_then_age(db_path):
+    store = jobs.JobStore(db_path)
+    low = store.submit("a", priority="low")
+    normal = store.submit("b")
+    high = store.submit("c", priority="high")
+    assert [store.claim()[0] for _ in range(3)] == [high, normal, low]
+
+@pytest.mark.parametrize("deadline", ["abc", 0, -5, float("nan"), [1]])
+def test_submit_rejects_bad_deadlines(db_path, deadline):
+    with pytest.raises(ValueError):
+        jobs.JobStore(db_path).submit("x", deadline_seconds=deadline)
+
+def test_submit_parses_numeric_strings(db_path):
+    store = jobs.JobStore(db_path)
+    before = time.time()
+    job = store.get(store.submit("x", deadline_seconds="30"))
+    assert 29 < job["deadline"] - before < 31
+
+def test_heartbeat_keeps_a_slow_job_from_being_taken_over(db_path):
+    store = jobs.JobStore(db_path, lease_seconds=0.3)
+    job_id = store.submit("slow soup")
+    rival = jobs.JobStore(db_path)
+    stolen = []
+
+    def run_job(store, job_id, query, params, deadline):
+        # One call much longer than the lease
+        for _ in range(10):
+            time.sleep(0.1)
+            stolen.append(rival.claim())
+        store.finish(job_id, "<p>done</p>")
+
+    pool = jobs.JobWorkerPool(store, run_job, workers=1, poll_seconds=0.05)
+    pool.start()
+    try:
+        for _ in range(100):
+            if store.get(job_id)["status"] == jobs.DONE:
+                break
+            time.sleep(0.05)
+    finally:
+        pool.stop()
+
+    job = store.get(job_id)
+    assert job["status"] == jobs.DONE
+    assert job["attempts"] == 1
+    assert stolen == [None] * 10
+
+def test_heartbeat_reports_a_lost_lease(db_path):
+    first = jobs.JobStore(db_path, lease_seconds=0.05)
+    job_id = first.submit("pasta")
+    first.claim()
+    assert first.heartbeat(job_id)
+    time.sleep(0.1)
+    jobs.JobStore(db_path).claim()
+    assert not first.heartbeat(job_id)
@@ -0,0 +1,106 @@
+import numpy as np
+import pytest
+
+pytest.importorskip("faiss")
+
+from tools import retrieval, vector_store
+from tools.facets import FacetIndex, normalize_filters
+
+DIMENSION = 8
+CATEGORIES = ["Dessert", "Main Course", "Soup"]
+TAGS = ["vegan", "quick", "spicy", "gluten-free"]
+
+@pytest.fixture
+def corpus(monkeypatch):
+    rng = np.random.default_rng(1)
+    vectors = rng.standard_normal((120, DIMENSION)).astype("float32")
+    id_to_recipe = {
+        3 * i + 1: {
+            "faiss_id": 3 * i + 1, "title": f"Recipe {i}", "embedding": vectors[i],
+            "category": CATEGORIES[i % len(CATEGORIES)],
+            "tags": [TAGS[i % len(TAGS)], TAGS[(i // 2) % len(TAGS)]],
+        }
+        for i in range(len(vectors))
+    }
+    index, _ = vector_store.create_index(vectors, np.array(list(id_to_recipe)), "flat")
+    queries = {f"query {i}": rng.standard_normal(DIMENSION).astype("float32") for i in range(6)}
+    monkeypatch.setattr(retrieval, "embed_query", lambda q: queries[q].reshape(1, -1))
+    monkeypatch.setattr(retrieval, "embed_queries", lambda qs: np.vstack([queries[q] for q in qs]))
+    return index, id_to_recipe, FacetIndex(id_to_recipe)
+
+def titles(recipes):
+    return [r["title"] for r in recipes]
+
+def test_normalize_filters():
+    assert normalize_filters("Soup", "Vegan") == ("soup", ("vegan",))
+    assert normalize_filters(None, ["Quick", "vegan", "quick"]) == (None, ("quick", "vegan"))
+    assert normalize_filters("", None) == (None, ())
+    with pytest.raises(ValueError):
+        normalize_filters(["Soup"], None)
+    with pytest.raises(ValueError):
+        normalize_filters(None, {"tag": "vegan"})
+    with pytest.raises(ValueError):
+        normalize_filters(None, ["vegan", 3])
+
+def test_batch_treats_a_string_tag_as_one_tag(corpus):
+    index, id_to_recipe, facets = corpus
+    [batch] = retrieval.search_recipes_batch(
+        [{"query": "query 0", "k": 5, "tags": "vegan"}], index, id_to_recipe,
+        facets=facets, diversify=False)
+    assert batch and all("vegan" in r["tags"] for r in batch)
+    single = retrieval.search_recipes("query 0", index, id_to_recipe, tags=["vegan"], k=5,
+                                      facets=facets, diversify=False)
+    assert titles(batch) == titles(single)
+
+def test_batch_rejects_bad_filter_types(corpus):
+    index, id_to_recipe, facets = corpus
+    with pytest.raises(ValueError):
+        retrieval.search_recipes_batch([{"query": "query 0", "category": ["Soup"]}],
+                                       index, id_to_recipe, facets=facets, diversify=False)
+
+SEARCHES = [
+    {"query": "query 0", "k": 5},
+    {"query": "query 1", "k": 3, "category": "soup"},
+    {"query": "query 2", "k": 4, "tags": ["Vegan", "quick"]},
+    {"query": "query 3", "k": 6},
+    {"query": "query 4", "k": 2, "category": "Soup"},
+    {"query": "query 5", "k": 5, "category": "dessert", "tags": "spicy"},
+]
+
+def single(search, index, id_to_recipe, facets, **kwargs):
+    return retrieval.search_recipes(search["query"], index, id_to_recipe,
+                                    category=search.get("category"), tags=search.get("tags"),
+                                    k=search["k"], facets=facets, **kwargs)
+
+@pytest.mark.parametrize("diversify", [False, True])
+def test_batch_matches_single_searches(corpus, diversify):
+    index, id_to_recipe, facets = corpus
+    batch = retrieval.search_recipes_batch(SEARCHES, index, id_to_recipe, facets=facets,
+                                           diversify=diversify)
+    assert len(batch) == len(SEARCHES)
+    for search, recipes in zip(SEARCHES, batch):
+        assert titles(recipes) == titles(single(search, index, id_to_recipe, facets,
+                                                diversify=diversify))
+
+def test_batch_groups_searches_by_filter(corpus, monkeypatch):
+    index, id_to_recipe, facets = corpus
+    calls = []
+    dense_search = retrieval._dense_search
+
+    def spy(index, query_vectors, k, ids=None):
+        calls.append((len(query_vectors), None if ids is None else len(ids)))
+        return dense_search(index, query_vectors, k, ids)
+
+    monkeypatch.setattr(retrieval, "_dense_search", spy)
+    retrieval.search_recipes_batch(SEARCHES, index, id_to_recipe, facets=facets, diversify=False)
+    # Unfiltered, "soup" (either case), vegan/quick and dessert/spicy: four
+    # index searches, the unfiltered and soup ones covering two queries each
+    assert sorted(rows for rows, _ in calls) == [1, 1, 2, 2]
+    assert sum(1 for _, ids in calls if ids is None) == 1
+
+def test_batch_returns_empty_lists_for_unmatched_filters(corpus):
+    index, id_to_recipe, facets = corpus
+    results = retrieval.search_recipes_batch(
+        [{"query": "query 0", "k": 3, "category": "breakfast"}, {"query": "query 1", "k": 3}],
+        index, id_to_recipe, facets=facets, diversify=False)
+    assert results[0] == [] and len(results[1]) == 3
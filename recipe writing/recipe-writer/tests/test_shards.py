@@ -0,0 +1,97 @@
+import time
+
+import numpy as np
+import pytest
+
+pytest.importorskip("faiss")
+
+from tools import shards, vector_store
+
+DIMENSION = 16
+
+@pytest.fixture
+def corpus(tmp_path):
+    rng = np.random.default_rng(0)
+    vectors = rng.standard_normal((300, DIMENSION)).astype("float32")
+    # Non-contiguous ids, so shard assignment is not just row order
+    recipes = [{"faiss_id": 5 * i + 2, "title": f"Recipe {i}"} for i in range(len(vectors))]
+    path = str(tmp_path / "recipes.index")
+    shards.build_shards(recipes, vectors, shards=3, index_type="flat", path=path)
+    flat, _ = vector_store.create_index(vectors, vector_store._ids(recipes), "flat")
+    queries = rng.standard_normal((4, DIMENSION)).astype("float32")
+    return recipes, vectors, path, flat, queries
+
+@pytest.fixture
+def sharded(corpus):
+    index = shards.load_sharded_index(corpus[2])
+    yield index
+    index.close()
+
+def test_merge_results_matches_flat_search(corpus):
+    recipes, vectors, path, flat, queries = corpus
+    directory = shards.shard_dir(path)
+    results = [vector_store.load_faiss_index(shards.shard_path(directory, shard)).search(queries, 10)
+               for shard in range(3)]
+    distances, ids = shards.merge_results(results, 10)
+    expected_distances, expected_ids = flat.search(queries, 10)
+    np.testing.assert_array_equal(ids, expected_ids)
+    np.testing.assert_allclose(distances, expected_distances, rtol=1e-5)
+
+def test_merge_results_breaks_ties_by_id():
+    # Shard 0 holds the larger id at the same distance; the smaller id wins
+    results = [(np.array([[1.0, 2.0]], dtype="float32"), np.array([[9, 3]])),
+               (np.array([[1.0, 2.0]], dtype="float32"), np.array([[4, 8]]))]
+    distances, ids = shards.merge_results(results, 3)
+    assert ids.tolist() == [[4, 9, 3]]
+    assert distances.tolist() == [[1.0, 1.0, 2.0]]
+
+def test_merge_results_ties_match_flat_search():
+    vectors = np.repeat(np.eye(DIMENSION, dtype="float32")[:2], 6, axis=0)
+    recipes = [{"faiss_id": 10 + i} for i in range(len(vectors))]
+    flat, _ = vector_store.create_index(vectors, vector_store._ids(recipes), "flat")
+    query = np.eye(DIMENSION, dtype="float32")[:1]
+    # Interleave rows across three shards, so shard order is not id order
+    results = []
+    for shard in (2, 0, 1):
+        rows = list(range(shard, len(vectors), 3))
+        index, _ = vector_store.create_index(vectors[rows], vector_store._ids(recipes)[rows], "flat")
+        results.append(index.search(query, 8))
+    distances, ids = shards.merge_results(results, 8)
+    expected_distances, expected_ids = flat.search(query, 8)
+    np.testing.assert_array_equal(ids, expected_ids)
+    np.testing.assert_allclose(distances, expected_distances)
+
+def test_merge_results_pads_short_results():
+    results = [(np.array([[1.0]], dtype="float32"), np.array([[7]])),
+               (np.array([[0.5]], dtype="float32"), np.array([[4]]))]
+    distances, ids = shards.merge_results(results, 3)
+    assert ids.tolist() == [[4, 7, -1]]
+    assert distances[0, 2] == np.inf
+
+def test_sharded_search_matches_flat_search(corpus, sharded):
+    recipes, vectors, path, flat, queries = corpus
+    assert sharded.ntotal == len(recipes)
+
+    _, ids = sharded.search(queries, 10)
+    np.testing.assert_array_equal(ids, flat.search(queries, 10)[1])
+
+    subset = np.array([r["faiss_id"] for r in recipes[::7]])
+    _, ids = vector_store.search_subset(sharded, queries, 5, subset)
+    np.testing.assert_array_equal(ids, vector_store.search_subset(flat, queries, 5, subset)[1])
+
+def test_dead_worker_is_restarted(corpus, sharded):
+    recipes, vectors, path, flat, queries = corpus
+    expected = flat.search(queries, 10)[1]
+    np.testing.assert_array_equal(sharded.search(queries, 10)[1], expected)
+
+    victim = sharded._workers[1]
+    victim.process.kill()
+    victim.process.wait(timeout=10)
+    deadline = time.time() + 10
+    while victim.alive and time.time() < deadline:
+        time.sleep(0.01)
+    assert not victim.alive
+
+    np.testing.assert_array_equal(sharded.search(queries, 10)[1], expected)
+    assert sharded._workers[1] is not victim
+    assert all(worker.alive for worker in sharded._workers)
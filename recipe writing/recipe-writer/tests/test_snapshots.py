@@ -0,0 +1,44 @@
+import os
+import subprocess
+import sys
+
+from tools import snapshots
+
+def publish(root, count, keep):
+    versions = []
+    for _ in range(count):
+        with snapshots.SnapshotWriter(str(root), keep=keep) as writer:
+            with open(writer.snapshot.meta_path, "w") as f:
+                f.write("{}")
+        versions.append(writer.version)
+    return versions
+
+def published(root):
+    return sorted(name for name in os.listdir(root) if not name.startswith("."))
+
+def test_prune_keeps_the_newest_snapshots(tmp_path):
+    versions = publish(tmp_path, 4, keep=2)
+    assert published(tmp_path) == sorted(versions[-2:]) + ["CURRENT"]
+    assert snapshots.current_version(str(tmp_path)) == versions[-1]
+
+def test_prune_keeps_a_pinned_snapshot(tmp_path):
+    first = publish(tmp_path, 1, keep=2)[0]
+    snapshots.pin_snapshot(first, str(tmp_path))
+    try:
+        versions = publish(tmp_path, 3, keep=2)
+        assert snapshots.pinned_versions(str(tmp_path)) == {first}
+        assert published(tmp_path) == sorted([first, *versions[-2:]]) + ["CURRENT"]
+    finally:
+        snapshots._release_pin()
+
+def test_pins_of_exited_processes_are_ignored(tmp_path):
+    first = publish(tmp_path, 1, keep=2)[0]
+    child = subprocess.run([sys.executable, "-c", "import os; print(os.getpid())"],
+                           capture_output=True, text=True, check=True)
+    pin_path = tmp_path / snapshots.PINS / child.stdout.strip()
+    pin_path.parent.mkdir()
+    pin_path.write_text(first)
+
+    publish(tmp_path, 2, keep=2)
+    assert first not in published(tmp_path)
+    assert not pin_path.exists()
@@ -1,65 +1,302 @@
-import requests
 import json
+import os
+import random
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from email.utils import parsedate_to_datetime
+
+import requests
+from requests.adapters import HTTPAdapter
+import config
 from config import RECIPES_JSON, AIRTABLE_API_KEY, AIRTABLE_BASE_ID, AIRTABLE_TABLE_NAME
+from tools import catalog, embeddings
 
 HEADERS = {"Authorization": f"Bearer {AIRTABLE_API_KEY}"}
 
-def fetch_airtable_records():
+# The synced table: an SQLite catalog updated in place by every sync. Its
+# rows are not matrix rows (-1); save_embeddings numbers them in the copy it
+# publishes next to each embedding matrix
+AIRTABLE_CATALOG = getattr(config, "AIRTABLE_CATALOG", os.path.splitext(RECIPES_JSON)[0] + ".sqlite3")
+# Also export the synced records to RECIPES_JSON after each sync
+AIRTABLE_EXPORT_JSON = getattr(config, "AIRTABLE_EXPORT_JSON", False)
+
+# Last successful sync time, used to fetch only records modified since then
+AIRTABLE_CHECKPOINT = getattr(
+    config, "AIRTABLE_CHECKPOINT",
+    os.path.join(os.path.dirname(os.path.abspath(RECIPES_JSON)), "airtable_checkpoint.json")
+)
+# Airtable allows 5 requests per second per base
+AIRTABLE_MIN_INTERVAL = getattr(config, "AIRTABLE_MIN_INTERVAL", 0.2)
+AIRTABLE_MAX_RETRIES = getattr(config, "AIRTABLE_MAX_RETRIES", 6)
+# Overlap between checkpoints so edits made during a sync are not missed
+CHECKPOINT_OVERLAP = timedelta(minutes=5)
+# Delta syncs list every record id to find deletions at most this often
+# (seconds); in between only changed records are fetched
+AIRTABLE_SWEEP_SECONDS = getattr(config, "AIRTABLE_SWEEP_SECONDS", 86400)
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+_session = None
+_session_lock = threading.Lock()
+_last_request = 0.0
+
+def get_session():
+    """Shared session so pages reuse pooled keep-alive connections"""
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = requests.Session()
+            _session.headers.update(HEADERS)
+            _session.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=4))
+        return _session
+
+def _retry_after(value):
+    """Seconds to wait from a Retry-After header (delay or HTTP date), or None if unparseable"""
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=timezone.utc)
+    return max(0.0, (when - datetime.now(timezone.utc)).total_seconds())
+
+def _get(url, params):
+    """GET with request pacing and backoff on rate limits and server errors"""
+    global _last_request
+    for attempt in range(AIRTABLE_MAX_RETRIES + 1):
+        wait = _last_request + AIRTABLE_MIN_INTERVAL - time.monotonic()
+        if wait > 0:
+            time.sleep(wait)
+        _last_request = time.monotonic()
+
+        try:
+            resp = get_session().get(url, params=params, timeout=30)
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+            if attempt == AIRTABLE_MAX_RETRIES:
+                raise
+            delay = min(30.0, 2 ** attempt) * random.uniform(0.5, 1.0)
+            print(f"Airtable request failed ({e}), retrying in {delay:.1f}s")
+            time.sleep(delay)
+            continue
+
+        if resp.status_code in RETRY_STATUSES and attempt < AIRTABLE_MAX_RETRIES:
+            retry_after = resp.headers.get("Retry-After")
+            delay = _retry_after(retry_after) if retry_after is not None else None
+            if delay is None and resp.status_code == 429:
+                delay = 30.0  # Airtable's documented penalty for exceeding the limit
+            elif delay is None:
+                delay = min(30.0, 2 ** attempt) * random.uniform(0.5, 1.0)
+            print(f"Airtable returned {resp.status_code}, retrying in {delay:.1f}s")
+            time.sleep(delay)
+            continue
+
+        resp.raise_for_status()  # Raise an exception for bad status codes
+        return resp.json()
+
+def _iter_pages(params=None):
+    """Yield pages of raw Airtable records"""
+    url = f"https://api.airtable.com/v0/{AIRTABLE_BASE_ID}/{AIRTABLE_TABLE_NAME}"
+    params = dict(params or {})
+    while True:
+        data = _get(url, params)
+        yield data.get("records", [])
+        offset = data.get("offset")
+        if not offset:
+            break
+        params["offset"] = offset
+
+def _to_recipe(rec):
+    fields = rec["fields"]
+
+    # Handle image field - Airtable stores images as URL strings
+    image_url = fields.get("Image Link", "")
+
+    return {
+        "id": rec["id"],
+        "title": fields.get("Title", ""),
+        "description": fields.get("Description", ""),
+        "category": fields.get("Category", ""),
+        "tags": fields.get("Tags", []),
+        "url": fields.get("URL", ""),
+        "image_url": image_url
+    }
+
+class _RecordWriter:
+    """Writes a JSON array one record at a time and moves it into place on close"""
+
+    def __init__(self, path):
+        self.path = path
+        self.tmp_path = f"{path}.tmp"
+        self.count = 0
+        self._f = open(self.tmp_path, "w")
+        self._f.write("[")
+
+    def write(self, record):
+        self._f.write(",\n" if self.count else "\n")
+        json.dump(record, self._f)
+        self.count += 1
+
+    def close(self):
+        self._f.write("\n]\n")
+        self._f.close()
+        os.replace(self.tmp_path, self.path)
+
+    def abort(self):
+        self._f.close()
+        os.remove(self.tmp_path)
+
+def load_checkpoint(path=AIRTABLE_CHECKPOINT):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def save_checkpoint(checkpoint, path=AIRTABLE_CHECKPOINT):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(checkpoint, f, indent=2)
+    os.replace(tmp_path, path)
+
+def load_records(path=AIRTABLE_CATALOG):
+    """Every synced recipe in faiss_id order ([] before the first sync)"""
+    if not os.path.exists(path):
+        return []
+    synced = catalog.RecipeCatalog(path, readonly=True)
+    try:
+        return [recipe for _, _, recipe in synced.iter_recipes()]
+    finally:
+        synced.close()
+
+def export_json(path=RECIPES_JSON, catalog_path=AIRTABLE_CATALOG):
+    """Write the synced records to ``path`` as a JSON array; returns how many"""
+    synced = catalog.RecipeCatalog(catalog_path, readonly=True)
+    writer = _RecordWriter(path)
+    try:
+        for _, _, recipe in synced.iter_recipes():
+            writer.write({k: v for k, v in recipe.items() if k not in ("faiss_id", "content_hash")})
+        writer.close()
+    except BaseException:
+        writer.abort()
+        raise
+    finally:
+        synced.close()
+    return writer.count
+
+def _prepare(records, known):
+    """Give records their content hash and their stored faiss_id, or a new one.
+
+    ``known`` maps record ids to faiss_ids and is extended with new records.
     """
-    Fetch all records from Airtable and save them locally as JSON.
-    Returns the list of recipe records.
+    new = []
+    for record in records:
+        record["content_hash"] = embeddings.content_hash(record)
+        if record["id"] in known:
+            record["faiss_id"] = known[record["id"]]
+        else:
+            new.append(record)
+    embeddings.assign_ids(new, taken=known.values())
+    for record in new:
+        known[record["id"]] = record["faiss_id"]
+
+def fetch_airtable_records(full=False, sweep=None, path=AIRTABLE_CATALOG):
     """
-    url = f"https://api.airtable.com/v0/{AIRTABLE_BASE_ID}/{AIRTABLE_TABLE_NAME}"
-    all_records = []
-    offset = None
+    Sync recipes from Airtable into the catalog at ``path``.
 
-    print("Fetching records from Airtable...")
-    
-    while True:
-        params = {}
-        if offset:
-            params["offset"] = offset
-            
+    Each page of records is upserted into the catalog as it arrives, in one
+    transaction. After the first run only records modified since the last
+    checkpoint are downloaded. Deletions need a listing of every record id,
+    so a delta sync only sweeps for them when the last sweep is more than
+    ``AIRTABLE_SWEEP_SECONDS`` old, or when ``sweep`` is true; records
+    deleted in Airtable are then deleted from the catalog. Pass
+    ``full=True`` to download the whole table; records it no longer has are
+    deleted. With ``AIRTABLE_EXPORT_JSON`` the records are also written to
+    RECIPES_JSON.
+
+    Returns ``{"changed": [...], "deleted": [...], "total": n}`` with the
+    faiss_ids of the upserted and deleted records; ``load_records`` reads
+    the synced table.
+    """
+    checkpoint = None if full else load_checkpoint()
+    synced = catalog.RecipeCatalog(path)
+    try:
+        known = synced.record_ids()
+        delta = checkpoint is not None and bool(known)
+        sync_started = datetime.now(timezone.utc)
+        last_sweep = checkpoint.get("last_sweep", 0.0) if delta else None
+        if delta and sweep is None:
+            sweep = sync_started.timestamp() - last_sweep >= AIRTABLE_SWEEP_SECONDS
+
+        if not delta:
+            print("Fetching records from Airtable...")
+            params = {}
+        else:
+            since = checkpoint["last_sync"]
+            print(f"Fetching records modified since {since} from Airtable...")
+            params = {"filterByFormula": f"IS_AFTER(LAST_MODIFIED_TIME(), '{since}')"}
+
+        fetched, changed = set(), []
         try:
-            resp = requests.get(url, headers=HEADERS, params=params)
-            resp.raise_for_status()  # Raise an exception for bad status codes
-            data = resp.json()
-            
-            for rec in data.get("records", []):
-                fields = rec["fields"]
-                
-                # Handle image field - Airtable stores images as URL strings
-                image_url = fields.get("Image Link", "")
-                
-                all_records.append({
-                    "title": fields.get("Title", ""),
-                    "description": fields.get("Description", ""),
-                    "category": fields.get("Category", ""),
-                    "tags": fields.get("Tags", []),
-                    "url": fields.get("URL", ""),
-                    "image_url": image_url
-                })
-            
-            offset = data.get("offset")
-            if not offset:
-                break
-                
+            live_ids = None
+            if delta and sweep:
+                # Only ids (plus one small field) to find deleted records
+                print("Listing record ids to find deleted records...")
+                live_ids = set()
+                for page in _iter_pages({"fields[]": "Title"}):
+                    live_ids.update(rec["id"] for rec in page)
+
+            for page in _iter_pages(params):
+                records = [_to_recipe(rec) for rec in page]
+                _prepare(records, known)
+                synced.upsert(records, rows=[-1] * len(records))
+                fetched.update(record["id"] for record in records)
+                changed.extend(record["faiss_id"] for record in records)
         except requests.exceptions.RequestException as e:
             print(f"Error fetching from Airtable: {e}")
             raise
 
-    print(f"Fetched {len(all_records)} records from Airtable")
+        deleted = []
+        if not delta or live_ids is not None:
+            # A record created after the id listing is fetched but not listed
+            deleted = [
+                faiss_id for record_id, faiss_id in known.items()
+                if record_id not in fetched and (live_ids is None or record_id not in live_ids)
+            ]
+            synced.delete(deleted)
+            last_sweep = sync_started.timestamp()
+        total = len(known) - len(deleted)
+    finally:
+        synced.close()
 
-    # Save locally as JSON
-    with open(RECIPES_JSON, "w") as f:
-        json.dump(all_records, f, indent=2)
+    save_checkpoint({
+        "last_sync": (sync_started - CHECKPOINT_OVERLAP).strftime("%Y-%m-%dT%H:%M:%S.000Z"),
+        "last_sweep": last_sweep,
+        "records": total,
+    })
 
-    print(f"Saved recipes to {RECIPES_JSON}")
-    return all_records
+    if not delta:
+        print(f"Fetched {len(fetched)} records from Airtable")
+    elif live_ids is not None:
+        print(f"Fetched {len(fetched)} changed records from Airtable, "
+              f"removed {len(deleted)} deleted records ({total} total)")
+    else:
+        print(f"Fetched {len(fetched)} changed records from Airtable ({total} total, "
+              f"deletions are checked every {AIRTABLE_SWEEP_SECONDS}s)")
+    print(f"Saved recipes to {path}")
+    if AIRTABLE_EXPORT_JSON:
+        export_json(RECIPES_JSON, path)
+        print(f"Exported recipes to {RECIPES_JSON}")
+    return {"changed": changed, "deleted": deleted, "total": total}
 
 def sync_and_get_recipes():
     """
     Convenience function to fetch latest recipes from Airtable.
     This is the main function other modules should use.
     """
-    return fetch_airtable_records()
+    fetch_airtable_records()
+    return load_records()
@@ -0,0 +1,156 @@
+import asyncio
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+
+import config
+from config import *
+from tools import metrics
+from tools.embedding_cache import normalize_query
+
+# Finished articles kept in memory, and how long they stay fresh (seconds)
+ARTICLE_CACHE_SIZE = getattr(config, "ARTICLE_CACHE_SIZE", 256)
+ARTICLE_CACHE_TTL = getattr(config, "ARTICLE_CACHE_TTL", 60 * 60)
+
+def recipe_key(recipe):
+    return recipe.get("id") or recipe.get("faiss_id") or recipe.get("title")
+
+def article_key(query, recipes, model=LLM_MODEL, version=None, fast=False):
+    """Cache key of an article: normalized query, retrieved recipes, model, snapshot
+    and whether stored sections were reused (``fast``)"""
+    payload = json.dumps(
+        [normalize_query(query), [recipe_key(r) for r in recipes], model, version, bool(fast)],
+        ensure_ascii=False, default=str
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+class ArticleCache:
+    """In-process LRU of generated articles with a time-to-live"""
+
+    def __init__(self, max_entries=ARTICLE_CACHE_SIZE, ttl=ARTICLE_CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.monotonic() - entry[1] > self.ttl:
+                del self._entries[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+            else:
+                self._entries.move_to_end(key)
+                self.hits += 1
+        metrics.record_cache("article", entry is not None)
+        return entry[0] if entry is not None else None
+
+    def put(self, key, article):
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (article, time.monotonic())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "entries": len(self._entries),
+            }
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+class SingleFlight:
+    """Runs one computation per key at a time; concurrent callers share its result.
+
+    ``do(key, fn)`` calls ``fn()`` unless a call for ``key`` is already in
+    flight, in which case it waits for that call and returns its result (or
+    raises its exception). Nothing is remembered once the call finishes.
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.coalesced = 0
+
+    def do(self, key, fn):
+        """Return (result, shared) where ``shared`` says another caller computed it"""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result, False
+
+    def in_flight(self):
+        with self._lock:
+            return len(self._calls)
+
+class AsyncSingleFlight:
+    """``SingleFlight`` for coroutines sharing one event loop"""
+
+    def __init__(self):
+        self._calls = {}
+        self.coalesced = 0
+
+    async def do(self, key, fn):
+        """Await ``fn()`` once per key; return (result, shared) like ``SingleFlight.do``"""
+        call = self._calls.get(key)
+        if call is not None:
+            self.coalesced += 1
+            # shield: a waiter that is cancelled must not cancel the leader
+            return await asyncio.shield(call), True
+
+        call = self._calls[key] = asyncio.ensure_future(fn())
+        try:
+            return await asyncio.shield(call), False
+        finally:
+            # A cancelled leader leaves the call running for its waiters
+            call.add_done_callback(lambda done: self._forget(key, done))
+
+    def _forget(self, key, call):
+        if self._calls.get(key) is call:
+            del self._calls[key]
+        if not call.cancelled():
+            call.exception()  # retrieved, so asyncio doesn't log it as unhandled
+
+    def in_flight(self):
+        return len(self._calls)
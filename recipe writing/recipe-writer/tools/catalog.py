@@ -0,0 +1,366 @@
+import json
+import os
+import sqlite3
+import threading
+from collections.abc import Mapping
+from itertools import groupby
+from urllib.request import pathname2url
+
+import numpy as np
+
+import config
+from config import *
+
+# Keep recipe metadata in an SQLite catalog instead of a JSON file; servers
+# then hold only the vectors in memory and fetch the top-k rows per query
+RECIPE_CATALOG = getattr(config, "RECIPE_CATALOG", True)
+# Catalog of the unversioned data files (snapshots carry their own)
+CATALOG_PATH = getattr(config, "CATALOG_PATH", os.path.splitext(EMBEDDINGS_JSON)[0] + ".sqlite3")
+
+# Recipe fields with their own column; anything else is kept as JSON in ``extra``
+COLUMNS = ("title", "description", "category", "url", "image_url", "content_hash")
+_SELECT = "SELECT faiss_id, record_id, " + ", ".join(COLUMNS) + ", extra FROM recipes"
+# Ids per IN (...) lookup, below SQLite's bound-parameter limit
+_CHUNK = 500
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS recipes (
+    faiss_id INTEGER PRIMARY KEY,
+    row INTEGER NOT NULL,
+    record_id TEXT,
+    title TEXT,
+    description TEXT,
+    category TEXT,
+    url TEXT,
+    image_url TEXT,
+    content_hash TEXT,
+    extra TEXT
+);
+CREATE INDEX IF NOT EXISTS recipes_record_id ON recipes (record_id);
+CREATE INDEX IF NOT EXISTS recipes_category ON recipes (category);
+CREATE TABLE IF NOT EXISTS tags (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS recipe_tags (
+    faiss_id INTEGER NOT NULL,
+    position INTEGER NOT NULL,
+    tag_id INTEGER NOT NULL,
+    PRIMARY KEY (faiss_id, position)
+);
+CREATE INDEX IF NOT EXISTS recipe_tags_tag ON recipe_tags (tag_id);
+"""
+
+def readonly_uri(path):
+    """SQLite URI opening ``path`` read-only; ``%``, ``?`` and ``#`` in the path are escaped"""
+    return f"file:{pathname2url(os.path.abspath(path))}?mode=ro"
+
+def connect_readonly(path):
+    """Read-only connection to ``path`` that any thread may use (serialize access yourself)"""
+    return sqlite3.connect(readonly_uri(path), uri=True, check_same_thread=False)
+
+class RecipeCatalog:
+    """Recipe metadata in SQLite, keyed by ``faiss_id``.
+
+    Each recipe row also records its row in the embedding matrix. Tags are
+    normalized into their own table. A writable catalog gets one connection
+    per thread (and per process, so it is safe across fork). A read-only
+    catalog opens a single connection up front, when the corpus loads, and
+    shares it between threads behind a lock: the open file keeps serving
+    lookups even after the snapshot it belongs to is pruned.
+    """
+
+    def __init__(self, path=CATALOG_PATH, readonly=False):
+        self.path = path
+        self.readonly = readonly
+        self._local = threading.local()
+        self._lock = threading.RLock()
+        self._shared = None
+        with self._lock:
+            conn = self._connection()
+            if not readonly:
+                conn.executescript(SCHEMA)
+
+    def _connection(self):
+        # Callers hold self._lock
+        if self.readonly:
+            if self._shared is None or self._shared[0] != os.getpid():
+                self._shared = (os.getpid(), connect_readonly(self.path))
+            return self._shared[1]
+        local = self._local
+        if getattr(local, "pid", None) != os.getpid():
+            local.conn = sqlite3.connect(self.path, timeout=30)
+            local.pid = os.getpid()
+        return local.conn
+
+    def upsert(self, recipes, rows=None, prune=False):
+        """Insert or update recipes in one transaction.
+
+        ``rows`` are their rows in the embedding matrix (default: list
+        order). With ``prune`` every recipe not in ``recipes`` is deleted,
+        making the catalog an exact copy of the list.
+        """
+        rows = range(len(recipes)) if rows is None else rows
+        records, tag_names = [], set()
+        for row, r in zip(rows, recipes):
+            extra = {k: v for k, v in r.items()
+                     if k not in COLUMNS and k not in ("id", "faiss_id", "tags", "embedding")}
+            records.append((int(r.get("faiss_id", row)), int(row), r.get("id"),
+                            *(r.get(column) for column in COLUMNS),
+                            json.dumps(extra, ensure_ascii=False) if extra else None))
+            tag_names.update(r.get("tags", []))
+
+        with self._lock, self._connection() as conn:
+            conn.executemany("INSERT OR IGNORE INTO tags (name) VALUES (?)",
+                             ((name,) for name in tag_names))
+            tag_ids = dict(conn.execute("SELECT name, id FROM tags"))
+            conn.executemany(
+                "INSERT OR REPLACE INTO recipes (faiss_id, row, record_id, " + ", ".join(COLUMNS) +
+                ", extra) VALUES (" + ", ".join("?" * (len(COLUMNS) + 4)) + ")", records
+            )
+            ids = [(record[0],) for record in records]
+            conn.executemany("DELETE FROM recipe_tags WHERE faiss_id = ?", ids)
+            conn.executemany(
+                "INSERT INTO recipe_tags (faiss_id, position, tag_id) VALUES (?, ?, ?)",
+                ((record[0], position, tag_ids[name])
+                 for record, r in zip(records, recipes)
+                 for position, name in enumerate(r.get("tags", [])))
+            )
+            if prune:
+                conn.execute("CREATE TEMP TABLE IF NOT EXISTS keep (faiss_id INTEGER PRIMARY KEY)")
+                conn.execute("DELETE FROM keep")
+                conn.executemany("INSERT INTO keep VALUES (?)", ids)
+                conn.execute("DELETE FROM recipes WHERE faiss_id NOT IN (SELECT faiss_id FROM keep)")
+                conn.execute("DELETE FROM recipe_tags WHERE faiss_id NOT IN (SELECT faiss_id FROM keep)")
+                conn.execute("DELETE FROM tags WHERE id NOT IN (SELECT tag_id FROM recipe_tags)")
+        return len(records)
+
+    def delete(self, ids):
+        """Remove the recipes with these faiss_ids in one transaction; returns how many were given"""
+        ids = [(int(i),) for i in ids]
+        with self._lock, self._connection() as conn:
+            conn.executemany("DELETE FROM recipes WHERE faiss_id = ?", ids)
+            conn.executemany("DELETE FROM recipe_tags WHERE faiss_id = ?", ids)
+            conn.execute("DELETE FROM tags WHERE id NOT IN (SELECT tag_id FROM recipe_tags)")
+        return len(ids)
+
+    def record_ids(self):
+        """{record id: faiss_id} for every recipe that has a record id"""
+        with self._lock:
+            return dict(self._connection().execute(
+                "SELECT record_id, faiss_id FROM recipes WHERE record_id IS NOT NULL"
+            ))
+
+    def get_many(self, ids):
+        """{faiss_id: recipe} for the given ids, in batched lookups; unknown ids are left out"""
+        ids = [int(i) for i in ids]
+        recipes = {}
+        with self._lock:
+            conn = self._connection()
+            for start in range(0, len(ids), _CHUNK):
+                chunk = ids[start:start + _CHUNK]
+                marks = ", ".join("?" * len(chunk))
+                for row in conn.execute(f"{_SELECT} WHERE faiss_id IN ({marks})", chunk):
+                    recipes[row[0]] = _recipe(row)
+                for faiss_id, name in conn.execute(
+                    "SELECT rt.faiss_id, t.name FROM recipe_tags rt JOIN tags t ON t.id = rt.tag_id "
+                    f"WHERE rt.faiss_id IN ({marks}) ORDER BY rt.faiss_id, rt.position", chunk
+                ):
+                    recipes[faiss_id]["tags"].append(name)
+        return recipes
+
+    def iter_recipes(self, batch_size=1000):
+        """Yield (faiss_id, row, recipe) for every recipe in id order"""
+        last = -1
+        while True:
+            with self._lock:
+                batch = self._connection().execute(
+                    "SELECT faiss_id, row FROM recipes WHERE faiss_id > ? ORDER BY faiss_id LIMIT ?",
+                    (last, batch_size)
+                ).fetchall()
+            if not batch:
+                return
+            recipes = self.get_many([faiss_id for faiss_id, _ in batch])
+            for faiss_id, row in batch:
+                yield faiss_id, row, recipes[faiss_id]
+            last = batch[-1][0]
+
+    def id_rows(self):
+        """(ids, rows): int64 arrays of every faiss_id, sorted, and its matrix row"""
+        with self._lock:
+            count = len(self)
+            pairs = np.fromiter(
+                (value for pair in self._connection().execute(
+                    "SELECT faiss_id, row FROM recipes ORDER BY faiss_id") for value in pair),
+                dtype="int64", count=2 * count
+            ).reshape(count, 2)
+        return pairs[:, 0].copy(), pairs[:, 1].copy()
+
+    def facet_postings(self):
+        """(categories, tags): lowercased value -> int64 array of faiss_ids"""
+        with self._lock:
+            conn = self._connection()
+            categories = _postings(conn.execute(
+                "SELECT coalesce(category, ''), faiss_id FROM recipes ORDER BY 1"
+            ))
+            tags = _postings(conn.execute(
+                "SELECT t.name, rt.faiss_id FROM recipe_tags rt JOIN tags t ON t.id = rt.tag_id ORDER BY 1"
+            ))
+        return categories, tags
+
+    def close(self):
+        with self._lock:
+            opened = [self._shared or (None, None),
+                      (getattr(self._local, "pid", None), getattr(self._local, "conn", None))]
+            for pid, conn in opened:
+                # Connections inherited from a parent process are left alone
+                if conn is not None and pid == os.getpid():
+                    conn.close()
+            self._shared = None
+            self._local = threading.local()
+
+    def __len__(self):
+        with self._lock:
+            return self._connection().execute("SELECT COUNT(*) FROM recipes").fetchone()[0]
+
+def _recipe(row):
+    faiss_id, record_id, *values, extra = row
+    recipe = json.loads(extra) if extra else {}
+    if record_id is not None:
+        recipe["id"] = record_id
+    for column, value in zip(COLUMNS, values):
+        if value is not None:
+            recipe[column] = value
+    recipe["tags"] = []
+    recipe["faiss_id"] = faiss_id
+    return recipe
+
+def _postings(cursor):
+    # Values arrive sorted, so each distinct value is one group; values that
+    # only differ in case are merged (Python's lower(), as FacetIndex uses)
+    postings = {}
+    for value, group in groupby(cursor, key=lambda pair: pair[0]):
+        postings.setdefault(value.lower(), []).append(
+            np.fromiter((faiss_id for _, faiss_id in group), dtype="int64")
+        )
+    return {value: np.unique(np.concatenate(arrays)) for value, arrays in postings.items()}
+
+class LazyRecipes(Mapping):
+    """Read-only ``id_to_recipe`` backed by a catalog and the embedding matrix.
+
+    Only the faiss_id -> matrix row arrays live in memory. Recipes are read
+    from the catalog when looked up, with ``embedding`` a view of their
+    matrix row. Use ``get_many`` to fetch a query's top-k rows in one go.
+    """
+
+    def __init__(self, catalog, vectors):
+        self.catalog = catalog
+        self.vectors = vectors
+        self.ids, self._rows = catalog.id_rows()
+
+    def _positions(self, ids):
+        ids = np.asarray(ids, dtype="int64")
+        positions = np.searchsorted(self.ids, ids)
+        positions[positions == len(self.ids)] = 0
+        missing = self.ids[positions] != ids if len(self.ids) else np.ones(len(ids), dtype=bool)
+        if missing.any():
+            raise KeyError(int(ids[missing][0]))
+        return positions
+
+    def get_many(self, ids):
+        """Recipes for ``ids`` in order (KeyError for an unknown id)"""
+        ids = [int(i) for i in ids]
+        rows = self._rows[self._positions(ids)]
+        found = self.catalog.get_many(ids)
+        recipes = []
+        for recipe_id, row in zip(ids, rows.tolist()):
+            recipe = found[recipe_id]
+            recipe["embedding"] = self.vectors[row]
+            recipes.append(recipe)
+        return recipes
+
+    def vectors_for(self, ids):
+        """float32 matrix of the embeddings of ``ids``, without touching the catalog"""
+        return np.asarray(self.vectors[self._rows[self._positions(ids)]], dtype="float32")
+
+    def __getitem__(self, recipe_id):
+        return self.get_many([recipe_id])[0]
+
+    def __contains__(self, recipe_id):
+        try:
+            self._positions([recipe_id])
+        except (KeyError, TypeError, ValueError):
+            return False
+        return True
+
+    def __iter__(self):
+        return iter(self.ids.tolist())
+
+    def __len__(self):
+        return len(self.ids)
+
+    def items(self):
+        """Stream (faiss_id, recipe) pairs from the catalog in id order"""
+        for recipe_id, row, recipe in self.catalog.iter_recipes():
+            recipe["embedding"] = self.vectors[row]
+            yield recipe_id, recipe
+
+def get_recipes(id_to_recipe, ids):
+    """Recipes for ``ids`` in order, in one batched lookup when the mapping supports it"""
+    get_many = getattr(id_to_recipe, "get_many", None)
+    if get_many is not None:
+        return get_many(ids)
+    return [id_to_recipe[i] for i in ids]
+
+def get_vectors(id_to_recipe, ids):
+    """float32 matrix of the embeddings of ``ids``"""
+    vectors_for = getattr(id_to_recipe, "vectors_for", None)
+    if vectors_for is not None:
+        return vectors_for(ids)
+    return np.vstack([id_to_recipe[i]["embedding"] for i in np.asarray(ids).tolist()])
+
+def write_catalog(recipes, path=CATALOG_PATH):
+    """Write ``recipes`` (in matrix row order) as the complete catalog at ``path``"""
+    catalog = RecipeCatalog(path)
+    try:
+        catalog.upsert(recipes, prune=True)
+    finally:
+        catalog.close()
+
+def copy_catalog(source, path, ids):
+    """Copy the catalog at ``source`` to ``path``, numbering ``ids`` as matrix rows 0..n-1.
+
+    The file is copied with SQLite's backup API and only the row column is
+    rewritten, so publishing a synced catalog next to its embedding matrix
+    costs no re-insertion of recipes and tags. ``source`` must hold exactly
+    ``ids``.
+    """
+    if os.path.exists(path):
+        os.remove(path)
+    src, dst = connect_readonly(source), sqlite3.connect(path)
+    try:
+        src.backup(dst)
+        with dst:
+            dst.execute("UPDATE recipes SET row = -1")
+            dst.executemany("UPDATE recipes SET row = ? WHERE faiss_id = ?",
+                            ((row, int(i)) for row, i in enumerate(ids)))
+            total, unmatched = dst.execute(
+                "SELECT COUNT(*), COUNT(*) FILTER (WHERE row < 0) FROM recipes"
+            ).fetchone()
+        if total != len(ids) or unmatched:
+            raise ValueError(f"{source} holds {total} recipes, {unmatched} of them not among "
+                             f"the {len(ids)} being saved")
+    finally:
+        src.close()
+        dst.close()
+
+def read_catalog(path=CATALOG_PATH):
+    """Every recipe of the catalog at ``path`` as a list in matrix row order"""
+    catalog = RecipeCatalog(path, readonly=True)
+    try:
+        recipes = [None] * len(catalog)
+        for _, row, recipe in catalog.iter_recipes():
+            recipes[row] = recipe
+    finally:
+        catalog.close()
+    return recipes
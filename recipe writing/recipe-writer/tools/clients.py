@@ -0,0 +1,64 @@
+import os
+import threading
+
+from config import *
+
+# The openai package is imported by the first get_client call rather than
+# here: it is the single largest import of the pipeline and most of a
+# server's startup path never needs it
+_client = None
+_client_pid = None
+_async_client = None
+_lock = threading.Lock()
+
+def get_client():
+    """Process-wide OpenAI client, created on first use.
+
+    Its HTTP connection pool is shared by every thread, so modules should
+    call this instead of building their own client. A forked worker gets a
+    fresh client rather than the parent's connections.
+    """
+    global _client, _client_pid
+    if _client is None or _client_pid != os.getpid():
+        with _lock:
+            if _client is None or _client_pid != os.getpid():
+                from openai import OpenAI
+                _client = OpenAI(api_key=OPENAI_API_KEY)
+                _client_pid = os.getpid()
+    return _client
+
+def set_client(client):
+    """Use ``client`` as the shared OpenAI client (benchmarks and tests)"""
+    global _client, _client_pid
+    with _lock:
+        _client, _client_pid = client, os.getpid()
+
+def warm_up():
+    """Import the SDK and create the shared client ahead of the first request"""
+    try:
+        get_client()
+    except Exception as e:
+        print(f"Could not create the OpenAI client: {e}")
+
+def get_async_client():
+    """Process-wide AsyncOpenAI client, created on first use.
+
+    Its HTTP connection pool keeps connections alive between requests, so
+    every coroutine in the process should share this one client rather than
+    build its own. It binds to the event loop it is first used on.
+    """
+    global _async_client
+    if _async_client is None:
+        with _lock:
+            if _async_client is None:
+                from openai import AsyncOpenAI
+                _async_client = AsyncOpenAI(api_key=OPENAI_API_KEY)
+    return _async_client
+
+async def close_async_client():
+    """Close the shared client's connections (call at server shutdown)"""
+    global _async_client
+    with _lock:
+        client, _async_client = _async_client, None
+    if client is not None:
+        await client.close()
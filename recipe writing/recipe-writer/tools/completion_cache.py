@@ -0,0 +1,275 @@
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+import config
+from config import *
+from tools import metrics
+
+_DATA_DIR = os.path.dirname(os.path.abspath(EMBEDDINGS_JSON))
+
+# Backend for cached completions: "memory", "sqlite", "files" or None to disable.
+# Off by default: a cached prompt returns earlier text word for word, so
+# articles for repeated queries and recipes start sharing sections
+COMPLETION_CACHE = getattr(config, "COMPLETION_CACHE", None)
+# SQLite database file or directory of JSON files for the persistent backends
+COMPLETION_CACHE_PATH = getattr(config, "COMPLETION_CACHE_PATH", None)
+COMPLETION_CACHE_MAX_ENTRIES = getattr(config, "COMPLETION_CACHE_MAX_ENTRIES", 5000)
+COMPLETION_CACHE_TTL = getattr(config, "COMPLETION_CACHE_TTL", 7 * 24 * 60 * 60)
+# Completions kept per prompt; cached text rotates through them. Each extra
+# variant costs one more miss per prompt before the cache starts saving calls
+COMPLETION_CACHE_VARIANTS = getattr(config, "COMPLETION_CACHE_VARIANTS", 1)
+
+def completion_key(model, prompt, temperature):
+    """Content address of a completion request"""
+    payload = json.dumps([model, prompt, temperature], ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+class MemoryBackend:
+    """Entries in an in-process LRU dict"""
+
+    def __init__(self):
+        self._entries = OrderedDict()
+
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+        return entry
+
+    def put(self, key, entry):
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+
+    def delete(self, key):
+        self._entries.pop(key, None)
+
+    def evict(self, max_entries):
+        while len(self._entries) > max_entries:
+            self._entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self._entries)
+
+class SQLiteBackend:
+    """Entries in a local SQLite table, least recently used evicted first.
+
+    Each thread gets its own connection, and so does each process: a
+    worker forked after the cache was created (``gunicorn --preload``)
+    opens a fresh one instead of sharing the parent's.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        conn = self._connection()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS completions ("
+            "key TEXT PRIMARY KEY, entry TEXT NOT NULL, last_used REAL NOT NULL)"
+        )
+        conn.execute(
+            "CREATE INDEX IF NOT EXISTS completions_last_used ON completions (last_used)"
+        )
+        conn.commit()
+
+    def _connection(self):
+        local = self._local
+        if getattr(local, "pid", None) != os.getpid():
+            local.conn = sqlite3.connect(self.path, timeout=30)
+            local.pid = os.getpid()
+        return local.conn
+
+    def get(self, key):
+        conn = self._connection()
+        row = conn.execute(
+            "SELECT entry FROM completions WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        conn.execute(
+            "UPDATE completions SET last_used = ? WHERE key = ?", (time.time(), key)
+        )
+        conn.commit()
+        return json.loads(row[0])
+
+    def put(self, key, entry):
+        conn = self._connection()
+        conn.execute(
+            "INSERT OR REPLACE INTO completions (key, entry, last_used) VALUES (?, ?, ?)",
+            (key, json.dumps(entry), time.time())
+        )
+        conn.commit()
+
+    def delete(self, key):
+        conn = self._connection()
+        conn.execute("DELETE FROM completions WHERE key = ?", (key,))
+        conn.commit()
+
+    def evict(self, max_entries):
+        excess = len(self) - max_entries
+        if excess > 0:
+            conn = self._connection()
+            conn.execute(
+                "DELETE FROM completions WHERE key IN ("
+                "SELECT key FROM completions ORDER BY last_used LIMIT ?)", (excess,)
+            )
+            conn.commit()
+
+    def __len__(self):
+        return self._connection().execute("SELECT COUNT(*) FROM completions").fetchone()[0]
+
+class FileBackend:
+    """One JSON file per entry; file mtime tracks recency for eviction"""
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.json")
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with open(path) as f:
+                entry = json.load(f)
+            os.utime(path)
+            return entry
+        except (OSError, ValueError):
+            return None
+
+    def put(self, key, entry):
+        path = self._path(key)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(entry, f)
+        os.replace(tmp_path, path)
+
+    def delete(self, key):
+        try:
+            os.remove(self._path(key))
+        except OSError:
+            pass
+
+    def _files(self):
+        return [e for e in os.scandir(self.directory) if e.name.endswith(".json")]
+
+    def evict(self, max_entries):
+        files = self._files()
+        if len(files) > max_entries:
+            files.sort(key=lambda e: e.stat().st_mtime)
+            for entry in files[:len(files) - max_entries]:
+                try:
+                    os.remove(entry.path)
+                except OSError:
+                    pass
+
+    def __len__(self):
+        return len(self._files())
+
+class CompletionCache:
+    """Content-addressed cache of chat completions.
+
+    Keys are a hash of model, prompt and temperature. Each key keeps up to
+    ``variants`` completions: until that many exist a lookup calls the model
+    and stores the new text, afterwards lookups rotate through the stored
+    ones. Cached text is reused verbatim, so only enable a cache where
+    repeated sections across articles are acceptable. Entries expire ``ttl``
+    seconds after the first variant was stored and the backend is trimmed
+    to ``max_entries`` least recently used keys.
+    """
+
+    def __init__(self, backend, max_entries=COMPLETION_CACHE_MAX_ENTRIES,
+                 ttl=COMPLETION_CACHE_TTL, variants=COMPLETION_CACHE_VARIANTS):
+        self.backend = backend
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.variants = max(1, variants)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get_or_create(self, model, prompt, temperature, create):
+        """Return a cached completion, or call ``create()`` and store its text"""
+        key = completion_key(model, prompt, temperature)
+        text = self._lookup(key)
+        if text is None:
+            text = create()
+            self._store(key, text)
+        return text
+
+    async def aget_or_create(self, model, prompt, temperature, create):
+        """``get_or_create`` for an async ``create`` coroutine function.
+
+        Lookups and stores on the SQLite and file backends run in a worker
+        thread so their disk IO does not block the event loop.
+        """
+        key = completion_key(model, prompt, temperature)
+        text = await self._off_loop(self._lookup, key)
+        if text is None:
+            text = await create()
+            await self._off_loop(self._store, key, text)
+        return text
+
+    async def _off_loop(self, function, *args):
+        if isinstance(self.backend, MemoryBackend):
+            return function(*args)
+        return await asyncio.to_thread(function, *args)
+
+    def _lookup(self, key):
+        with self._lock:
+            entry = self._live_entry(key)
+            if entry is not None and len(entry["variants"]) >= self.variants:
+                text = entry["variants"][entry["next"] % len(entry["variants"])]
+                entry["next"] += 1
+                self.backend.put(key, entry)
+                self.hits += 1
+                metrics.record_cache("completion", True)
+                return text
+            self.misses += 1
+        metrics.record_cache("completion", False)
+        return None
+
+    def _store(self, key, text):
+        with self._lock:
+            entry = self._live_entry(key) or {
+                "variants": [], "next": 0, "expires_at": time.time() + self.ttl
+            }
+            if len(entry["variants"]) < self.variants:
+                entry["variants"].append(text)
+            self.backend.put(key, entry)
+            self.backend.evict(self.max_entries)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "entries": len(self.backend),
+            }
+
+    def _live_entry(self, key):
+        entry = self.backend.get(key)
+        if entry is not None and entry["expires_at"] < time.time():
+            self.backend.delete(key)
+            return None
+        return entry
+
+def make_completion_cache(backend=COMPLETION_CACHE, path=COMPLETION_CACHE_PATH):
+    """Build the configured completion cache, or None when caching is disabled"""
+    if not backend:
+        return None
+    if backend == "memory":
+        return CompletionCache(MemoryBackend())
+    if backend == "sqlite":
+        return CompletionCache(SQLiteBackend(path or os.path.join(_DATA_DIR, "completions.sqlite3")))
+    if backend == "files":
+        return CompletionCache(FileBackend(path or os.path.join(_DATA_DIR, "completions")))
+    raise ValueError(f"Unknown completion cache backend: {backend}")
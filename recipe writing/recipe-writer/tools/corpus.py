@@ -0,0 +1,256 @@
+import os
+import threading
+import time
+
+import numpy as np
+
+from config import *
+from tools import catalog, embeddings, metrics, section_library, shards, snapshots, startup, vector_store
+from tools.facets import FacetIndex
+from tools.lexical import HYBRID_SEARCH, LexicalIndex
+
+class Corpus:
+    """Everything a search needs, loaded together and never mutated afterwards"""
+
+    def __init__(self, recipes, index, id_to_recipe, facets, load_seconds=0.0, version=None,
+                 lexical=None, sections=None):
+        self.version = version
+        self.recipes = recipes
+        self.index = index
+        self.id_to_recipe = id_to_recipe
+        self.facets = facets
+        self.lexical = lexical
+        # Pre-written sections for fast articles (a SectionLibrary), if built
+        self.sections = sections
+        self.load_seconds = load_seconds
+        self.loaded_at = time.time()
+
+def load_corpus(snapshot=None, mmap_index=True, hybrid=HYBRID_SEARCH):
+    """Load embeddings (memory-mapped), the FAISS index and the facet index,
+    plus the lexical index when ``hybrid`` is set and the section library
+    when one was built. With ``FAISS_SHARDS`` set the index is a
+    ``shards.ShardedIndex`` whose shards are searched by worker processes.
+
+    Reads ``snapshot``, else the currently published snapshot, else the
+    unversioned files from ``config``.
+    """
+    start = time.perf_counter()
+    if snapshot is None:
+        snapshot = snapshots.current_snapshot()
+
+    if snapshot is not None:
+        print(f"Loading snapshot {snapshot.version}...")
+        recipes, id_to_recipe, facets = _load_recipes(
+            snapshot.matrix_path, snapshot.meta_path, snapshot.catalog_path
+        )
+        index = _load_index(snapshot.index_path, mmap_index)
+        sections = section_library.load_library(snapshot.sections_path)
+    else:
+        print("Loading recipes with embeddings...")
+        recipes, id_to_recipe, facets = _load_recipes(
+            embeddings.EMBEDDINGS_MATRIX, embeddings.EMBEDDINGS_META, catalog.CATALOG_PATH
+        )
+
+        print("Loading FAISS index...")
+        index = _load_index(FAISS_INDEX_FILE, mmap_index)
+        sections = section_library.load_library()
+    lexical = LexicalIndex(id_to_recipe) if hybrid else None
+
+    load_seconds = time.perf_counter() - start
+    metrics.observe_stage("corpus_load", load_seconds)
+    print(f"Loaded {len(recipes)} recipes in {load_seconds:.2f}s")
+    return Corpus(recipes, index, id_to_recipe, facets, load_seconds,
+                  snapshot.version if snapshot is not None else None, lexical, sections)
+
+def _load_index(path, mmap):
+    if shards.FAISS_SHARDS > 1:
+        print("Starting shard workers...")
+        index = shards.load_sharded_index(path, mmap=mmap)
+        if index.shards != shards.FAISS_SHARDS:
+            print(f"{shards.shard_dir(path)} was built with {index.shards} shards, "
+                  f"not FAISS_SHARDS={shards.FAISS_SHARDS}; rebuild the index to change it")
+        return index
+    return vector_store.load_faiss_index(path, mmap=mmap)
+
+def _load_recipes(matrix_path, meta_path, catalog_path):
+    """Return (recipes, id_to_recipe, facets).
+
+    With a catalog, recipes stay on disk: ``id_to_recipe`` is a
+    ``LazyRecipes`` over the catalog and the memory-mapped matrix (it also
+    serves as ``recipes``), and the facet index is built in SQL. Otherwise
+    every recipe is loaded into a dict.
+    """
+    if os.path.exists(catalog_path) and os.path.exists(matrix_path):
+        vectors = np.load(matrix_path, mmap_mode="r")
+        recipe_catalog = catalog.RecipeCatalog(catalog_path, readonly=True)
+        id_to_recipe = catalog.LazyRecipes(recipe_catalog, vectors)
+        if len(id_to_recipe) != vectors.shape[0]:
+            raise ValueError(
+                f"{catalog_path} has {len(id_to_recipe)} rows but {matrix_path} has {vectors.shape[0]}"
+            )
+        return id_to_recipe, id_to_recipe, FacetIndex.from_catalog(recipe_catalog, id_to_recipe.ids)
+
+    recipes = embeddings.load_embeddings(matrix_path, meta_path, catalog_path)
+    id_to_recipe = vector_store.get_id_to_recipe(recipes)
+    return recipes, id_to_recipe, FacetIndex(id_to_recipe)
+
+class CorpusLoader:
+    """Loads the corpus exactly once, however many threads ask for it.
+
+    ``start()`` loads in a background thread so a server can answer
+    liveness checks while it is still loading; ``get()`` blocks until the
+    corpus is available and returns None if loading failed (the next call
+    retries).
+
+    ``watch()`` polls for newly published snapshots; a new one is loaded in
+    the background and swapped in with a single reference assignment, so
+    requests that already hold the old corpus finish on it while new
+    requests get the new one.
+
+    The loaded snapshot version is pinned (``snapshots.pin_snapshot``) before
+    it is read, so syncs never prune the files this process serves from.
+
+    If the process forks while a background load or the watcher is running,
+    the child restarts them instead of waiting on a lock held by a thread
+    that no longer exists.
+    """
+
+    def __init__(self, load=load_corpus):
+        self._load = load
+        self._lock = threading.Lock()
+        self.corpus = None
+        self._swap_lock = threading.Lock()
+        self.state = "idle"
+        self.error = None
+        self.pending_version = None
+        self.failed_version = None
+        self.swaps = 0
+        self._watch_interval = None
+        self._watcher_pid = None
+        os.register_at_fork(after_in_child=self._after_fork)
+
+    def get(self):
+        corpus = self.corpus
+        if corpus is None:
+            with self._lock:
+                if self.corpus is None:
+                    self._load_locked()
+                corpus = self.corpus
+        return corpus
+
+    def start(self):
+        """Begin loading in a daemon thread"""
+        if self.corpus is None:
+            self.state = "loading"
+            threading.Thread(target=self.get, name="corpus-loader", daemon=True).start()
+
+    def refresh(self):
+        """Load and swap in the published snapshot if it differs from the active one.
+
+        Returns True if a new corpus was swapped in.
+        """
+        corpus = self.corpus
+        version = snapshots.current_version()
+        if corpus is None or version is None or version in (corpus.version, self.failed_version):
+            return False
+        if not self._swap_lock.acquire(blocking=False):
+            return False  # another refresh is already loading
+        try:
+            self.pending_version = version
+            self._pin(version)
+            new_corpus = self._load(snapshots.open_snapshot(version))
+            self.corpus = new_corpus
+            self.swaps += 1
+            self.error = None
+            print(f"Swapped in snapshot {version}")
+            return True
+        except Exception as e:
+            print(f"Error loading snapshot {version}: {e}")
+            self._pin(corpus.version)
+            self.failed_version = version
+            self.error = str(e)
+            return False
+        finally:
+            self.pending_version = None
+            self._swap_lock.release()
+
+    def watch(self, interval):
+        """Check for new snapshots every ``interval`` seconds in a daemon thread.
+
+        Starts at most one watcher per process; a forked child gets its own.
+        """
+        if self._watcher_pid == os.getpid():
+            return
+        self._watch_interval = interval
+        self._watcher_pid = os.getpid()
+
+        def poll():
+            while True:
+                time.sleep(interval)
+                try:
+                    self.refresh()
+                except Exception as e:
+                    print(f"Snapshot check failed: {e}")
+
+        threading.Thread(target=poll, name="snapshot-watcher", daemon=True).start()
+
+    @property
+    def ready(self):
+        return self.corpus is not None
+
+    def status(self):
+        corpus = self.corpus
+        status = {"state": self.state, "ready": corpus is not None}
+        if corpus is not None:
+            status.update({
+                "version": corpus.version,
+                "recipes": len(corpus.recipes),
+                "vectors": corpus.index.ntotal,
+                "shards": getattr(corpus.index, "shards", 1),
+                "sections": len(corpus.sections) if corpus.sections is not None else 0,
+                "load_seconds": round(corpus.load_seconds, 3),
+                "loaded_at": corpus.loaded_at,
+            })
+        if self.pending_version:
+            status["pending_version"] = self.pending_version
+        if self.swaps:
+            status["swaps"] = self.swaps
+        if self.error:
+            status["error"] = self.error
+        return status
+
+    def _load_locked(self):
+        self.state = "loading"
+        try:
+            version = snapshots.current_version()
+            if version is None:
+                self.corpus = self._load()
+            else:
+                self._pin(version)
+                self.corpus = self._load(snapshots.open_snapshot(version))
+            self.state = "ready"
+            self.error = None
+            startup.mark("corpus_loaded")
+        except Exception as e:
+            print(f"Error loading recipe data: {e}")
+            self.state = "failed"
+            self.error = str(e)
+
+    def _pin(self, version):
+        if version is None:
+            return
+        try:
+            snapshots.pin_snapshot(version)
+        except OSError as e:
+            print(f"Could not pin snapshot {version}: {e}")
+
+    def _after_fork(self):
+        if self.corpus is not None:
+            self._pin(self.corpus.version)
+        self._lock = threading.Lock()
+        self._swap_lock = threading.Lock()
+        self.pending_version = None
+        if self.corpus is None and self.state == "loading":
+            self.start()
+        if self._watch_interval:
+            self.watch(self._watch_interval)
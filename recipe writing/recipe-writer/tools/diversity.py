@@ -0,0 +1,60 @@
+import numpy as np
+
+import config
+from tools.catalog import get_vectors
+
+# Diversify search results with maximal marginal relevance
+MMR_ENABLED = getattr(config, "MMR_ENABLED", False)
+# 1.0 ranks purely by relevance, 0.0 purely by novelty
+MMR_LAMBDA = getattr(config, "MMR_LAMBDA", 0.7)
+# Candidates fetched per requested result before diversifying
+MMR_FETCH_MULTIPLIER = getattr(config, "MMR_FETCH_MULTIPLIER", 4)
+# Candidates at least this cosine-similar to an already chosen recipe are dropped
+MMR_DUPLICATE_THRESHOLD = getattr(config, "MMR_DUPLICATE_THRESHOLD", 0.95)
+
+def _normalize(vectors):
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+def mmr(query_vector, vectors, k, lambda_mult=MMR_LAMBDA, duplicate_threshold=MMR_DUPLICATE_THRESHOLD):
+    """Positions of up to ``k`` rows of ``vectors`` chosen by maximal marginal relevance.
+
+    Relevance is cosine similarity to the query and redundancy the highest
+    cosine similarity to any row already chosen. Both come from two matrix
+    products up front. Each of the ``k`` picks is then one vectorized
+    update over all candidates. Candidates at or above
+    ``duplicate_threshold`` similarity to a chosen row are dropped, so
+    fewer than ``k`` positions may come back when the pool is full of
+    near-duplicates.
+    """
+    if len(vectors) == 0 or k <= 0:
+        return np.empty(0, dtype="int64")
+    vectors = _normalize(np.asarray(vectors, dtype="float32"))
+    query = _normalize(np.asarray(query_vector, dtype="float32").reshape(-1))
+    relevance = vectors @ query
+    similarity = vectors @ vectors.T
+
+    selected = []
+    redundancy = np.full(len(vectors), -np.inf, dtype="float32")
+    available = np.ones(len(vectors), dtype=bool)
+    while len(selected) < k and available.any():
+        if selected:
+            scores = lambda_mult * relevance - (1 - lambda_mult) * redundancy
+        else:
+            scores = relevance.copy()
+        scores[~available] = -np.inf
+        best = int(np.argmax(scores))
+        selected.append(best)
+        available[best] = False
+        np.maximum(redundancy, similarity[best], out=redundancy)
+        available &= redundancy < duplicate_threshold
+    return np.array(selected, dtype="int64")
+
+def diversify(ids, query_vector, k, id_to_recipe, lambda_mult=MMR_LAMBDA,
+              duplicate_threshold=MMR_DUPLICATE_THRESHOLD):
+    """Reduce ranked candidate ``ids`` to at most ``k`` diverse ones, most relevant first"""
+    ids = np.asarray(ids, dtype="int64")
+    if len(ids) == 0:
+        return ids
+    vectors = get_vectors(id_to_recipe, ids)
+    return ids[mmr(query_vector, vectors, k, lambda_mult, duplicate_threshold)]
@@ -0,0 +1,183 @@
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+import config
+from config import *
+from tools import metrics
+
+# In-process tier: number of query vectors kept and how long they stay fresh (seconds)
+QUERY_CACHE_SIZE = getattr(config, "QUERY_CACHE_SIZE", 1024)
+QUERY_CACHE_TTL = getattr(config, "QUERY_CACHE_TTL", 24 * 60 * 60)
+# On-disk tier: directory of .npy files, set to None to disable
+QUERY_CACHE_DIR = getattr(
+    config, "QUERY_CACHE_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(EMBEDDINGS_JSON)), "query_cache")
+)
+# Most vectors kept on disk; the oldest are removed first. Files older than
+# QUERY_CACHE_TTL are never read and are removed by the same sweep.
+QUERY_CACHE_DISK_ENTRIES = getattr(config, "QUERY_CACHE_DISK_ENTRIES", 100_000)
+
+def normalize_query(query):
+    """Case- and whitespace-insensitive form of a query used for cache keys"""
+    return " ".join(query.lower().split())
+
+class QueryEmbeddingCache:
+    """Two-tier cache for query embeddings.
+
+    Lookups hit an in-process LRU first, then a persistent directory of
+    float32 ``.npy`` files keyed by the normalized query and embedding model.
+    Disk hits are promoted into memory. Both tiers expire entries ``ttl``
+    seconds after they were written (file mtime on disk), and the directory
+    is swept back to ``disk_entries`` files after every ``disk_entries // 10``
+    writes. ``stats()`` reports hit/miss counters.
+    """
+
+    def __init__(self, max_size=QUERY_CACHE_SIZE, ttl=QUERY_CACHE_TTL,
+                 directory=QUERY_CACHE_DIR, model=EMBEDDING_MODEL,
+                 disk_entries=QUERY_CACHE_DISK_ENTRIES):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.directory = directory
+        self.model = model
+        self.disk_entries = disk_entries
+        self._writes = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def key(self, query):
+        text = f"{self.model}\n{normalize_query(query)}"
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    def get(self, query):
+        """Return the cached float32 vector for ``query`` or None"""
+        key = self.key(query)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                vector, stored_at = entry
+                if time.monotonic() - stored_at <= self.ttl:
+                    self._entries.move_to_end(key)
+                    self.memory_hits += 1
+                    metrics.record_cache("query_embedding", True)
+                    return vector
+                del self._entries[key]
+
+        vector, age = self._read(key)
+        with self._lock:
+            if vector is None:
+                self.misses += 1
+                metrics.record_cache("query_embedding", False)
+                return None
+            self.disk_hits += 1
+            # Keep the original write time so promotion doesn't extend the TTL
+            self._remember(key, vector, age)
+        metrics.record_cache("query_embedding", True)
+        return vector
+
+    def put(self, query, vector):
+        vector = np.asarray(vector, dtype="float32")
+        key = self.key(query)
+        with self._lock:
+            self._remember(key, vector)
+        self._write(key, vector)
+        return vector
+
+    def stats(self):
+        with self._lock:
+            lookups = self.memory_hits + self.disk_hits + self.misses
+            return {
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0,
+                "memory_entries": len(self._entries),
+            }
+
+    def clear(self):
+        """Drop the in-process tier and reset counters (the disk tier is kept)"""
+        with self._lock:
+            self._entries.clear()
+            self.memory_hits = self.disk_hits = self.misses = 0
+
+    def _remember(self, key, vector, age=0.0):
+        self._entries[key] = (vector, time.monotonic() - age)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], f"{key}.npy")
+
+    def _read(self, key):
+        """Return ``(vector, age in seconds)`` from disk, or ``(None, None)``"""
+        if not self.directory:
+            return None, None
+        path = self._path(key)
+        try:
+            age = max(0.0, time.time() - os.path.getmtime(path))
+            if age > self.ttl:
+                os.remove(path)
+                return None, None
+            return np.load(path).astype("float32", copy=False), age
+        except (OSError, ValueError):
+            return None, None
+
+    def _write(self, key, vector):
+        if not self.directory:
+            return
+        path = self._path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "wb") as f:
+                np.save(f, vector)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"Could not persist query embedding: {e}")
+            return
+        with self._lock:
+            self._writes += 1
+            if self._writes < max(1, self.disk_entries // 10):
+                return
+            self._writes = 0
+        self.prune()
+
+    def prune(self):
+        """Remove expired files, then the oldest ones beyond ``disk_entries``"""
+        if not self.directory:
+            return 0
+        now = time.time()
+        files = []
+        try:
+            shards = [e.path for e in os.scandir(self.directory) if e.is_dir()]
+        except OSError:
+            return 0
+        for shard in shards:
+            try:
+                for entry in os.scandir(shard):
+                    if entry.name.endswith(".npy"):
+                        try:
+                            files.append((entry.stat().st_mtime, entry.path))
+                        except OSError:
+                            pass
+            except OSError:
+                pass
+        files.sort()
+        stale = [path for mtime, path in files if now - mtime > self.ttl]
+        fresh = files[len(stale):]
+        stale += [path for _, path in fresh[:max(0, len(fresh) - self.disk_entries)]]
+        removed = 0
+        for path in stale:
+            try:
+                os.remove(path)
+                removed += 1
+            except OSError:
+                pass
+        return removed
@@ -1,33 +1,298 @@
+import base64
+import hashlib
 import json
 import time
 import os
-from openai import OpenAI
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import numpy as np
+import config
 from config import *
+from tools import catalog, clients, metrics
+from tools.rate_limit import RateLimiter, retry_after
 
-client = OpenAI(api_key=OPENAI_API_KEY)
-
-def generate_embeddings(recipes):
-    """Generate embeddings for all recipes in batches."""
-    if "embedding" in recipes[0]:
-        return recipes  # already embedded
-
-    for i in range(0, len(recipes), BATCH_SIZE):
-        batch = recipes[i:i+BATCH_SIZE]
-        texts = [
-            r["title"] + " " + r["description"] + " " + " ".join(r.get("tags", []))
-            for r in batch
-        ]
-        resp = client.embeddings.create(input=texts, model=EMBEDDING_MODEL)
-        for j, r in enumerate(batch):
-            r["embedding"] = resp.data[j].embedding
-        print(f"Processed batch {i}-{i+len(batch)}")
-        time.sleep(1)  # avoid rate limits
+try:
+    import tiktoken
+except ImportError:  # optional: token counts fall back to a length estimate
+    tiktoken = None
+
+# Binary embedding store: float32 matrix (.npy, memory-mapped on load) plus
+# row-aligned recipe metadata without the vectors
+EMBEDDINGS_MATRIX = getattr(config, "EMBEDDINGS_MATRIX", os.path.splitext(EMBEDDINGS_JSON)[0] + ".npy")
+EMBEDDINGS_META = getattr(config, "EMBEDDINGS_META", os.path.splitext(EMBEDDINGS_JSON)[0] + ".meta.json")
+
+# Completed batches are appended here so an interrupted run can resume
+EMBEDDINGS_CHECKPOINT = getattr(config, "EMBEDDINGS_CHECKPOINT", os.path.splitext(EMBEDDINGS_JSON)[0] + ".checkpoint.jsonl")
+# Embedding requests in flight at once
+EMBEDDING_CONCURRENCY = getattr(config, "EMBEDDING_CONCURRENCY", 4)
+# Batches are packed up to this many tokens (and at most 2048 inputs)
+EMBEDDING_BATCH_TOKENS = getattr(config, "EMBEDDING_BATCH_TOKENS", 100_000)
+EMBEDDING_BATCH_MAX_INPUTS = 2048
+# Starting rate limits; adjusted from the API's x-ratelimit-* headers
+EMBEDDING_TOKENS_PER_MINUTE = getattr(config, "EMBEDDING_TOKENS_PER_MINUTE", 1_000_000)
+EMBEDDING_REQUESTS_PER_MINUTE = getattr(config, "EMBEDDING_REQUESTS_PER_MINUTE", 3_000)
+EMBEDDING_MAX_RETRIES = getattr(config, "EMBEDDING_MAX_RETRIES", 8)
+
+def embedding_text(recipe):
+    """Text that gets embedded for a recipe"""
+    return recipe["title"] + " " + recipe["description"] + " " + " ".join(recipe.get("tags", []))
+
+def content_hash(recipe):
+    """Hash of the fields that determine a recipe's embedding"""
+    payload = json.dumps(
+        [recipe.get("title", ""), recipe.get("description", ""), recipe.get("tags", [])],
+        ensure_ascii=False
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+def assign_ids(recipes, taken=()):
+    """Give every recipe a stable 63-bit ``faiss_id``.
+
+    The id is derived from the Airtable record id (falling back to URL, then
+    title), so a recipe keeps its index id across syncs and edits. Recipes
+    that already have one (e.g. read from the sync catalog) keep it, and new
+    ids avoid those and ``taken``.
+    """
+    seen = set(taken)
+    seen.update(r["faiss_id"] for r in recipes if "faiss_id" in r)
+    for r in recipes:
+        if "faiss_id" in r:
+            continue
+        key = str(r.get("id") or r.get("url") or r.get("title", ""))
+        candidate, n = key, 0
+        while True:
+            digest = hashlib.sha256(candidate.encode("utf-8")).digest()
+            faiss_id = int.from_bytes(digest[:8], "big") & 0x7FFFFFFFFFFFFFFF
+            if faiss_id not in seen:
+                break
+            n += 1
+            candidate = f"{key}#{n}"
+        seen.add(faiss_id)
+        r["faiss_id"] = faiss_id
+    return recipes
+
+def generate_embeddings(recipes, previous=None, checkpoint_path=EMBEDDINGS_CHECKPOINT,
+                        concurrency=EMBEDDING_CONCURRENCY):
+    """Generate embeddings for new or edited recipes.
+
+    Vectors are carried forward from ``previous`` (e.g. the output of
+    ``load_embeddings``), from recipes that already carry an embedding and
+    from the checkpoint of an interrupted run, matched by ``content_hash``;
+    only recipes whose hash is unknown are sent to the API.
+
+    Pending recipes are packed into batches by token count and sent
+    ``concurrency`` at a time under a rate limiter that follows the API's
+    rate-limit headers and backs off on 429s. Each finished batch is
+    appended to ``checkpoint_path``; call ``clear_checkpoint`` once the
+    results are saved.
+    """
+    known = load_checkpoint(checkpoint_path)
+    for r in (previous or []):
+        if "embedding" in r:
+            known[r.get("content_hash") or content_hash(r)] = r["embedding"]
+
+    pending = []
+    for r in recipes:
+        r["content_hash"] = content_hash(r)
+        if "embedding" in r:
+            continue
+        if r["content_hash"] in known:
+            r["embedding"] = known[r["content_hash"]]
+        else:
+            pending.append(r)
+    assign_ids(recipes)
+
+    print(f"Reusing {len(recipes) - len(pending)} embeddings, embedding {len(pending)} new or changed recipes")
+    if not pending:
+        return recipes
+
+    # Identical texts only need embedding once
+    by_hash = {}
+    for r in pending:
+        by_hash.setdefault(r["content_hash"], []).append(r)
+    batches = pack_batches([group[0] for group in by_hash.values()])
+    limiter = RateLimiter(EMBEDDING_TOKENS_PER_MINUTE, EMBEDDING_REQUESTS_PER_MINUTE)
+    checkpoint_lock = threading.Lock()
+    done = 0
+
+    with open(checkpoint_path, "a") as checkpoint, \
+            ThreadPoolExecutor(max_workers=concurrency) as pool:
+        futures = {pool.submit(_embed_batch, batch, tokens, limiter): batch
+                   for batch, tokens in batches}
+        for future in as_completed(futures):
+            batch = futures[future]
+            vectors = future.result()
+            for r, vector in zip(batch, vectors):
+                for same in by_hash[r["content_hash"]]:
+                    same["embedding"] = vector
+            with checkpoint_lock:
+                _append_checkpoint(checkpoint, batch, vectors)
+            done += len(batch)
+            print(f"Embedded {done}/{len(by_hash)} recipes")
     return recipes
 
-def save_embeddings(recipes, path=EMBEDDINGS_JSON):
-    with open(path, "w") as f:
-        json.dump(recipes, f)
+def count_tokens(text, model=EMBEDDING_MODEL):
+    """Tokens in ``text`` for ``model``'s tokenizer (estimated at ~4 characters
+    per token without tiktoken)"""
+    if tiktoken is None:
+        return len(text) // 4 + 1
+    return len(_encoding(model).encode(text))
+
+_encoding_cache = {}
+
+def _encoding(model):
+    if model not in _encoding_cache:
+        try:
+            _encoding_cache[model] = tiktoken.encoding_for_model(model)
+        except KeyError:
+            _encoding_cache[model] = tiktoken.get_encoding("cl100k_base")
+    return _encoding_cache[model]
+
+def pack_batches(recipes, max_tokens=EMBEDDING_BATCH_TOKENS, max_inputs=EMBEDDING_BATCH_MAX_INPUTS):
+    """Group recipes into (batch, token_count) pairs of at most ``max_tokens`` tokens"""
+    batches, batch, batch_tokens = [], [], 0
+    for r in recipes:
+        tokens = count_tokens(embedding_text(r))
+        if batch and (batch_tokens + tokens > max_tokens or len(batch) >= max_inputs):
+            batches.append((batch, batch_tokens))
+            batch, batch_tokens = [], 0
+        batch.append(r)
+        batch_tokens += tokens
+    if batch:
+        batches.append((batch, batch_tokens))
+    return batches
+
+def _embed_batch(batch, tokens, limiter):
+    import openai
+
+    texts = [embedding_text(r) for r in batch]
+    # Retries are handled here so the limiter sees every 429
+    api = clients.get_client().with_options(max_retries=0).embeddings
+    for attempt in range(EMBEDDING_MAX_RETRIES + 1):
+        limiter.acquire(tokens)
+        try:
+            raw = api.with_raw_response.create(input=texts, model=EMBEDDING_MODEL)
+        except openai.RateLimitError as e:
+            if attempt == EMBEDDING_MAX_RETRIES:
+                raise
+            delay = retry_after(e.response.headers, default=min(60.0, 2 ** attempt))
+            print(f"Rate limited, pausing {delay:.1f}s")
+            limiter.pause(delay)
+            continue
+        except (openai.APIConnectionError, openai.InternalServerError):
+            if attempt == EMBEDDING_MAX_RETRIES:
+                raise
+            time.sleep(min(60.0, 2 ** attempt))
+            continue
+        limiter.update(raw.headers)
+        resp = raw.parse()
+        metrics.record_tokens(EMBEDDING_MODEL, resp.usage)
+        return [d.embedding for d in sorted(resp.data, key=lambda d: d.index)]
+
+def load_checkpoint(path=EMBEDDINGS_CHECKPOINT):
+    """Vectors by content hash saved by an interrupted ``generate_embeddings`` run"""
+    known = {}
+    try:
+        with open(path) as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue  # partially written last line
+                if entry.get("model") != EMBEDDING_MODEL:
+                    continue
+                vectors = np.frombuffer(base64.b64decode(entry["vectors"]), dtype="float32")
+                vectors = vectors.reshape(len(entry["hashes"]), -1)
+                known.update(zip(entry["hashes"], vectors))
+    except FileNotFoundError:
+        pass
+    return known
+
+def clear_checkpoint(path=EMBEDDINGS_CHECKPOINT):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+def _append_checkpoint(f, batch, vectors):
+    entry = {
+        "model": EMBEDDING_MODEL,
+        "hashes": [r["content_hash"] for r in batch],
+        "vectors": base64.b64encode(np.asarray(vectors, dtype="float32").tobytes()).decode("ascii"),
+    }
+    f.write(json.dumps(entry) + "\n")
+    f.flush()
+
+def save_embeddings(recipes, matrix_path=EMBEDDINGS_MATRIX, meta_path=EMBEDDINGS_META,
+                    catalog_path=catalog.CATALOG_PATH, source_catalog=None):
+    """Save recipes with embeddings as a float32 matrix plus row-aligned metadata.
+
+    The metadata goes to the SQLite catalog at ``catalog_path`` when
+    ``RECIPE_CATALOG`` is on, else to the JSON file at ``meta_path``; the
+    other one is removed so readers never pick up a stale copy. With
+    ``source_catalog`` (the catalog ``recipes`` were read from, e.g. the
+    sync's) that file is copied instead of writing every recipe again.
+    """
+    vectors = np.asarray([r["embedding"] for r in recipes], dtype="float32")
+
+    tmp_matrix = f"{matrix_path}.tmp"
+    with open(tmp_matrix, "wb") as f:
+        np.save(f, vectors)
+    if catalog.RECIPE_CATALOG:
+        meta, stale = catalog_path, meta_path
+        if source_catalog:
+            catalog.copy_catalog(source_catalog, f"{meta}.tmp", [r["faiss_id"] for r in recipes])
+        else:
+            catalog.write_catalog(recipes, f"{meta}.tmp")
+    else:
+        meta, stale = meta_path, catalog_path
+        metadata = [{k: v for k, v in r.items() if k != "embedding"} for r in recipes]
+        with open(f"{meta}.tmp", "w") as f:
+            json.dump(metadata, f, separators=(",", ":"))
+    os.replace(tmp_matrix, matrix_path)
+    os.replace(f"{meta}.tmp", meta)
+    if os.path.exists(stale):
+        os.remove(stale)
+
+def load_embedding_store(matrix_path=EMBEDDINGS_MATRIX, meta_path=EMBEDDINGS_META,
+                         catalog_path=catalog.CATALOG_PATH):
+    """Return (vectors, metadata): a read-only memory-mapped float32 matrix and its recipe rows.
+
+    Metadata comes from the catalog at ``catalog_path`` if there is one,
+    else from the JSON file at ``meta_path``.
+    """
+    vectors = np.load(matrix_path, mmap_mode="r")
+    if os.path.exists(catalog_path):
+        meta_path = catalog_path
+        metadata = catalog.read_catalog(catalog_path)
+    else:
+        with open(meta_path) as f:
+            metadata = json.load(f)
+    if len(metadata) != vectors.shape[0]:
+        raise ValueError(
+            f"{meta_path} has {len(metadata)} rows but {matrix_path} has {vectors.shape[0]}"
+        )
+    return vectors, metadata
+
+def load_embeddings(matrix_path=EMBEDDINGS_MATRIX, meta_path=EMBEDDINGS_META,
+                    catalog_path=catalog.CATALOG_PATH):
+    """Load recipes with embeddings.
+
+    Each recipe's ``embedding`` is a row view into the memory-mapped matrix,
+    so no vector data is copied. Falls back to the legacy JSON file if the
+    binary store has not been created yet.
+    """
+    if not os.path.exists(matrix_path) and os.path.exists(EMBEDDINGS_JSON):
+        print(f"Binary embedding store not found, loading {EMBEDDINGS_JSON} "
+              "(run scripts/convert_embeddings.py to convert it)")
+        return load_embeddings_json()
+
+    vectors, recipes = load_embedding_store(matrix_path, meta_path, catalog_path)
+    for recipe, vector in zip(recipes, vectors):
+        recipe["embedding"] = vector
+    return recipes
 
-def load_embeddings(path=EMBEDDINGS_JSON):
+def load_embeddings_json(path=EMBEDDINGS_JSON):
+    """Load recipes from the legacy JSON format with inline embedding lists"""
     with open(path) as f:
         return json.load(f)
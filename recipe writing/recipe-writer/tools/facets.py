@@ -0,0 +1,77 @@
+from functools import lru_cache
+
+import numpy as np
+
+def normalize_filters(category=None, tags=None):
+    """Hashable ``(category, tags)`` form of search filters.
+
+    ``category`` becomes a lower-case string or None; ``tags`` may be one
+    string or a list of strings and becomes a sorted tuple of distinct
+    lower-case tags (empty when unset). Other types raise ValueError.
+    """
+    if category is not None and not isinstance(category, str):
+        raise ValueError("category must be a string")
+    if isinstance(tags, str):
+        tags = [tags]
+    elif tags is None:
+        tags = []
+    elif not isinstance(tags, (list, tuple)) or not all(isinstance(tag, str) for tag in tags):
+        raise ValueError("tags must be a string or a list of strings")
+    return category.lower() if category else None, tuple(sorted({tag.lower() for tag in tags}))
+
+class FacetIndex:
+    """Inverted index from category and tag values to recipe ids.
+
+    Built once per corpus so filtered searches can look up the matching ids
+    instead of scanning every recipe. Matching follows ``search_recipes``:
+    ``category`` is a case-insensitive substring of the recipe's category
+    string and any one of ``tags`` must equal one of the recipe's tags.
+    """
+
+    def __init__(self, id_to_recipe):
+        categories, tags = {}, {}
+        for recipe_id, r in id_to_recipe.items():
+            categories.setdefault(r.get("category", "").lower(), []).append(recipe_id)
+            for tag in r.get("tags", []):
+                tags.setdefault(tag.lower(), []).append(recipe_id)
+
+        self._setup(
+            np.array(sorted(id_to_recipe), dtype="int64"),
+            {k: np.unique(np.array(v, dtype="int64")) for k, v in categories.items()},
+            {k: np.unique(np.array(v, dtype="int64")) for k, v in tags.items()},
+        )
+
+    @classmethod
+    def from_catalog(cls, catalog, all_ids):
+        """Build from a ``RecipeCatalog`` without loading its recipes"""
+        index = cls.__new__(cls)
+        index._setup(np.asarray(all_ids, dtype="int64"), *catalog.facet_postings())
+        return index
+
+    def _setup(self, all_ids, categories, tags):
+        self.all_ids = all_ids
+        self.categories = categories
+        self.tags = tags
+        self._select = lru_cache(maxsize=512)(self._compute)
+
+    def select(self, category=None, tags=None):
+        """Sorted int64 array of ids matching the filters"""
+        category, tags = normalize_filters(category, tags)
+        return self._select(category, tags or None)
+
+    def _compute(self, category, tags):
+        ids = self.all_ids
+        if category:
+            # Distinct category strings are few, so substring matching stays cheap
+            ids = self._union([v for k, v in self.categories.items() if category in k])
+        if tags:
+            ids = np.intersect1d(ids, self._union([self.tags[t] for t in tags if t in self.tags]),
+                                 assume_unique=True)
+        ids.setflags(write=False)
+        return ids
+
+    @staticmethod
+    def _union(arrays):
+        if not arrays:
+            return np.empty(0, dtype="int64")
+        return np.unique(np.concatenate(arrays))
@@ -1,8 +1,24 @@
-from openai import OpenAI
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import asyncio
+import hashlib
+import config
 from config import *
+from tools import clients, metrics
+from tools.completion_cache import make_completion_cache
+from tools.embeddings import content_hash, count_tokens
+import json
 import re
 
-client = OpenAI(api_key=OPENAI_API_KEY)
+# Maximum number of section prompts in flight for one article
+GENERATION_CONCURRENCY = getattr(config, "GENERATION_CONCURRENCY", 8)
+# Write several recipe sections per call, returned as JSON keyed by recipe
+SECTION_BATCHING = getattr(config, "SECTION_BATCHING", False)
+# Token budget of one batched call: its prompt plus the sections it should return
+SECTION_BATCH_TOKENS = getattr(config, "SECTION_BATCH_TOKENS", 4000)
+# Expected completion tokens of one recipe section, used to size batches
+SECTION_TOKENS_PER_RECIPE = getattr(config, "SECTION_TOKENS_PER_RECIPE", 350)
+
+completion_cache = make_completion_cache()
 
 def extract_cuisine(query):
     """Extract cuisine type from query"""
@@ -25,29 +41,374 @@ def extract_cuisine(query):
             return cuisine
     return 'international'
 
-def extract_number(query):
+def extract_number(query, recipes_list=()):
     """Extract number from query"""
     numbers = re.findall(r'\d+', query)
     return int(numbers[0]) if numbers else len(recipes_list)
 
-def generate_professional_article(query, recipes_list):
-    """Generate a professional article using template-based approach"""
-    cuisine = extract_cuisine(query)
-    number = extract_number(query)
-    
-    # Generate each section
-    intro = generate_intro(query, cuisine, number)
-    recipe_sections = generate_recipe_sections(recipes_list, cuisine)
-    cooking_tips = generate_cooking_tips(cuisine)
-    conclusion = generate_conclusion(query, cuisine, number)
-    
+def generate_professional_article(query, recipes_list, max_concurrency=None, library=None):
+    """Generate a professional article using template-based approach.
+
+    Every section prompt is independent, so they are sent concurrently
+    (at most ``max_concurrency`` in flight, default ``GENERATION_CONCURRENCY``)
+    and reassembled in article order. With a ``SectionLibrary`` as
+    ``library`` (fast mode), recipe sections and cooking tips stored there
+    are reused and only the rest are written.
+    """
+    return assemble_article(run_sections(article_sections(query, recipes_list, library), max_concurrency))
+
+async def agenerate_professional_article(query, recipes_list, client=None, max_concurrency=None,
+                                         library=None):
+    """Async ``generate_professional_article``.
+
+    Section prompts run as coroutines on the shared AsyncOpenAI client (or
+    ``client``), at most ``max_concurrency`` in flight, so no thread is held
+    while waiting on the API.
+    """
+    sections = article_sections(query, recipes_list, library)
+    return assemble_article(await arun_sections(sections, client, max_concurrency))
+
+def generate_professional_articles(articles, max_concurrency=None, library=None):
+    """Generate several articles from (query, recipes_list) pairs.
+
+    All of their section prompts share one pool, so a batch costs about as
+    much wall time as its slowest sections rather than the sum of articles.
+    """
+    sections, counts = [], []
+    for query, recipes_list in articles:
+        article = article_sections(query, recipes_list, library)
+        sections.extend(article)
+        counts.append(len(article))
+
+    html = run_sections(sections, max_concurrency)
+    results, start = [], 0
+    for count in counts:
+        results.append(assemble_article(html[start:start + count]))
+        start += count
+    return results
+
+def assemble_article(sections):
+    """Join section HTML from ``article_sections`` order into the article"""
+    with metrics.span("html_assembly"):
+        return _assemble_article(sections)
+
+def _assemble_article(sections):
+    intro, recipe_sections, cooking_tips, conclusion = (
+        sections[0], sections[1:-2], sections[-2], sections[-1]
+    )
+
     # Combine all sections
+    recipe_sections = "\n\n".join(recipe_sections)
     article_content = f"{intro}\n\n{recipe_sections}\n\n{cooking_tips}\n\n{conclusion}"
     return article_content
 
-def generate_intro(query, cuisine, number):
-    """Generate compelling introduction"""
-    prompt = f"""
+def article_sections(query, recipes_list, library=None):
+    """Return the article's sections in order as (kind, prompt, format, batch) tuples.
+
+    ``format`` turns the raw completion for ``prompt`` into the section's HTML.
+    ``batch`` is (recipe, cuisine) for recipe sections, which may share a
+    batched call (see ``plan_calls``), and None for the others. Sections
+    found in ``library`` have no prompt; their ``format`` ignores its
+    argument and renders the stored text.
+    """
+    cuisine = extract_cuisine(query)
+    number = extract_number(query, recipes_list)
+    stored = _stored_sections(library, recipes_list, cuisine)
+
+    sections = [("intro", _intro_prompt(query, cuisine, number),
+                 lambda content: _format_intro(query, content), None)]
+    sections.extend(_recipe_sections(recipes_list, cuisine, stored))
+    tips = stored.get(library_key("tips", None, cuisine))
+    if tips is not None:
+        sections.append(("tips", None, lambda _: _format_cooking_tips(cuisine, tips), None))
+    else:
+        sections.append(("tips", _cooking_tips_prompt(cuisine),
+                         lambda content: _format_cooking_tips(cuisine, content), None))
+    sections.append(("conclusion", _conclusion_prompt(query, cuisine, number), _as_html, None))
+    return sections
+
+def _recipe_sections(recipes_list, cuisine, stored=None):
+    sections = []
+    for recipe in recipes_list:
+        text = (stored or {}).get(library_key("recipe", recipe, cuisine))
+        if text is not None:
+            sections.append(("recipe", None,
+                             lambda _, recipe=recipe, text=text: _format_recipe_section(recipe, text),
+                             None))
+        else:
+            sections.append(("recipe", _recipe_prompt(recipe, cuisine),
+                             lambda content, recipe=recipe: _format_recipe_section(recipe, content),
+                             (recipe, cuisine)))
+    return sections
+
+def _stored_sections(library, recipes_list, cuisine):
+    if library is None:
+        return {}
+    keys = [library_key("recipe", recipe, cuisine) for recipe in recipes_list]
+    keys.append(library_key("tips", None, cuisine))
+    with metrics.span("section_library"):
+        return library.lookup(keys)
+
+def library_key(kind, recipe, cuisine):
+    """(kind, content_hash, cuisine, prompt_hash) of a section the library can store.
+
+    ``kind`` is "recipe" or "tips" (``recipe`` None, empty content hash).
+    """
+    if kind == "recipe":
+        prompt, recipe_hash = _recipe_prompt(recipe, cuisine), recipe.get("content_hash") or content_hash(recipe)
+    else:
+        prompt, recipe_hash = _cooking_tips_prompt(cuisine), ""
+    return kind, recipe_hash, cuisine, hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+
+def library_texts(items, max_concurrency=None):
+    """Raw completion text for (kind, recipe, cuisine) library items, in order.
+
+    Uses the same prompts, batching and completion cache as live articles.
+    """
+    sections = [
+        ("recipe", _recipe_prompt(recipe, cuisine), _raw, (recipe, cuisine)) if kind == "recipe"
+        else ("tips", _cooking_tips_prompt(cuisine), _raw, None)
+        for kind, recipe, cuisine in items
+    ]
+    return run_sections(sections, max_concurrency)
+
+def _raw(content):
+    return content
+
+def plan_calls(sections, batching=None, max_tokens=None):
+    """Group section positions into LLM calls, returned as lists of positions.
+
+    Each section is its own call unless batching is on
+    (``SECTION_BATCHING``). Then recipe sections of one cuisine share calls,
+    packed in order while the batch prompt plus ``SECTION_TOKENS_PER_RECIPE``
+    per recipe stays within ``max_tokens`` (``SECTION_BATCH_TOKENS``).
+    Prompts are counted with ``LLM_MODEL``'s tokenizer; without tiktoken
+    the count is a character estimate, so the budget is approximate and
+    should leave headroom below the model's limits.
+    """
+    batching = SECTION_BATCHING if batching is None else batching
+    max_tokens = max_tokens or SECTION_BATCH_TOKENS
+    calls, by_cuisine = [], {}
+    # Stored sections (no prompt) are single "calls" that format their text
+    for position, (_, _, _, batch) in enumerate(sections):
+        if batching and batch is not None:
+            by_cuisine.setdefault(batch[1], []).append(position)
+        else:
+            calls.append([position])
+
+    for cuisine, positions in by_cuisine.items():
+        base = count_tokens(_recipe_batch_prompt([], cuisine), LLM_MODEL)
+        call, used = [], base
+        for position in positions:
+            recipe = sections[position][3][0]
+            cost = count_tokens(_recipe_batch_entry(len(call) + 1, recipe), LLM_MODEL) + SECTION_TOKENS_PER_RECIPE
+            if call and used + cost > max_tokens:
+                calls.append(call)
+                call, used = [], base
+            call.append(position)
+            used += cost
+        calls.append(call)
+    return calls
+
+def run_sections(sections, max_concurrency=None):
+    """Complete section prompts concurrently and return their HTML in order."""
+    if not sections:
+        return []
+    calls = plan_calls(sections)
+    html = [None] * len(sections)
+    workers = min(max_concurrency or GENERATION_CONCURRENCY, len(calls))
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(metrics.in_context(_run_call), sections, positions)
+                   for positions in calls]
+        for positions, future in zip(calls, futures):
+            for position, section_html in zip(positions, future.result()):
+                html[position] = section_html
+    return html
+
+async def arun_sections(sections, client=None, max_concurrency=None):
+    """Async ``run_sections``: complete section prompts concurrently, HTML in order."""
+    semaphore = asyncio.Semaphore(max_concurrency or GENERATION_CONCURRENCY)
+
+    async def run(positions):
+        async with semaphore:
+            return positions, await _arun_call(sections, positions, client)
+
+    html = [None] * len(sections)
+    for positions, results in await asyncio.gather(*(run(p) for p in plan_calls(sections))):
+        for position, section_html in zip(positions, results):
+            html[position] = section_html
+    return html
+
+def iter_article_sections(query, recipes_list, max_concurrency=None, library=None):
+    """Yield (position, kind, html) for each article section as it finishes.
+
+    Sections arrive in completion order; ``position`` is the section's index
+    in the assembled article (0 is the intro, the last one the conclusion).
+    Sections written by one batched call arrive together.
+    """
+    sections = article_sections(query, recipes_list, library)
+    calls = plan_calls(sections)
+    workers = min(max_concurrency or GENERATION_CONCURRENCY, len(calls))
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {
+            pool.submit(metrics.in_context(_run_call), sections, positions): positions
+            for positions in calls
+        }
+        try:
+            for future in as_completed(futures):
+                for position, html in zip(futures[future], future.result()):
+                    yield position, sections[position][0], html
+        finally:
+            # Drop queued prompts if the consumer stops early (client disconnect)
+            for future in futures:
+                future.cancel()
+
+def _run_call(sections, positions):
+    """HTML of the sections at ``positions``, written by one call (or a batch)"""
+    if len(positions) == 1:
+        kind, prompt, fmt, _ = sections[positions[0]]
+        if prompt is None:
+            return [fmt(None)]
+        return [fmt(_complete_section(kind, prompt))]
+    recipes = [sections[position][3][0] for position in positions]
+    cuisine = sections[positions[0]][3][1]
+    contents = _complete_recipe_batch(recipes, cuisine)
+    return [sections[position][2](content) for position, content in zip(positions, contents)]
+
+async def _arun_call(sections, positions, client=None):
+    if len(positions) == 1:
+        kind, prompt, fmt, _ = sections[positions[0]]
+        if prompt is None:
+            return [fmt(None)]
+        with metrics.span(f"section_{kind}"):
+            return [fmt(await _acomplete(prompt, client))]
+    recipes = [sections[position][3][0] for position in positions]
+    cuisine = sections[positions[0]][3][1]
+    contents = await _acomplete_recipe_batch(recipes, cuisine, client)
+    return [sections[position][2](content) for position, content in zip(positions, contents)]
+
+def _complete_section(kind, prompt):
+    with metrics.span(f"section_{kind}"):
+        return _complete(prompt)
+
+def _complete_recipe_batch(recipes, cuisine):
+    """Raw section text per recipe, written by batched calls.
+
+    Recipes missing from a reply (malformed JSON, dropped or empty keys) are
+    asked for again in a batch of just those. Once a batch brings nothing
+    new, the rest fall back to one prompt each.
+    """
+    contents = [None] * len(recipes)
+    missing = list(range(len(recipes)))
+    while len(missing) > 1:
+        found = _request_recipe_batch([recipes[i] for i in missing], cuisine)
+        for j, content in found.items():
+            contents[missing[j]] = content
+        if not found:
+            break
+        missing = [i for i in missing if contents[i] is None]
+    for i in missing:
+        contents[i] = _complete_section("recipe", _recipe_prompt(recipes[i], cuisine))
+    return contents
+
+async def _acomplete_recipe_batch(recipes, cuisine, client=None):
+    contents = [None] * len(recipes)
+    missing = list(range(len(recipes)))
+    while len(missing) > 1:
+        found = await _arequest_recipe_batch([recipes[i] for i in missing], cuisine, client)
+        for j, content in found.items():
+            contents[missing[j]] = content
+        if not found:
+            break
+        missing = [i for i in missing if contents[i] is None]
+    for i in missing:
+        with metrics.span("section_recipe"):
+            contents[i] = await _acomplete(_recipe_prompt(recipes[i], cuisine), client)
+    return contents
+
+def _request_recipe_batch(recipes, cuisine):
+    """{position in ``recipes``: section text} from one batched call"""
+    with metrics.span("section_recipe_batch"):
+        try:
+            reply = _complete(_recipe_batch_prompt(recipes, cuisine), json_output=True)
+        except ValueError:
+            return {}
+    return _parse_recipe_batch(reply, len(recipes))
+
+async def _arequest_recipe_batch(recipes, cuisine, client=None):
+    with metrics.span("section_recipe_batch"):
+        try:
+            reply = await _acomplete(_recipe_batch_prompt(recipes, cuisine), client, json_output=True)
+        except ValueError:
+            return {}
+    return _parse_recipe_batch(reply, len(recipes))
+
+def _parse_recipe_batch(reply, count):
+    sections = _json_object(reply)
+    found = {}
+    for i in range(count):
+        content = sections.get(f"recipe_{i + 1}")
+        if isinstance(content, str) and content.strip():
+            found[i] = content
+    return found
+
+def _json_object(text):
+    """Parse a JSON object reply; ValueError when it is malformed"""
+    data = json.loads(text or "")
+    if not isinstance(data, dict):
+        raise ValueError("Expected a JSON object")
+    return data
+
+def _complete(prompt, temperature=0.7, json_output=False):
+    def create():
+        options = {"response_format": {"type": "json_object"}} if json_output else {}
+        response = clients.get_client().chat.completions.create(
+            model=LLM_MODEL,
+            messages=[{"role": "user", "content": prompt}],
+            temperature=temperature,
+            **options
+        )
+        metrics.record_tokens(LLM_MODEL, response.usage)
+        content = response.choices[0].message.content
+        if json_output:
+            # Raised before caching, so a malformed reply is never served again
+            _json_object(content)
+        return content
+
+    if completion_cache is None:
+        return create()
+    return completion_cache.get_or_create(LLM_MODEL, prompt, temperature, create)
+
+async def _acomplete(prompt, client=None, temperature=0.7, json_output=False):
+    client = client or clients.get_async_client()
+
+    async def create():
+        options = {"response_format": {"type": "json_object"}} if json_output else {}
+        response = await client.chat.completions.create(
+            model=LLM_MODEL,
+            messages=[{"role": "user", "content": prompt}],
+            temperature=temperature,
+            **options
+        )
+        metrics.record_tokens(LLM_MODEL, response.usage)
+        content = response.choices[0].message.content
+        if json_output:
+            _json_object(content)
+        return content
+
+    if completion_cache is None:
+        return await create()
+    return await completion_cache.aget_or_create(LLM_MODEL, prompt, temperature, create)
+
+def _as_html(content):
+    # Ensure it's wrapped in HTML if not already
+    if not content.strip().startswith('<'):
+        paragraphs = content.replace('\n\n', '</p><p>')
+        content = f"<p>{paragraphs}</p>"
+    return content
+
+def _intro_prompt(query, cuisine, number):
+    return f"""
 Write a compelling 2-3 paragraph introduction for an article titled "{query}".
 
 Create anticipation and set the scene for {cuisine} cuisine. Mention what makes {cuisine} food special and what readers will discover in this collection of {number} recipes.
@@ -56,25 +417,12 @@ Write in an engaging, warm tone that makes readers excited to cook these dishes.
 
 Format the response as HTML paragraphs using <p> tags.
 """
-    response = client.chat.completions.create(
-        model=LLM_MODEL,
-        messages=[{"role": "user", "content": prompt}],
-        temperature=0.7
-    )
-    content = response.choices[0].message.content
-    
-    # Ensure it's wrapped in HTML if not already
-    if not content.strip().startswith('<'):
-        content = f"<p>{content.replace('\n\n', '</p><p>')}</p>"
-    
-    return f"<h1>{query}</h1>\n{content}"
 
-def generate_recipe_sections(recipes_list, cuisine):
-    """Generate engaging sections for each recipe"""
-    sections = []
-    
-    for recipe in recipes_list:
-        prompt = f"""
+def _format_intro(query, content):
+    return f"<h1>{query}</h1>\n{_as_html(content)}"
+
+def _recipe_prompt(recipe, cuisine):
+    return f"""
 Write an engaging 2 paragraph section about this {cuisine} recipe:
 
 Title: {recipe['title']}
@@ -90,33 +438,45 @@ Write in engaging food-blog style, keep it profesional and new york times style,
 
 Format the response as HTML paragraphs using <p> tags.
 """
-        response = client.chat.completions.create(
-            model=LLM_MODEL,
-            messages=[{"role": "user", "content": prompt}],
-            temperature=0.7
-        )
-        
-        content = response.choices[0].message.content
-        
-        # Ensure it's wrapped in HTML if not already
-        if not content.strip().startswith('<'):
-            content = f"<p>{content.replace('\n\n', '</p><p>')}</p>"
-        
-        # Add image if available (with fallback placeholder)
-        image_html = ""
-        if recipe.get('image_url'):
-            image_html = f'<img src="{recipe["image_url"]}" alt="{recipe["title"]}" style="width: 100%; max-width: 600px; height: auto; border-radius: 8px; margin: 16px 0;" />\n'
-        else:
-            # Fallback: Add a placeholder div that can be styled or replaced
-            image_html = f'<div class="recipe-image-placeholder" style="width: 100%; max-width: 600px; height: 300px; background: linear-gradient(135deg, #f5f7fa 0%, #c3cfe2 100%); border-radius: 8px; margin: 16px 0; display: flex; align-items: center; justify-content: center; color: #666; font-style: italic;">Image: {recipe["title"]}</div>\n'
-        
-        sections.append(f"<h2>{recipe['title']}</h2>\n{image_html}{content}\n<p><a href='{recipe['url']}'>View Recipe</a></p>")
-    
-    return "\n\n".join(sections)
 
-def generate_cooking_tips(cuisine):
-    """Generate general cooking tips for the cuisine"""
-    prompt = f"""
+def _recipe_batch_prompt(recipes, cuisine):
+    entries = "\n".join(_recipe_batch_entry(i + 1, recipe) for i, recipe in enumerate(recipes))
+    return f"""
+Write an engaging 2 paragraph section about each of these {cuisine} recipes:
+
+{entries}
+For each recipe include:
+- Why this recipe is special
+- Cooking tips or techniques
+- Cultural context or flavor notes
+- What makes it authentic {cuisine}
+
+Write in engaging food-blog style, keep it profesional and new york times style, no buzzwords.
+
+Reply with a JSON object with one key per recipe ("recipe_1", "recipe_2", ...) whose value is that recipe's section formatted as HTML paragraphs using <p> tags.
+"""
+
+def _recipe_batch_entry(number, recipe):
+    return f"""recipe_{number}:
+Title: {recipe['title']}
+Description: {recipe['description']}
+"""
+
+def _format_recipe_section(recipe, content):
+    content = _as_html(content)
+
+    # Add image if available (with fallback placeholder)
+    image_html = ""
+    if recipe.get('image_url'):
+        image_html = f'<img src="{recipe["image_url"]}" alt="{recipe["title"]}" style="width: 100%; max-width: 600px; height: auto; border-radius: 8px; margin: 16px 0;" />\n'
+    else:
+        # Fallback: Add a placeholder div that can be styled or replaced
+        image_html = f'<div class="recipe-image-placeholder" style="width: 100%; max-width: 600px; height: 300px; background: linear-gradient(135deg, #f5f7fa 0%, #c3cfe2 100%); border-radius: 8px; margin: 16px 0; display: flex; align-items: center; justify-content: center; color: #666; font-style: italic;">Image: {recipe["title"]}</div>\n'
+
+    return f"<h2>{recipe['title']}</h2>\n{image_html}{content}\n<p><a href='{recipe['url']}'>View Recipe</a></p>"
+
+def _cooking_tips_prompt(cuisine):
+    return f"""
 Write 1-2 paragraphs of general cooking tips for {cuisine} cuisine.
 
 Focus on:
@@ -129,23 +489,12 @@ Write in a helpful, encouraging tone that builds confidence in home cooks.
 
 Format the response as HTML paragraphs using <p> tags.
 """
-    response = client.chat.completions.create(
-        model=LLM_MODEL,
-        messages=[{"role": "user", "content": prompt}],
-        temperature=0.7
-    )
-    
-    content = response.choices[0].message.content
-    
-    # Ensure it's wrapped in HTML if not already
-    if not content.strip().startswith('<'):
-        content = f"<p>{content.replace('\n\n', '</p><p>')}</p>"
-    
-    return f"<h2>Cooking Tips for {cuisine.title()} Cuisine</h2>\n{content}"
 
-def generate_conclusion(query, cuisine, number):
-    """Generate compelling conclusion"""
-    prompt = f"""
+def _format_cooking_tips(cuisine, content):
+    return f"<h2>Cooking Tips for {cuisine.title()} Cuisine</h2>\n{_as_html(content)}"
+
+def _conclusion_prompt(query, cuisine, number):
+    return f"""
 Write a compelling conclusion paragraph for an article about {query}.
 
 Tie everything together and encourage readers to try these {cuisine} recipes. End on an inspiring note that makes them excited to start cooking.
@@ -154,19 +503,22 @@ Keep it warm and encouraging.
 
 Format the response as HTML paragraphs using <p> tags.
 """
-    response = client.chat.completions.create(
-        model=LLM_MODEL,
-        messages=[{"role": "user", "content": prompt}],
-        temperature=0.7
-    )
-    
-    content = response.choices[0].message.content
-    
-    # Ensure it's wrapped in HTML if not already
-    if not content.strip().startswith('<'):
-        content = f"<p>{content.replace('\n\n', '</p><p>')}</p>"
-    
-    return content
+
+def generate_intro(query, cuisine, number):
+    """Generate compelling introduction"""
+    return _format_intro(query, _complete(_intro_prompt(query, cuisine, number)))
+
+def generate_recipe_sections(recipes_list, cuisine, max_concurrency=None):
+    """Generate engaging sections for each recipe"""
+    return "\n\n".join(run_sections(_recipe_sections(recipes_list, cuisine), max_concurrency))
+
+def generate_cooking_tips(cuisine):
+    """Generate general cooking tips for the cuisine"""
+    return _format_cooking_tips(cuisine, _complete(_cooking_tips_prompt(cuisine)))
+
+def generate_conclusion(query, cuisine, number):
+    """Generate compelling conclusion"""
+    return _as_html(_complete(_conclusion_prompt(query, cuisine, number)))
 
 # Keep the old function for backward compatibility
 def generate_summary(recipes_list):
@@ -0,0 +1,322 @@
+import json
+import math
+import os
+import sqlite3
+import threading
+import time
+import traceback
+import uuid
+
+import config
+from config import *
+
+# SQLite file holding queued, running and finished article jobs
+JOBS_DB_PATH = getattr(config, "JOBS_DB_PATH",
+                       os.path.join(os.path.dirname(os.path.abspath(EMBEDDINGS_JSON)), "jobs.sqlite3"))
+# Priority lanes; lower numbers are claimed first
+JOB_PRIORITIES = getattr(config, "JOB_PRIORITIES", {"high": 0, "normal": 1, "low": 2})
+# Seconds a job may take from submission before it is abandoned
+JOB_DEFAULT_DEADLINE = getattr(config, "JOB_DEFAULT_DEADLINE", 15 * 60)
+# A running job whose worker hasn't checked in for this long is picked up again
+JOB_LEASE_SECONDS = getattr(config, "JOB_LEASE_SECONDS", 120)
+# Finished jobs are deleted after this many seconds
+JOB_RETENTION = getattr(config, "JOB_RETENTION", 24 * 60 * 60)
+
+QUEUED, RUNNING, DONE, FAILED, EXPIRED = "queued", "running", "done", "failed", "expired"
+
+class DeadlineExceeded(Exception):
+    pass
+
+class LeaseLost(Exception):
+    """The job was expired or taken over by another worker"""
+
+class JobStore:
+    """Durable article jobs and their finished sections in SQLite.
+
+    Safe to share between threads, and between processes using the same
+    file: a job is claimed inside an immediate transaction, so exactly one
+    worker gets it. Workers hold a lease they renew with ``heartbeat`` and
+    as sections finish; a job whose lease lapses (its process died) goes
+    back to the queue, and the worker that lost it can no longer write to it.
+    """
+
+    def __init__(self, path=JOBS_DB_PATH, lease_seconds=JOB_LEASE_SECONDS):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self._lock = threading.Lock()
+        # job id -> attempt number of the jobs claimed through this store
+        self._claims = {}
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False,
+                                     isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                status TEXT NOT NULL,
+                priority INTEGER NOT NULL,
+                query TEXT NOT NULL,
+                params TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                deadline REAL NOT NULL,
+                started_at REAL,
+                finished_at REAL,
+                lease_until REAL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                total INTEGER,
+                recipes TEXT,
+                html TEXT,
+                cached INTEGER,
+                error TEXT
+            );
+            CREATE INDEX IF NOT EXISTS jobs_queue ON jobs (status, priority, created_at);
+            CREATE TABLE IF NOT EXISTS job_sections (
+                job_id TEXT NOT NULL,
+                position INTEGER NOT NULL,
+                kind TEXT NOT NULL,
+                html TEXT NOT NULL,
+                PRIMARY KEY (job_id, position)
+            );
+        """)
+
+    def _write(self, sql, params=()):
+        with self._lock:
+            return self._conn.execute(sql, params).rowcount
+
+    def submit(self, query, params=None, priority="normal", deadline_seconds=None):
+        """Queue a job and return its id.
+
+        Raises ValueError for an unknown priority or a ``deadline_seconds``
+        that is not a positive number.
+        """
+        if priority not in JOB_PRIORITIES:
+            raise ValueError(f"Unknown priority {priority!r}, expected one of {sorted(JOB_PRIORITIES)}")
+        if deadline_seconds is None:
+            deadline_seconds = JOB_DEFAULT_DEADLINE
+        else:
+            try:
+                deadline_seconds = float(deadline_seconds)
+            except (TypeError, ValueError):
+                raise ValueError(f"deadline_seconds must be a number, got {deadline_seconds!r}")
+            if not math.isfinite(deadline_seconds) or deadline_seconds <= 0:
+                raise ValueError(f"deadline_seconds must be positive, got {deadline_seconds!r}")
+        now = time.time()
+        job_id = uuid.uuid4().hex
+        self._write(
+            "INSERT INTO jobs (id, status, priority, query, params, created_at, deadline) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (job_id, QUEUED, JOB_PRIORITIES[priority], query, json.dumps(params or {}),
+             now, now + deadline_seconds)
+        )
+        return job_id
+
+    def claim(self):
+        """Take the next job for this worker: (id, query, params, deadline) or None.
+
+        Highest priority lane first, oldest first within a lane. Jobs past
+        their deadline are expired instead of being run.
+        """
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.execute(
+                    "UPDATE jobs SET status = ?, finished_at = ?, error = 'Deadline exceeded' "
+                    "WHERE status IN (?, ?) AND deadline <= ? AND (status = ? OR lease_until < ?)",
+                    (EXPIRED, now, QUEUED, RUNNING, now, QUEUED, now)
+                )
+                row = self._conn.execute(
+                    "SELECT id, query, params, deadline, attempts FROM jobs "
+                    "WHERE status = ? OR (status = ? AND lease_until < ?) "
+                    "ORDER BY priority, created_at LIMIT 1",
+                    (QUEUED, RUNNING, now)
+                ).fetchone()
+                if row is not None:
+                    self._conn.execute(
+                        "UPDATE jobs SET status = ?, started_at = ?, lease_until = ?, "
+                        "attempts = ? WHERE id = ?",
+                        (RUNNING, now, now + self.lease_seconds, row["attempts"] + 1, row["id"])
+                    )
+                    self._claims[row["id"]] = row["attempts"] + 1
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        if row is None:
+            return None
+        return row["id"], row["query"], json.loads(row["params"]), row["deadline"]
+
+    def _renew(self, job_id, **fields):
+        """Update columns of a job this worker is running and extend its lease"""
+        fields["lease_until"] = time.time() + self.lease_seconds
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        updated = self._write(
+            f"UPDATE jobs SET {assignments} WHERE id = ? AND status = ? AND attempts = ?",
+            (*fields.values(), job_id, RUNNING, self._claims.get(job_id))
+        )
+        if not updated:
+            raise LeaseLost(job_id)
+
+    def heartbeat(self, job_id):
+        """Extend the lease of a job this worker is running; False if it was lost"""
+        try:
+            self._renew(job_id)
+        except LeaseLost:
+            return False
+        return True
+
+    def set_recipes(self, job_id, recipes, total):
+        self._renew(job_id, recipes=json.dumps(recipes, default=str), total=total)
+
+    def add_section(self, job_id, position, kind, html):
+        self._renew(job_id)
+        self._write(
+            "INSERT OR REPLACE INTO job_sections (job_id, position, kind, html) VALUES (?, ?, ?, ?)",
+            (job_id, position, kind, html)
+        )
+
+    def finish(self, job_id, html, cached=False):
+        self._renew(job_id, status=DONE, html=html, cached=int(cached), finished_at=time.time())
+        self._claims.pop(job_id, None)
+
+    def fail(self, job_id, error, status=FAILED):
+        self._write(
+            "UPDATE jobs SET status = ?, error = ?, finished_at = ? "
+            "WHERE id = ? AND status = ? AND attempts = ?",
+            (status, error, time.time(), job_id, RUNNING, self._claims.pop(job_id, None))
+        )
+
+    def release(self, job_id):
+        """Forget a job this worker can no longer write to"""
+        self._claims.pop(job_id, None)
+
+    def get(self, job_id):
+        """Job as a dict with its finished sections, or None"""
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            if row is None:
+                return None
+            sections = self._conn.execute(
+                "SELECT position, kind, html FROM job_sections WHERE job_id = ? ORDER BY position",
+                (job_id,)
+            ).fetchall()
+        lanes = {number: name for name, number in JOB_PRIORITIES.items()}
+        return {
+            "job_id": row["id"],
+            "status": row["status"],
+            "priority": lanes.get(row["priority"], row["priority"]),
+            "query": row["query"],
+            "created_at": row["created_at"],
+            "started_at": row["started_at"],
+            "finished_at": row["finished_at"],
+            "deadline": row["deadline"],
+            "attempts": row["attempts"],
+            "total": row["total"],
+            "recipes": json.loads(row["recipes"]) if row["recipes"] else None,
+            "sections": [dict(section) for section in sections],
+            "html": row["html"],
+            "cached": bool(row["cached"]) if row["cached"] is not None else None,
+            "error": row["error"],
+        }
+
+    def counts(self):
+        """Number of jobs per status"""
+        with self._lock:
+            rows = self._conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        return {status: count for status, count in rows}
+
+    def prune(self, older_than=JOB_RETENTION):
+        """Delete jobs that finished more than ``older_than`` seconds ago"""
+        cutoff = time.time() - older_than
+        with self._lock:
+            self._conn.execute(
+                "DELETE FROM job_sections WHERE job_id IN "
+                "(SELECT id FROM jobs WHERE finished_at IS NOT NULL AND finished_at < ?)", (cutoff,)
+            )
+            return self._conn.execute(
+                "DELETE FROM jobs WHERE finished_at IS NOT NULL AND finished_at < ?", (cutoff,)
+            ).rowcount
+
+class JobWorkerPool:
+    """Threads that claim jobs from a ``JobStore`` and run them.
+
+    ``run_job(store, job_id, query, params, deadline)`` does the work and
+    records its result; an exception fails the job. Workers poll the store
+    every ``poll_seconds`` and are woken at once by ``notify()`` after a
+    submit, so a job queued by another process is picked up within one poll.
+
+    While a job runs, a heartbeat thread renews its lease every third of
+    the lease, so a single slow LLM call does not let another worker take
+    the job over. Heartbeats stop at the job's deadline, after which the
+    lease lapses and the job is expired.
+    """
+
+    def __init__(self, store, run_job, workers=2, poll_seconds=1.0):
+        self.store = store
+        self.run_job = run_job
+        self.workers = workers
+        self.poll_seconds = poll_seconds
+        self._wake = threading.Condition()
+        self._stopping = False
+        self._threads = []
+
+    def start(self):
+        for n in range(self.workers):
+            thread = threading.Thread(target=self._work, name=f"job-worker-{n}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def notify(self):
+        with self._wake:
+            self._wake.notify()
+
+    def stop(self):
+        with self._wake:
+            self._stopping = True
+            self._wake.notify_all()
+
+    def _work(self):
+        last_prune = 0.0
+        while not self._stopping:
+            try:
+                job = self.store.claim()
+                if time.time() - last_prune > 60 * 60:
+                    self.store.prune()
+                    last_prune = time.time()
+            except sqlite3.Error as e:
+                print(f"Job store error: {e}")
+                job = None
+            if job is None:
+                with self._wake:
+                    if not self._stopping:
+                        self._wake.wait(self.poll_seconds)
+                continue
+
+            job_id, query, params, deadline = job
+            print(f"Running job {job_id}: {query}")
+            done = threading.Event()
+            heartbeat = threading.Thread(target=self._heartbeat, args=(job_id, deadline, done),
+                                         name=f"job-heartbeat-{job_id}", daemon=True)
+            heartbeat.start()
+            try:
+                self.run_job(self.store, job_id, query, params, deadline)
+            except DeadlineExceeded:
+                print(f"Job {job_id} passed its deadline")
+                self.store.fail(job_id, "Deadline exceeded", status=EXPIRED)
+            except LeaseLost:
+                print(f"Job {job_id} was taken over or expired elsewhere")
+                self.store.release(job_id)
+            except Exception as e:
+                traceback.print_exc()
+                self.store.fail(job_id, str(e))
+            finally:
+                done.set()
+                heartbeat.join()
+
+    def _heartbeat(self, job_id, deadline, done):
+        while not done.wait(self.store.lease_seconds / 3) and time.time() < deadline:
+            try:
+                if not self.store.heartbeat(job_id):
+                    return  # expired or taken over; the job finds out on its next write
+            except sqlite3.Error as e:
+                print(f"Job {job_id} heartbeat failed: {e}")
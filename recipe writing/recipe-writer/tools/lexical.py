@@ -0,0 +1,120 @@
+import re
+from collections import Counter
+
+import numpy as np
+
+import config
+
+# Build a lexical index with the corpus, making searches hybrid (lexical + dense)
+HYBRID_SEARCH = getattr(config, "HYBRID_SEARCH", False)
+# BM25 parameters
+BM25_K1 = getattr(config, "BM25_K1", 1.2)
+BM25_B = getattr(config, "BM25_B", 0.75)
+# Term weight per field; a title match counts as much as three description matches
+LEXICAL_FIELD_WEIGHTS = getattr(config, "LEXICAL_FIELD_WEIGHTS",
+                                {"title": 3.0, "tags": 2.0, "category": 1.5, "description": 1.0})
+# Postings scored per query term. They are stored best-first, so common terms
+# cost the same however large the catalog grows
+LEXICAL_MAX_POSTINGS = getattr(config, "LEXICAL_MAX_POSTINGS", 20_000)
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+STOPWORDS = frozenset(
+    "a an and are as at best by easy for from how i in is it make my of on or our "
+    "recipe recipes the to top with you your".split()
+)
+
+def tokenize(text):
+    """Lowercased word tokens without stopwords, with a light plural strip"""
+    tokens = []
+    for token in _TOKEN.findall(text.lower()):
+        if token in STOPWORDS or token.isdigit():
+            continue
+        if len(token) > 3 and token.endswith("s") and not token.endswith("ss"):
+            token = token[:-1]
+        tokens.append(token)
+    return tokens
+
+def _field_text(recipe, field):
+    value = recipe.get(field) or ""
+    return " ".join(value) if isinstance(value, list) else str(value)
+
+class LexicalIndex:
+    """BM25 index over title, description, category and tags.
+
+    Postings are stored as a term-major sparse matrix (CSR layout:
+    ``indptr``, ``rows``, ``weights``). Each entry holds the BM25 weight
+    of a term in a recipe, precomputed at load time. A query sums the
+    weights of its terms' postings in one vectorized pass. Rows are
+    positions in ``ids``, the sorted recipe ids.
+    """
+
+    def __init__(self, id_to_recipe, field_weights=None, k1=BM25_K1, b=BM25_B):
+        field_weights = field_weights or LEXICAL_FIELD_WEIGHTS
+        self.ids = np.array(sorted(id_to_recipe), dtype="int64")
+        self.vocabulary = {}
+
+        term_cols, doc_rows, term_freqs = [], [], []
+        lengths = np.zeros(len(self.ids), dtype="float32")
+        # items() streams lazily loaded catalogs instead of one lookup per id
+        for recipe_id, recipe in id_to_recipe.items():
+            row = int(np.searchsorted(self.ids, recipe_id))
+            counts = Counter()
+            for field, weight in field_weights.items():
+                for token in tokenize(_field_text(recipe, field)):
+                    counts[token] += weight
+            lengths[row] = sum(counts.values())
+            for token, tf in counts.items():
+                term_cols.append(self.vocabulary.setdefault(token, len(self.vocabulary)))
+                doc_rows.append(row)
+                term_freqs.append(tf)
+
+        cols = np.array(term_cols, dtype="int64")
+        rows = np.array(doc_rows, dtype="int32")
+        tf = np.array(term_freqs, dtype="float32")
+
+        df = np.bincount(cols, minlength=len(self.vocabulary)).astype("float32")
+        idf = np.log1p((len(self.ids) - df + 0.5) / (df + 0.5))
+        average_length = max(float(lengths.mean()), 1.0) if len(lengths) else 1.0
+        norm = k1 * (1 - b + b * lengths[rows] / average_length)
+        weights = (idf[cols] * tf * (k1 + 1) / (tf + norm)).astype("float32")
+
+        # Group by term, best-scoring recipes first within each term
+        order = np.lexsort((-weights, cols))
+        self.rows = rows[order]
+        self.weights = weights[order]
+        self.indptr = np.zeros(len(self.vocabulary) + 1, dtype="int64")
+        np.cumsum(df.astype("int64"), out=self.indptr[1:])
+
+    def match(self, query, ids=None, max_postings=LEXICAL_MAX_POSTINGS):
+        """Return (ids, scores) of every recipe matching a query term, in id order.
+
+        ``ids`` optionally restricts matches to a sorted id array (as
+        returned by ``FacetIndex.select``).
+        """
+        cols = [self.vocabulary[t] for t in tokenize(query) if t in self.vocabulary]
+        if not cols:
+            return np.empty(0, dtype="int64"), np.empty(0, dtype="float32")
+
+        slices = [slice(self.indptr[c], min(self.indptr[c + 1], self.indptr[c] + max_postings)) for c in cols]
+        rows = np.concatenate([self.rows[s] for s in slices])
+        weights = np.concatenate([self.weights[s] for s in slices])
+        if ids is not None:
+            keep = np.isin(self.ids[rows], ids, assume_unique=False)
+            rows, weights = rows[keep], weights[keep]
+
+        matched, inverse = np.unique(rows, return_inverse=True)
+        return self.ids[matched], np.bincount(inverse, weights=weights).astype("float32")
+
+    def search(self, query, k, ids=None):
+        """Return (ids, scores) of the ``k`` best lexical matches, best first"""
+        matched, scores = self.match(query, ids)
+        top = top_k(scores, k)
+        return matched[top], scores[top]
+
+def top_k(scores, k):
+    """Positions of the ``k`` highest scores, best first"""
+    if len(scores) > k:
+        top = np.argpartition(-scores, k - 1)[:k]
+    else:
+        top = np.arange(len(scores))
+    return top[np.argsort(-scores[top], kind="stable")]
@@ -0,0 +1,212 @@
+import bisect
+import contextlib
+import contextvars
+import json
+import threading
+import time
+import uuid
+from functools import partial
+
+import config
+
+# Record spans, token usage and cache lookups; when off every hook is a no-op
+METRICS_ENABLED = getattr(config, "METRICS_ENABLED", True)
+# Print one JSON line per finished request
+METRICS_LOG_REQUESTS = getattr(config, "METRICS_LOG_REQUESTS", True)
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+def _label_text(names, values):
+    if not names:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for v in values)
+    pairs = ",".join(f'{n}="{v}"' for n, v in zip(names, escaped))
+    return "{" + pairs + "}"
+
+class Counter:
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help = help_text
+        self.labels = labels
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, labels=(), amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for labels, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_label_text(self.labels, labels)} {value}")
+        return lines
+
+class Histogram:
+    def __init__(self, name, help_text, labels=(), buckets=BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labels = labels
+        self.buckets = buckets
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, labels, value):
+        with self._lock:
+            series = self._values.get(labels)
+            if series is None:
+                series = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][bisect.bisect_left(self.buckets, value)] += 1
+            series[1] += value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        names = self.labels + ("le",)
+        with self._lock:
+            for labels, (counts, total) in sorted(self._values.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets + (float("inf"),), counts):
+                    cumulative += count
+                    le = "+Inf" if bound == float("inf") else repr(bound)
+                    lines.append(f"{self.name}_bucket{_label_text(names, labels + (le,))} {cumulative}")
+                lines.append(f"{self.name}_sum{_label_text(self.labels, labels)} {total}")
+                lines.append(f"{self.name}_count{_label_text(self.labels, labels)} {cumulative}")
+        return lines
+
+STAGE_SECONDS = Histogram("recipe_stage_seconds", "Time spent per pipeline stage", ("stage",))
+REQUEST_SECONDS = Histogram("recipe_request_seconds", "HTTP request duration", ("endpoint", "status"))
+TOKENS = Counter("recipe_llm_tokens_total", "Tokens used by OpenAI calls", ("model", "type"))
+CACHE_LOOKUPS = Counter("recipe_cache_lookups_total", "Cache lookups by cache and result", ("cache", "result"))
+
+REGISTRY = [STAGE_SECONDS, REQUEST_SECONDS, TOKENS, CACHE_LOOKUPS]
+
+class RequestTrace:
+    """Spans, tokens and cache lookups of one request, shared by its worker threads"""
+
+    def __init__(self, endpoint, request_id=None):
+        self.endpoint = endpoint
+        self.request_id = request_id or uuid.uuid4().hex
+        self.started = time.perf_counter()
+        self.stages = {}
+        self.tokens = {}
+        self.cache = {}
+        self._lock = threading.Lock()
+
+    def add_span(self, stage, seconds):
+        with self._lock:
+            count, total = self.stages.get(stage, (0, 0.0))
+            self.stages[stage] = (count + 1, total + seconds)
+
+    def add_tokens(self, model, kind, amount):
+        with self._lock:
+            usage = self.tokens.setdefault(model, {})
+            usage[kind] = usage.get(kind, 0) + amount
+
+    def add_cache(self, key):
+        with self._lock:
+            self.cache[key] = self.cache.get(key, 0) + 1
+
+    def summary(self, status):
+        with self._lock:
+            return {
+                "event": "request",
+                "request_id": self.request_id,
+                "endpoint": self.endpoint,
+                "status": status,
+                "duration_ms": round((time.perf_counter() - self.started) * 1000, 1),
+                "stages": {stage: {"count": count, "ms": round(total * 1000, 1)}
+                           for stage, (count, total) in self.stages.items()},
+                "tokens": {model: dict(usage) for model, usage in self.tokens.items()},
+                "cache": dict(self.cache),
+            }
+
+_current = contextvars.ContextVar("recipe_request_trace", default=None)
+
+def set_enabled(enabled):
+    global METRICS_ENABLED
+    METRICS_ENABLED = enabled
+
+def current_trace():
+    return _current.get()
+
+def start_request(endpoint, request_id=None):
+    """Begin tracing a request in the current context; None when metrics are off"""
+    if not METRICS_ENABLED:
+        return None
+    trace = RequestTrace(endpoint, request_id)
+    _current.set(trace)
+    return trace
+
+def finish_request(trace, status):
+    """Record the request's duration and log its summary"""
+    if trace is None:
+        return
+    if _current.get() is trace:
+        _current.set(None)
+    summary = trace.summary(status)
+    REQUEST_SECONDS.observe((trace.endpoint, str(status)), summary["duration_ms"] / 1000)
+    if METRICS_LOG_REQUESTS:
+        print(json.dumps(summary))
+
+class _Span:
+    __slots__ = ("stage", "started")
+
+    def __init__(self, stage):
+        self.stage = stage
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        observe_stage(self.stage, time.perf_counter() - self.started)
+        return False
+
+_NO_SPAN = contextlib.nullcontext()
+
+def span(stage):
+    """Context manager timing ``stage`` into the stage histogram and the current request"""
+    return _Span(stage) if METRICS_ENABLED else _NO_SPAN
+
+def observe_stage(stage, seconds):
+    """Record an already measured stage duration"""
+    if not METRICS_ENABLED:
+        return
+    STAGE_SECONDS.observe((stage,), seconds)
+    trace = _current.get()
+    if trace is not None:
+        trace.add_span(stage, seconds)
+
+def record_tokens(model, usage):
+    """Count the prompt/completion tokens of an OpenAI response's ``usage``"""
+    if not METRICS_ENABLED or usage is None:
+        return
+    trace = _current.get()
+    for kind in ("prompt", "completion"):
+        amount = getattr(usage, f"{kind}_tokens", None)
+        if amount:
+            TOKENS.inc((model, kind), amount)
+            if trace is not None:
+                trace.add_tokens(model, kind, amount)
+
+def record_cache(cache, hit):
+    if not METRICS_ENABLED:
+        return
+    result = "hit" if hit else "miss"
+    CACHE_LOOKUPS.inc((cache, result))
+    trace = _current.get()
+    if trace is not None:
+        trace.add_cache(f"{cache}_{result}")
+
+def in_context(fn):
+    """``fn`` bound to a copy of the current context, for work handed to a thread pool"""
+    if not METRICS_ENABLED:
+        return fn
+    return partial(contextvars.copy_context().run, fn)
+
+def render():
+    """All metrics in the Prometheus text exposition format"""
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
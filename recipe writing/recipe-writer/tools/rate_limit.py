@@ -0,0 +1,102 @@
+import re
+import threading
+import time
+
+_DURATION = re.compile(r"(\d+(?:\.\d+)?)(ms|s|m|h)")
+_UNITS = {"ms": 0.001, "s": 1.0, "m": 60.0, "h": 3600.0}
+
+def parse_duration(value):
+    """Seconds in an OpenAI reset header such as ``"20ms"``, ``"1s"`` or ``"6m0s"``"""
+    if not value:
+        return None
+    parts = _DURATION.findall(value)
+    if not parts:
+        try:
+            return float(value)
+        except ValueError:
+            return None
+    return sum(float(amount) * _UNITS[unit] for amount, unit in parts)
+
+def retry_after(headers, default):
+    """Seconds to wait after a 429, from the response headers if present"""
+    if headers is None:
+        return default
+    if headers.get("retry-after-ms"):
+        return float(headers["retry-after-ms"]) / 1000
+    if headers.get("retry-after"):
+        try:
+            return float(headers["retry-after"])
+        except ValueError:
+            pass
+    return parse_duration(headers.get("x-ratelimit-reset-tokens")) or default
+
+class RateLimiter:
+    """Token buckets for requests and tokens per minute, shared across threads.
+
+    ``acquire`` blocks until a request of the given size fits in both
+    buckets. ``update`` re-reads the limits and remaining budget from
+    OpenAI's ``x-ratelimit-*`` response headers, and ``pause`` stops all
+    callers after a 429.
+    """
+
+    def __init__(self, tokens_per_minute, requests_per_minute):
+        self.tokens_per_minute = float(tokens_per_minute)
+        self.requests_per_minute = float(requests_per_minute)
+        self._tokens = self.tokens_per_minute
+        self._requests = self.requests_per_minute
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens):
+        tokens = min(tokens, self.tokens_per_minute)
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                wait = self._paused_until - now
+                if wait <= 0:
+                    if self._tokens >= tokens and self._requests >= 1:
+                        self._tokens -= tokens
+                        self._requests -= 1
+                        return
+                    wait = max(
+                        (tokens - self._tokens) * 60 / self.tokens_per_minute,
+                        (1 - self._requests) * 60 / self.requests_per_minute,
+                    )
+            time.sleep(max(wait, 0.01))
+
+    def update(self, headers):
+        def number(name):
+            try:
+                return float(headers[name])
+            except (KeyError, TypeError, ValueError):
+                return None
+
+        limit_tokens = number("x-ratelimit-limit-tokens")
+        limit_requests = number("x-ratelimit-limit-requests")
+        remaining_tokens = number("x-ratelimit-remaining-tokens")
+        remaining_requests = number("x-ratelimit-remaining-requests")
+        with self._lock:
+            self._refill(time.monotonic())
+            if limit_tokens:
+                self.tokens_per_minute = limit_tokens
+            if limit_requests:
+                self.requests_per_minute = limit_requests
+            if remaining_tokens is not None:
+                self._tokens = min(self._tokens, remaining_tokens)
+            if remaining_requests is not None:
+                self._requests = min(self._requests, remaining_requests)
+
+    def pause(self, seconds):
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+            self._tokens = 0.0
+
+    def _refill(self, now):
+        elapsed = now - self._updated
+        self._updated = now
+        self._tokens = min(self.tokens_per_minute,
+                           self._tokens + elapsed * self.tokens_per_minute / 60)
+        self._requests = min(self.requests_per_minute,
+                             self._requests + elapsed * self.requests_per_minute / 60)
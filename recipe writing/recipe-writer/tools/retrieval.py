@@ -1,50 +1,199 @@
-from openai import OpenAI
 import numpy as np
-import faiss
+import config
 from config import *
+from tools import clients, metrics, vector_store
+from tools.catalog import get_recipes, get_vectors
+from tools.diversity import MMR_ENABLED, MMR_FETCH_MULTIPLIER, diversify as diversify_ids
+from tools.embedding_cache import QueryEmbeddingCache
+from tools.facets import FacetIndex, normalize_filters
+from tools.lexical import top_k
 
-client = OpenAI(api_key=OPENAI_API_KEY)
+# How hybrid searches combine lexical and dense scores: "rrf" or "weighted"
+HYBRID_FUSION = getattr(config, "HYBRID_FUSION", "rrf")
+# Share of the fused score given to the dense side (the rest goes to BM25)
+HYBRID_DENSE_WEIGHT = getattr(config, "HYBRID_DENSE_WEIGHT", 0.5)
+# Rank offset for reciprocal rank fusion
+HYBRID_RRF_K = getattr(config, "HYBRID_RRF_K", 60)
+# Candidates proposed by each side before fusion
+HYBRID_CANDIDATES = getattr(config, "HYBRID_CANDIDATES", 100)
 
-def search_recipes(query, index, id_to_recipe, category=None, tags=None, k=TOP_K):
-    # If no filters specified, search all recipes
-    if not category and not tags:
+query_cache = QueryEmbeddingCache()
+
+def embed_query(query):
+    """Return the query embedding as a (1, dim) float32 array, using the cache"""
+    with metrics.span("query_embedding"):
+        vector = query_cache.get(query)
+        if vector is None:
+            resp = clients.get_client().embeddings.create(input=query, model=EMBEDDING_MODEL)
+            metrics.record_tokens(EMBEDDING_MODEL, resp.usage)
+            vector = query_cache.put(query, resp.data[0].embedding)
+    return vector.reshape(1, -1)
+
+def embed_queries(queries):
+    """Return an (n, dim) float32 matrix of query embeddings.
+
+    Cached queries are served from the query cache; the rest are embedded
+    together, one API request per ``BATCH_SIZE`` distinct queries.
+    """
+    with metrics.span("query_embedding"):
+        vectors = [query_cache.get(query) for query in queries]
+        missing = list(dict.fromkeys(q for q, v in zip(queries, vectors) if v is None))
+
+        fresh = {}
+        for i in range(0, len(missing), BATCH_SIZE):
+            chunk = missing[i:i+BATCH_SIZE]
+            resp = clients.get_client().embeddings.create(input=chunk, model=EMBEDDING_MODEL)
+            metrics.record_tokens(EMBEDDING_MODEL, resp.usage)
+            for query, item in zip(chunk, sorted(resp.data, key=lambda d: d.index)):
+                fresh[query] = query_cache.put(query, item.embedding)
+
+    return np.vstack([v if v is not None else fresh[q] for q, v in zip(queries, vectors)])
+
+def search_recipes(query, index, id_to_recipe, category=None, tags=None, k=TOP_K, facets=None,
+                   lexical=None, diversify=MMR_ENABLED):
+    """Return the ``k`` recipes closest to ``query``, optionally filtered.
+
+    Filters are resolved through ``facets`` (a ``FacetIndex`` built once at
+    load time; one is built on the fly if omitted) and the main index is
+    searched restricted to the matching ids. Passing the corpus's
+    ``LexicalIndex`` as ``lexical`` makes the search hybrid (see
+    ``hybrid_search``). With ``diversify``, ``MMR_FETCH_MULTIPLIER`` times
+    as many candidates are fetched and reduced to ``k`` by maximal marginal
+    relevance, dropping near-duplicates (see ``diversity.mmr``).
+    """
+    filtered_ids = None
+    if category or tags:
+        if facets is None:
+            facets = FacetIndex(id_to_recipe)
+        filtered_ids = facets.select(category, tags)
+        if len(filtered_ids) == 0:
+            return []
+
+    query_vector = embed_query(query)
+    fetch = k * MMR_FETCH_MULTIPLIER if diversify else k
+    with metrics.span("search"):
+        if lexical is not None:
+            top_ids = hybrid_search(query, query_vector, index, id_to_recipe, lexical, fetch, filtered_ids)
+        else:
+            top_ids = _dense_search(index, query_vector, fetch, filtered_ids)[0]
+    top_ids = _finish(top_ids, query_vector, k, id_to_recipe, diversify)
+    return get_recipes(id_to_recipe, top_ids.tolist())
+
+def _finish(top_ids, query_vector, k, id_to_recipe, diversify):
+    """Drop empty result slots and cut the ranking to ``k``, diversifying if asked"""
+    top_ids = np.asarray(top_ids)
+    top_ids = top_ids[top_ids != -1]
+    if not diversify:
+        return top_ids[:k]
+    with metrics.span("diversify"):
+        return diversify_ids(top_ids, query_vector, k, id_to_recipe)
+
+def _dense_search(index, query_vectors, k, ids=None):
+    if ids is None:
         # Use the main index directly for better performance
-        query_embedding = client.embeddings.create(input=query, model=EMBEDDING_MODEL).data[0].embedding
-        query_vector = np.array([query_embedding]).astype("float32")
-        distances, top_indices = index.search(query_vector, k)
-        return [id_to_recipe[i] for i in top_indices[0]]
-    
-    # Filter indices based on category and tags
-    filtered_indices = []
-    for i, r in id_to_recipe.items():
-        recipe_category = r.get("category", "").lower()
-        recipe_tags = [tag.lower() for tag in r.get("tags", [])]
-        
-        # Check category filter (handle comma-separated categories)
-        category_match = True
-        if category:
-            category_lower = category.lower()
-            category_match = category_lower in recipe_category
-        
-        # Check tags filter
-        tags_match = True
-        if tags:
-            tags_lower = [tag.lower() for tag in tags]
-            tags_match = any(tag in recipe_tags for tag in tags_lower)
-        
-        if category_match and tags_match:
-            filtered_indices.append(i)
-    
-    if not filtered_indices:
+        return index.search(query_vectors, k)[1]
+    return vector_store.search_subset(index, query_vectors, min(k, len(ids)), ids)[1]
+
+def hybrid_search(query, query_vector, index, id_to_recipe, lexical, k, ids=None,
+                  fusion=HYBRID_FUSION, dense_weight=HYBRID_DENSE_WEIGHT):
+    """Ids of the ``k`` best recipes by fused lexical and dense relevance.
+
+    The vector index and the BM25 index each propose ``HYBRID_CANDIDATES``
+    recipes (restricted to ``ids`` when given). Every candidate in the union
+    is then scored on both signals: exact distances to the query vector in
+    one matrix operation, and BM25 scores from a single pass over the query
+    terms' postings. The scores are combined with reciprocal rank fusion
+    (``"rrf"``) or a weighted sum of min-max normalised scores
+    (``"weighted"``).
+    """
+    candidates = max(k, HYBRID_CANDIDATES)
+    dense_ids = _dense_search(index, query_vector, candidates, ids)[0]
+    matched_ids, matched_scores = lexical.match(query, ids)
+    lexical_ids = matched_ids[top_k(matched_scores, candidates)]
+
+    pool = np.union1d(dense_ids[dense_ids != -1], lexical_ids)
+    if len(pool) == 0:
+        return pool
+    vectors = get_vectors(id_to_recipe, pool)
+    dense = -((vectors - query_vector) ** 2).sum(axis=1)
+    sparse = np.zeros(len(pool), dtype="float32")
+    found = np.isin(pool, matched_ids)
+    sparse[found] = matched_scores[np.searchsorted(matched_ids, pool[found])]
+
+    fused = fuse_scores(dense, sparse, fusion, dense_weight)
+    return pool[np.argsort(-fused, kind="stable")[:k]]
+
+def fuse_scores(dense, sparse, fusion=HYBRID_FUSION, dense_weight=HYBRID_DENSE_WEIGHT):
+    """Combine dense and lexical scores of the same candidates (higher is better)"""
+    if fusion == "rrf":
+        fused = dense_weight / (HYBRID_RRF_K + _ranks(dense))
+        matched = sparse > 0
+        lexical_ranks = _ranks(np.where(matched, sparse, -np.inf))
+        fused[matched] += (1 - dense_weight) / (HYBRID_RRF_K + lexical_ranks[matched])
+        return fused
+    if fusion == "weighted":
+        return dense_weight * _min_max(dense) + (1 - dense_weight) * _min_max(sparse)
+    raise ValueError(f"Unknown fusion method: {fusion}")
+
+def _ranks(scores):
+    ranks = np.empty(len(scores), dtype="float64")
+    ranks[np.argsort(-scores, kind="stable")] = np.arange(1, len(scores) + 1)
+    return ranks
+
+def _min_max(scores):
+    low, high = scores.min(), scores.max()
+    if high == low:
+        return np.zeros(len(scores), dtype="float64")
+    return (scores - low) / (high - low)
+
+def search_recipes_batch(searches, index, id_to_recipe, facets=None, lexical=None,
+                         diversify=MMR_ENABLED):
+    """Run many searches with one embedding pass and batched index searches.
+
+    ``searches`` is a list of dicts with ``query`` and optional ``k``,
+    ``category`` and ``tags`` (same meaning as in ``search_recipes``; a
+    filter of the wrong type raises ValueError before anything is embedded).
+    Unfiltered searches share one multi-row index search; filtered ones are
+    grouped by filter and each group is one restricted search. With
+    ``lexical`` each search is hybrid, still sharing the embedding pass.
+    ``diversify`` works as in ``search_recipes``.
+    Returns one ranked recipe list per search, in order.
+    """
+    if not searches:
         return []
+    groups = {}
+    for i, s in enumerate(searches):
+        filters = normalize_filters(s.get("category"), s.get("tags"))
+        groups.setdefault(filters, []).append(i)
+
+    vectors = embed_queries([s["query"] for s in searches])
+    ks = [s.get("k") or TOP_K for s in searches]
+    fetches = [k * MMR_FETCH_MULTIPLIER if diversify else k for k in ks]
+    results = [None] * len(searches)
 
-    # Create temporary index with filtered vectors
-    filtered_vectors = np.array([id_to_recipe[i]["embedding"] for i in filtered_indices]).astype("float32")
-    temp_index = faiss.IndexFlatL2(len(filtered_vectors[0]))
-    temp_index.add(filtered_vectors)
+    with metrics.span("search"):
+        for (category, tags), rows in groups.items():
+            filtered_ids = None
+            if category or tags:
+                if facets is None:
+                    facets = FacetIndex(id_to_recipe)
+                filtered_ids = facets.select(category, tags)
+                if len(filtered_ids) == 0:
+                    for i in rows:
+                        results[i] = []
+                    continue
 
-    query_embedding = client.embeddings.create(input=query, model=EMBEDDING_MODEL).data[0].embedding
-    query_vector = np.array([query_embedding]).astype("float32")
+            if lexical is not None:
+                top_indices = [
+                    hybrid_search(searches[i]["query"], vectors[i:i + 1], index, id_to_recipe,
+                                  lexical, fetches[i], filtered_ids)
+                    for i in rows
+                ]
+            else:
+                top_indices = _dense_search(index, vectors[rows], max(fetches[i] for i in rows), filtered_ids)
 
-    distances, top_indices = temp_index.search(query_vector, min(k, len(filtered_indices)))
-    return [id_to_recipe[filtered_indices[i]] for i in top_indices[0]]
+            for row, i in enumerate(rows):
+                top_ids = _finish(top_indices[row][:fetches[i]], vectors[i:i + 1], ks[i],
+                                  id_to_recipe, diversify)
+                results[i] = get_recipes(id_to_recipe, top_ids.tolist())
+    return results
@@ -0,0 +1,199 @@
+import os
+import sqlite3
+import threading
+import time
+
+import config
+from config import *
+from tools import generator, metrics
+from tools.catalog import connect_readonly
+
+# Generate the section library during sync (costs LLM calls for every new
+# or edited recipe)
+SECTION_LIBRARY = getattr(config, "SECTION_LIBRARY", False)
+# Library of the unversioned data files (snapshots carry their own)
+SECTION_LIBRARY_PATH = getattr(config, "SECTION_LIBRARY_PATH",
+                               os.path.splitext(EMBEDDINGS_JSON)[0] + ".sections.sqlite3")
+# Cuisines written for every recipe; None writes "international" plus the
+# cuisine a recipe's own title, category and tags name
+SECTION_LIBRARY_CUISINES = getattr(config, "SECTION_LIBRARY_CUISINES", None)
+# Sections generated (and committed) per round while building
+SECTION_LIBRARY_CHUNK = getattr(config, "SECTION_LIBRARY_CHUNK", 256)
+
+# Content hashes per IN (...) lookup, below SQLite's bound-parameter limit
+_CHUNK = 500
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sections (
+    kind TEXT NOT NULL,
+    content_hash TEXT NOT NULL,
+    cuisine TEXT NOT NULL,
+    model TEXT NOT NULL,
+    prompt_hash TEXT NOT NULL,
+    text TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    PRIMARY KEY (kind, content_hash, cuisine, model)
+);
+"""
+
+class SectionLibrary:
+    """Pre-written article sections in SQLite.
+
+    Recipe sections are keyed by the recipe's ``content_hash``, the cuisine
+    and the model; cooking tips by cuisine and model (empty content hash).
+    Each row keeps the hash of the prompt it answered, so a section written
+    for an older prompt template is never reused. Rows hold the raw
+    completion text, formatted into HTML at query time exactly like a live
+    completion.
+
+    Connections work like ``catalog.RecipeCatalog``'s: a read-only library
+    opens one connection at load time and shares it between threads.
+    """
+
+    def __init__(self, path=SECTION_LIBRARY_PATH, readonly=False):
+        self.path = path
+        self.readonly = readonly
+        self._local = threading.local()
+        self._lock = threading.RLock()
+        self._shared = None
+        with self._lock:
+            conn = self._connection()
+            if not readonly:
+                conn.executescript(SCHEMA)
+
+    def _connection(self):
+        # Callers hold self._lock
+        if self.readonly:
+            if self._shared is None or self._shared[0] != os.getpid():
+                self._shared = (os.getpid(), connect_readonly(self.path))
+            return self._shared[1]
+        local = self._local
+        if getattr(local, "pid", None) != os.getpid():
+            local.conn = sqlite3.connect(self.path, timeout=30)
+            local.pid = os.getpid()
+        return local.conn
+
+    def lookup(self, keys, model=LLM_MODEL):
+        """{key: text} for the ``generator.library_key`` keys stored for ``model``"""
+        keys = list(keys)
+        found = self._find(keys, model)
+        for key in keys:
+            metrics.record_cache("section_library", key in found)
+        return found
+
+    def _find(self, keys, model):
+        hashes = sorted({key[1] for key in keys})
+        stored = {}
+        with self._lock:
+            conn = self._connection()
+            for start in range(0, len(hashes), _CHUNK):
+                chunk = hashes[start:start + _CHUNK]
+                for row in conn.execute(
+                    "SELECT kind, content_hash, cuisine, prompt_hash, text FROM sections "
+                    f"WHERE model = ? AND content_hash IN ({', '.join('?' * len(chunk))})",
+                    (model, *chunk)
+                ):
+                    stored[tuple(row[:4])] = row[4]
+        return {key: stored[key] for key in keys if key in stored}
+
+    def put_many(self, items, model=LLM_MODEL):
+        """Store (key, text) pairs in one transaction"""
+        now = time.time()
+        with self._lock, self._connection() as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO sections "
+                "(kind, content_hash, cuisine, model, prompt_hash, text, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                ((kind, content_hash, cuisine, model, prompt_hash, text, now)
+                 for (kind, content_hash, cuisine, prompt_hash), text in items)
+            )
+
+    def carry_over(self, previous_path, keys, model=LLM_MODEL):
+        """Copy the rows for ``keys`` from the library at ``previous_path``; returns how many"""
+        with self._lock:
+            conn = self._connection()
+            conn.execute("ATTACH DATABASE ? AS previous", (previous_path,))
+            try:
+                with conn:
+                    conn.execute("CREATE TEMP TABLE IF NOT EXISTS wanted "
+                                 "(kind, content_hash, cuisine, prompt_hash)")
+                    conn.execute("DELETE FROM wanted")
+                    conn.executemany("INSERT INTO wanted VALUES (?, ?, ?, ?)", keys)
+                    return conn.execute(
+                        "INSERT OR IGNORE INTO sections SELECT p.* FROM previous.sections p "
+                        "JOIN wanted w ON p.kind = w.kind AND p.content_hash = w.content_hash "
+                        "AND p.cuisine = w.cuisine AND p.prompt_hash = w.prompt_hash "
+                        "WHERE p.model = ?", (model,)
+                    ).rowcount
+            finally:
+                conn.execute("DETACH DATABASE previous")
+
+    def close(self):
+        with self._lock:
+            opened = [self._shared or (None, None),
+                      (getattr(self._local, "pid", None), getattr(self._local, "conn", None))]
+            for pid, conn in opened:
+                # Connections inherited from a parent process are left alone
+                if conn is not None and pid == os.getpid():
+                    conn.close()
+            self._shared = None
+            self._local = threading.local()
+
+    def __len__(self):
+        with self._lock:
+            return self._connection().execute("SELECT COUNT(*) FROM sections").fetchone()[0]
+
+def recipe_cuisines(recipe, cuisines=SECTION_LIBRARY_CUISINES):
+    """Cuisines to write a section in for ``recipe``"""
+    if cuisines:
+        return list(cuisines)
+    text = " ".join([recipe.get("title", ""), recipe.get("category") or "", *recipe.get("tags", [])])
+    return list(dict.fromkeys(["international", generator.extract_cuisine(text)]))
+
+def library_items(recipes, cuisines=SECTION_LIBRARY_CUISINES):
+    """Every (kind, recipe, cuisine) the library should hold for ``recipes``"""
+    items, tips = [], {}
+    for recipe in recipes:
+        for cuisine in recipe_cuisines(recipe, cuisines):
+            items.append(("recipe", recipe, cuisine))
+            tips.setdefault(cuisine, ("tips", None, cuisine))
+    return items + list(tips.values())
+
+def build_library(recipes, path=SECTION_LIBRARY_PATH, previous_path=None,
+                  cuisines=SECTION_LIBRARY_CUISINES, max_concurrency=None, chunk=SECTION_LIBRARY_CHUNK):
+    """Write the section library for ``recipes`` to ``path``.
+
+    Sections of recipes whose content hash, cuisine, model and prompt are
+    unchanged are copied from the library at ``previous_path`` (which may
+    be ``path`` itself); only the rest are generated, ``chunk`` at a time
+    through the same prompts, batching and completion cache as live
+    articles. The library is built next to ``path`` and moved into place
+    when complete. Returns counts of reused and generated sections.
+    """
+    items = library_items(recipes, cuisines)
+    keys = {generator.library_key(*item): item for item in items}
+
+    tmp_path = f"{path}.tmp"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    library = SectionLibrary(tmp_path)
+    try:
+        reused = 0
+        if previous_path and os.path.exists(previous_path):
+            reused = library.carry_over(previous_path, list(keys))
+        stored = library._find(list(keys), LLM_MODEL)
+        missing = [(key, item) for key, item in keys.items() if key not in stored]
+
+        for start in range(0, len(missing), chunk):
+            batch = missing[start:start + chunk]
+            texts = generator.library_texts([item for _, item in batch], max_concurrency)
+            library.put_many((key, text) for (key, _), text in zip(batch, texts))
+            print(f"Wrote {min(start + chunk, len(missing))}/{len(missing)} sections")
+    finally:
+        library.close()
+    os.replace(tmp_path, path)
+    return {"sections": len(keys), "reused": reused, "generated": len(missing)}
+
+def load_library(path=SECTION_LIBRARY_PATH):
+    """Read-only library at ``path``, or None if there is none"""
+    return SectionLibrary(path, readonly=True) if os.path.exists(path) else None
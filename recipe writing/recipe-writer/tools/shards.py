@@ -0,0 +1,364 @@
+import itertools
+import json
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import threading
+import weakref
+from concurrent.futures import Future
+from multiprocessing.connection import Connection
+
+import numpy as np
+
+import config
+from config import *
+from tools import vector_store
+
+# Split the index into this many shards, each searched by its own worker
+# process; 0 or 1 keeps the single index
+FAISS_SHARDS = getattr(config, "FAISS_SHARDS", 0)
+# OpenMP threads per shard worker (1 lets N shards use N cores without
+# oversubscribing them)
+SHARD_THREADS = getattr(config, "SHARD_THREADS", 1)
+
+MANIFEST = "shards.json"
+RECIPE_WRITER = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def shard_dir(index_path=FAISS_INDEX_FILE):
+    """Directory holding the shards of the index at ``index_path``"""
+    return index_path + ".shards"
+
+def shard_path(directory, shard):
+    return os.path.join(directory, f"shard-{shard:03d}.index")
+
+def assign_shards(ids, shards):
+    """Shard of each ``faiss_id``; stable across syncs, so an edit only touches its own shard"""
+    return np.asarray(ids, dtype="int64") % shards
+
+def load_manifest(directory):
+    """Shard count, index type and sizes of the shards in ``directory``, or None"""
+    try:
+        with open(os.path.join(directory, MANIFEST)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+def _publish(tmp_dir, directory, manifest):
+    with open(os.path.join(tmp_dir, MANIFEST), "w") as f:
+        json.dump(manifest, f, indent=2)
+    shutil.rmtree(directory, ignore_errors=True)
+    os.rename(tmp_dir, directory)
+    return manifest
+
+def _manifest(shards, index_type, params, sizes, dimension):
+    return {"shards": shards, "partition": "faiss_id % shards", "type": index_type,
+            "params": params, "dimension": dimension, "ntotal": sum(sizes), "sizes": sizes}
+
+def build_shards(recipes, vectors=None, shards=FAISS_SHARDS, index_type=None, params=None,
+                 path=FAISS_INDEX_FILE):
+    """Partition the corpus into ``shards`` indexes under ``shard_dir(path)``.
+
+    Each recipe goes to shard ``faiss_id % shards``, and each shard is a
+    regular id-mapped index of ``index_type`` (see ``vector_store.create_index``),
+    so every shard returns global ids. Shards are built one at a time,
+    copying only that shard's rows out of ``vectors``. Returns the manifest.
+    """
+    if vectors is None:
+        vectors = np.array([r["embedding"] for r in recipes]).astype("float32")
+    ids = vector_store._ids(recipes)
+    index_type = index_type or vector_store.FAISS_INDEX_TYPE
+    params = {**vector_store.FAISS_INDEX_PARAMS, **(params or {})}
+
+    directory = shard_dir(path)
+    tmp_dir = directory + ".tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+    owner = assign_shards(ids, shards)
+    sizes, shard_params = [], params
+    for shard in range(shards):
+        rows = np.flatnonzero(owner == shard)
+        index, shard_params = vector_store.create_index(vectors[rows], ids[rows], index_type, params)
+        vector_store.save_faiss_index(index, index_type, shard_params, shard_path(tmp_dir, shard))
+        sizes.append(int(index.ntotal))
+        print(f"Built shard {shard + 1}/{shards} with {index.ntotal} vectors")
+    return _publish(tmp_dir, directory,
+                    _manifest(shards, index_type, shard_params, sizes, vectors.shape[1]))
+
+def update_shards(previous, recipes, vectors=None, shards=FAISS_SHARDS, path=FAISS_INDEX_FILE,
+                  source_path=None):
+    """Apply the difference between two corpus versions shard by shard.
+
+    Each shard of ``shard_dir(source_path or path)`` gets
+    ``vector_store.update_faiss_index`` with its own part of ``previous``
+    and ``recipes``; the result is written to ``shard_dir(path)``. Rebuilds
+    every shard when the previous ones are missing, were split into a
+    different number of shards or have recipes without stable ids.
+    Returns ``(manifest, stats)``.
+    """
+    source = shard_dir(source_path or path)
+    previous_manifest = load_manifest(source)
+    if previous_manifest is None or previous_manifest["shards"] != shards \
+            or any(r.get("faiss_id") is None for r in previous):
+        print(f"No previous {shards}-way shards to update, rebuilding")
+        manifest = build_shards(recipes, vectors, shards, path=path)
+        return manifest, {"rebuilt": True, "added": len(recipes), "removed": 0}
+
+    previous_owner = assign_shards([r["faiss_id"] for r in previous], shards)
+    owner = assign_shards(vector_store._ids(recipes), shards)
+    directory = shard_dir(path)
+    tmp_dir = directory + ".tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+    stats = {"rebuilt": False, "added": 0, "removed": 0}
+    sizes, meta = [], {}
+    for shard in range(shards):
+        rows = np.flatnonzero(owner == shard)
+        source_shard = shard_path(source, shard)
+        index, shard_stats = vector_store.update_faiss_index(
+            vector_store.load_faiss_index(source_shard),
+            [r for r, s in zip(previous, previous_owner) if s == shard],
+            [recipes[row] for row in rows],
+            vectors[rows] if vectors is not None else None,
+            path=shard_path(tmp_dir, shard), source_path=source_shard,
+        )
+        stats["rebuilt"] |= shard_stats["rebuilt"]
+        stats["added"] += shard_stats["added"]
+        stats["removed"] += shard_stats["removed"]
+        sizes.append(int(index.ntotal))
+        meta = vector_store.load_index_meta(shard_path(tmp_dir, shard))
+    manifest = _manifest(shards, meta["type"], meta["params"], sizes,
+                         previous_manifest["dimension"])
+    return _publish(tmp_dir, directory, manifest), stats
+
+def merge_results(results, k):
+    """Exact top-``k`` of per-shard ``(distances, ids)`` results, nearest first.
+
+    Shards are disjoint, so the ``k`` nearest overall are among each
+    shard's ``k`` nearest. Equal distances are ordered by id, as a single
+    ``IndexIDMap2`` over ids assigned in row order returns them. Missing
+    slots are -1 with an infinite distance, like a FAISS search.
+    """
+    distances = np.hstack([d for d, _ in results])
+    ids = np.hstack([i for _, i in results])
+    order = np.lexsort((ids, distances), axis=-1)[:, :k]
+    distances = np.take_along_axis(distances, order, axis=1)
+    ids = np.take_along_axis(ids, order, axis=1)
+    if ids.shape[1] < k:
+        missing = k - ids.shape[1]
+        distances = np.pad(distances, ((0, 0), (0, missing)), constant_values=np.inf)
+        ids = np.pad(ids, ((0, 0), (0, missing)), constant_values=-1)
+    return distances, ids
+
+class ShardWorker:
+    """One shard's index, searched in a child process.
+
+    Requests from any number of threads are pipelined over a socket: each
+    is sent with an id and a reader thread hands the replies to their
+    futures, so the worker is never idle while requests are queued.
+    """
+
+    def __init__(self, path, threads=SHARD_THREADS, mmap=True):
+        self.path = path
+        parent, child = socket.socketpair()
+        env = {**os.environ,
+               "PYTHONPATH": os.pathsep.join(os.path.abspath(p) for p in sys.path if p)}
+        self.process = subprocess.Popen(
+            [sys.executable, "-m", "tools.shards", path, str(child.fileno()),
+             str(threads), "1" if mmap else "0"],
+            cwd=RECIPE_WRITER, env=env, pass_fds=[child.fileno()],
+        )
+        child.close()
+        self.conn = Connection(parent.detach())
+        self._send_lock = threading.Lock()
+        self._ids = itertools.count()
+        self._pending = {}
+        self.alive = True
+
+    def wait_ready(self):
+        """Block until the worker has loaded its shard; returns its vector count"""
+        try:
+            status, value = self.conn.recv()
+        except (EOFError, OSError):
+            status, value = "error", f"exited with status {self.process.wait()}"
+        if status != "ready":
+            self.close()
+            raise RuntimeError(f"Shard worker for {self.path} failed: {value}")
+        threading.Thread(target=self._read, name="shard-reader", daemon=True).start()
+        return value
+
+    def submit(self, query_vectors, k, ids=None):
+        """Future of the shard's ``(distances, ids)`` for the query rows"""
+        future = Future()
+        with self._send_lock:
+            request_id = next(self._ids)
+            self._pending[request_id] = future
+            try:
+                self.conn.send((request_id, query_vectors, k, ids))
+            except OSError as e:
+                self._pending.pop(request_id, None)
+                self.alive = False
+                raise RuntimeError(f"Shard worker for {self.path} is gone: {e}")
+        return future
+
+    def _read(self):
+        while True:
+            try:
+                request_id, result, error = self.conn.recv()
+            except (EOFError, OSError):
+                break
+            future = self._pending.pop(request_id)
+            if error:
+                future.set_exception(RuntimeError(f"Shard {self.path}: {error}"))
+            else:
+                future.set_result(result)
+        self.alive = False
+        with self._send_lock:
+            pending, self._pending = self._pending, {}
+        for future in pending.values():
+            future.set_exception(RuntimeError(f"Shard worker for {self.path} exited"))
+
+    def close(self):
+        """Ask the worker to exit and reap it"""
+        try:
+            self.conn.send(None)
+        except OSError:
+            pass
+        try:
+            self.process.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+            self.process.wait()
+        self.conn.close()
+
+def _close_workers(workers, pid):
+    # A forked child inherits the finalizer but not the workers
+    if os.getpid() == pid:
+        for worker in workers:
+            worker.close()
+
+class ShardedIndex:
+    """Scatter-gather search over the shards of an index, one worker process per shard.
+
+    Stands in for the FAISS index in ``retrieval``: ``search`` and
+    ``search_subset`` send the query to every shard at once and merge the
+    per-shard top-k lists with ``merge_results``. With flat shards the
+    result is exactly that of one flat index over the same vectors; IVF and
+    HNSW shards are each searched approximately as usual. A filtered
+    search sends each shard only the allowed ids it holds and skips shards
+    holding none.
+
+    Workers belong to the process that started them: a forked server
+    worker starts its own on first use. A worker that dies is restarted
+    on the next search. Workers exit when the index is garbage collected
+    (e.g. after a snapshot swap) or the process ends.
+    """
+
+    sharded = True
+
+    def __init__(self, directory, threads=SHARD_THREADS, mmap=True):
+        manifest = load_manifest(directory)
+        if manifest is None:
+            raise FileNotFoundError(f"No shard manifest in {directory}")
+        self.directory = directory
+        self.manifest = manifest
+        self.shards = manifest["shards"]
+        self.ntotal = manifest["ntotal"]
+        self.d = manifest["dimension"]
+        self.threads = threads
+        self.mmap = mmap
+        self._lock = threading.Lock()
+        self._pid = None
+        self._workers = []
+        self._start()
+
+    def _start(self):
+        workers = [ShardWorker(shard_path(self.directory, shard), self.threads, self.mmap)
+                   for shard in range(self.shards)]
+        try:
+            for worker in workers:
+                worker.wait_ready()
+        except Exception:
+            for worker in workers:
+                worker.close()
+            raise
+        self._workers, self._pid = workers, os.getpid()
+        weakref.finalize(self, _close_workers, workers, self._pid)
+
+    def _get_workers(self):
+        workers = self._workers
+        if self._pid != os.getpid() or not all(worker.alive for worker in workers):
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._start()
+                for shard, worker in enumerate(self._workers):
+                    if not worker.alive:
+                        print(f"Restarting shard worker {shard}")
+                        worker.close()
+                        replacement = ShardWorker(worker.path, self.threads, self.mmap)
+                        replacement.wait_ready()
+                        self._workers[shard] = replacement
+                workers = self._workers
+        return workers
+
+    def search(self, query_vectors, k):
+        """``(distances, ids)`` of the ``k`` nearest vectors over all shards"""
+        query_vectors = np.ascontiguousarray(query_vectors, dtype="float32")
+        futures = [worker.submit(query_vectors, k) for worker in self._get_workers()]
+        return merge_results([future.result() for future in futures], k)
+
+    def search_subset(self, query_vectors, k, ids):
+        """``search`` restricted to ``ids``"""
+        query_vectors = np.ascontiguousarray(query_vectors, dtype="float32")
+        ids = np.asarray(ids, dtype="int64")
+        owner = assign_shards(ids, self.shards)
+        futures = []
+        for shard, worker in enumerate(self._get_workers()):
+            shard_ids = ids[owner == shard]
+            if len(shard_ids):
+                futures.append(worker.submit(query_vectors, min(k, len(shard_ids)), shard_ids))
+        if not futures:
+            return (np.full((len(query_vectors), k), np.inf, dtype="float32"),
+                    np.full((len(query_vectors), k), -1, dtype="int64"))
+        return merge_results([future.result() for future in futures], k)
+
+    def close(self):
+        """Stop the workers now instead of at garbage collection"""
+        with self._lock:
+            _close_workers(self._workers, self._pid)
+            self._workers, self._pid = [], None
+
+def load_sharded_index(path=FAISS_INDEX_FILE, mmap=True):
+    """Start a worker per shard of the index at ``path`` (see ``build_shards``)"""
+    return ShardedIndex(shard_dir(path), mmap=mmap)
+
+def serve(path, fd, threads=SHARD_THREADS, mmap=True):
+    """Worker loop: load one shard and answer search requests until told to stop"""
+    conn = Connection(fd)
+    try:
+        vector_store.faiss.omp_set_num_threads(threads)
+        index = vector_store.load_faiss_index(path, mmap=mmap)
+    except Exception as e:
+        conn.send(("error", f"{type(e).__name__}: {e}"))
+        return
+    conn.send(("ready", index.ntotal))
+    while True:
+        try:
+            message = conn.recv()
+        except (EOFError, OSError):
+            return  # the parent went away
+        if message is None:
+            return
+        request_id, query_vectors, k, ids = message
+        try:
+            if ids is None:
+                result = index.search(query_vectors, k)
+            else:
+                result = vector_store.search_subset(index, query_vectors, k, ids)
+            conn.send((request_id, result, None))
+        except Exception as e:
+            conn.send((request_id, None, f"{type(e).__name__}: {e}"))
+
+if __name__ == "__main__":
+    serve(sys.argv[1], int(sys.argv[2]), int(sys.argv[3]), sys.argv[4] == "1")
@@ -0,0 +1,188 @@
+import atexit
+import json
+import os
+import shutil
+import time
+import uuid
+
+import config
+from config import *
+
+# Versioned corpus snapshots: <SNAPSHOT_DIR>/<version>/ plus a CURRENT pointer file
+SNAPSHOT_DIR = getattr(
+    config, "SNAPSHOT_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(EMBEDDINGS_JSON)), "snapshots")
+)
+# Published snapshots kept on disk (the current one is never removed)
+SNAPSHOT_KEEP = getattr(config, "SNAPSHOT_KEEP", 3)
+
+MANIFEST = "manifest.json"
+CURRENT = "CURRENT"
+# One file per serving process, named by pid, holding the version it has loaded
+PINS = ".pins"
+# Pin file written by this process, removed at exit
+_pin = {}
+
+class Snapshot:
+    """File layout of one snapshot directory"""
+
+    def __init__(self, directory, version):
+        self.directory = directory
+        self.version = version
+        self.matrix_path = os.path.join(directory, "embeddings.npy")
+        self.meta_path = os.path.join(directory, "metadata.json")
+        self.catalog_path = os.path.join(directory, "catalog.sqlite3")
+        self.index_path = os.path.join(directory, "recipes.index")
+        self.sections_path = os.path.join(directory, "sections.sqlite3")
+        self.manifest_path = os.path.join(directory, MANIFEST)
+
+    def manifest(self):
+        with open(self.manifest_path) as f:
+            return json.load(f)
+
+def current_version(root=SNAPSHOT_DIR):
+    """Version named by the CURRENT pointer, or None if nothing is published"""
+    try:
+        with open(os.path.join(root, CURRENT)) as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+def current_snapshot(root=SNAPSHOT_DIR):
+    version = current_version(root)
+    return open_snapshot(version, root) if version else None
+
+def open_snapshot(version, root=SNAPSHOT_DIR):
+    return Snapshot(os.path.join(root, version), version)
+
+class SnapshotWriter:
+    """Builds a snapshot in a hidden directory and publishes it atomically.
+
+    Use as a context manager and write the snapshot files to the paths of
+    ``writer.snapshot``. On a clean exit the directory is renamed into place,
+    the manifest written, and CURRENT switched to the new version with an
+    atomic rename, so readers only ever see complete snapshots. On error
+    the partial directory is removed and CURRENT is left untouched.
+    """
+
+    def __init__(self, root=SNAPSHOT_DIR, keep=SNAPSHOT_KEEP):
+        self.root = root
+        self.keep = keep
+        self.version = time.strftime("%Y%m%dT%H%M%SZ", time.gmtime()) + "-" + uuid.uuid4().hex[:6]
+        self.manifest = {}
+        self._tmp_dir = os.path.join(root, f".tmp-{self.version}")
+        self.snapshot = Snapshot(self._tmp_dir, self.version)
+
+    def __enter__(self):
+        os.makedirs(self._tmp_dir)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            shutil.rmtree(self._tmp_dir, ignore_errors=True)
+            return False
+
+        manifest = {
+            "version": self.version,
+            "created_at": time.time(),
+            "embedding_model": EMBEDDING_MODEL,
+            **self.manifest,
+        }
+        with open(self.snapshot.manifest_path, "w") as f:
+            json.dump(manifest, f, indent=2)
+
+        final_dir = os.path.join(self.root, self.version)
+        os.rename(self._tmp_dir, final_dir)
+        self.snapshot = Snapshot(final_dir, self.version)
+
+        tmp_pointer = os.path.join(self.root, f".{CURRENT}.tmp")
+        with open(tmp_pointer, "w") as f:
+            f.write(self.version)
+        os.replace(tmp_pointer, os.path.join(self.root, CURRENT))
+
+        prune_snapshots(self.root, self.keep)
+        return False
+
+def pin_snapshot(version, root=SNAPSHOT_DIR):
+    """Record that this process serves ``version``, so ``prune_snapshots`` keeps it.
+
+    A process holds one pin, replaced when it loads another version and
+    removed when it exits; pins of processes that died are ignored.
+    """
+    directory = os.path.join(root, PINS)
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, str(os.getpid()))
+    with open(path + ".tmp", "w") as f:
+        f.write(version)
+    os.replace(path + ".tmp", path)
+    _pin["path"] = path
+
+def _release_pin():
+    # Forked children inherit _pin but not the pin file itself
+    path = _pin.get("path")
+    if path and os.path.basename(path) == str(os.getpid()):
+        _unpin(path)
+
+atexit.register(_release_pin)
+
+def _unpin(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass  # alive, owned by another user
+    return True
+
+def pinned_versions(root=SNAPSHOT_DIR):
+    """Versions pinned by running processes (pins of dead ones are removed)"""
+    directory = os.path.join(root, PINS)
+    try:
+        names = os.listdir(directory)
+    except FileNotFoundError:
+        return set()
+    versions = set()
+    for name in names:
+        if not name.isdigit():
+            continue
+        path = os.path.join(directory, name)
+        if not _alive(int(name)):
+            _unpin(path)
+            continue
+        try:
+            with open(path) as f:
+                versions.add(f.read().strip())
+        except FileNotFoundError:
+            pass
+    return versions
+
+def _created_at(root, version):
+    # Versions name the second they were made in; the manifest orders
+    # snapshots published within the same second
+    try:
+        return open_snapshot(version, root).manifest()["created_at"]
+    except (OSError, ValueError, KeyError):
+        return 0.0
+
+def prune_snapshots(root=SNAPSHOT_DIR, keep=SNAPSHOT_KEEP):
+    """Delete all but the newest ``keep`` published snapshots.
+
+    The current snapshot and every snapshot a running server has pinned
+    (see ``pin_snapshot``) are kept regardless, so a server that has not
+    swapped yet, or failed to, can still reopen its files.
+    """
+    kept = {current_version(root)} | pinned_versions(root)
+    versions = sorted(
+        (name for name in os.listdir(root)
+         if not name.startswith(".") and os.path.isdir(os.path.join(root, name))),
+        key=lambda version: (_created_at(root, version), version)
+    )
+    for version in versions[:-keep] if keep else versions:
+        if version not in kept:
+            shutil.rmtree(os.path.join(root, version), ignore_errors=True)
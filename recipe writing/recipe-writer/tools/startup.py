@@ -0,0 +1,57 @@
+import importlib
+import os
+import threading
+import time
+
+def _process_start():
+    """Wall-clock time the current process started (Linux), else now"""
+    try:
+        with open("/proc/self/stat") as f:
+            # Fields after the command name, which may itself contain spaces
+            fields = f.read().rsplit(")", 1)[1].split()
+        with open("/proc/uptime") as f:
+            uptime = float(f.read().split()[0])
+        age = uptime - int(fields[19]) / os.sysconf("SC_CLK_TCK")
+        return time.time() - max(0.0, age)
+    except (OSError, ValueError, IndexError):
+        return time.time()
+
+PROCESS_START = _process_start()
+
+_marks = {}
+_lock = threading.Lock()
+
+def mark(event):
+    """Record the first time ``event`` happens, in seconds since process start"""
+    with _lock:
+        if event in _marks:
+            return _marks[event]
+        seconds = _marks[event] = round(time.time() - PROCESS_START, 3)
+    print(f"Startup: {event} after {seconds:.2f}s")
+    return seconds
+
+def report():
+    """{event: seconds since process start} for the events seen so far"""
+    with _lock:
+        return dict(_marks)
+
+class LazyModule:
+    """Stand-in for a module that is imported on first attribute access.
+
+    ``faiss = lazy_import("faiss")`` keeps the import off the startup path
+    of code that never touches it. Concurrent first accesses are safe:
+    ``importlib`` serializes imports of the same module.
+    """
+
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+
+    def __getattr__(self, attr):
+        module = self._module
+        if module is None:
+            module = self._module = importlib.import_module(self._name)
+        return getattr(module, attr)
+
+def lazy_import(name):
+    return LazyModule(name)
@@ -1,17 +1,196 @@
-import faiss
+import json
+import math
+import os
 import numpy as np
+import config
 from config import *
+from tools.startup import lazy_import
 
-def build_faiss_index(recipes):
-    dimension = len(recipes[0]["embedding"])
-    index = faiss.IndexFlatL2(dimension)
-    vectors = np.array([r["embedding"] for r in recipes]).astype("float32")
-    index.add(vectors)
-    faiss.write_index(index, FAISS_INDEX_FILE)
+# Imported when an index is first built or loaded, not at startup
+faiss = lazy_import("faiss")
+
+# Index type: "flat" (exact), "ivf_flat", "ivf_pq" or "hnsw"
+FAISS_INDEX_TYPE = getattr(config, "FAISS_INDEX_TYPE", "flat")
+# Overrides for nlist, nprobe, m, nbits (IVF / PQ) and M, efConstruction, efSearch (HNSW)
+FAISS_INDEX_PARAMS = getattr(config, "FAISS_INDEX_PARAMS", {})
+
+INDEX_TYPES = ("flat", "ivf_flat", "ivf_pq", "hnsw")
+
+def _ids(recipes):
+    return np.array([r.get("faiss_id", i) for i, r in enumerate(recipes)], dtype="int64")
+
+def _index_meta_path(path):
+    return path + ".json"
+
+def default_index_params(index_type, n):
+    """Parameters used for ``index_type`` on ``n`` vectors unless overridden"""
+    if index_type in ("ivf_flat", "ivf_pq"):
+        # ~4*sqrt(n) lists, but keep >= 39 training points per centroid
+        nlist = max(1, min(int(4 * math.sqrt(n)), n // 39))
+        params = {"nlist": nlist, "nprobe": min(nlist, max(1, nlist // 16))}
+        if index_type == "ivf_pq":
+            params.update({"m": 64, "nbits": 8})
+        return params
+    if index_type == "hnsw":
+        return {"M": 32, "efConstruction": 200, "efSearch": 64}
+    return {}
+
+def create_index(vectors, ids, index_type=None, params=None):
+    """Build an in-memory index of ``index_type`` over ``vectors`` stored under ``ids``.
+
+    Returns ``(index, params)`` with the effective parameters.
+    """
+    index_type = index_type or FAISS_INDEX_TYPE
+    if index_type not in INDEX_TYPES:
+        raise ValueError(f"Unknown index type {index_type!r}, expected one of {INDEX_TYPES}")
+    vectors = np.ascontiguousarray(vectors, dtype="float32")
+    n, dimension = vectors.shape
+    params = {**default_index_params(index_type, n), **(params or {})}
+
+    if index_type == "flat":
+        base = faiss.IndexFlatL2(dimension)
+    elif index_type == "hnsw":
+        base = faiss.IndexHNSWFlat(dimension, params["M"])
+        base.hnsw.efConstruction = params["efConstruction"]
+    else:
+        quantizer = faiss.IndexFlatL2(dimension)
+        if index_type == "ivf_flat":
+            base = faiss.IndexIVFFlat(quantizer, dimension, params["nlist"])
+        else:
+            if dimension % params["m"]:
+                raise ValueError(f"ivf_pq m={params['m']} must divide the dimension {dimension}")
+            if n < 2 ** params["nbits"]:
+                raise ValueError(f"ivf_pq with nbits={params['nbits']} needs at least "
+                                 f"{2 ** params['nbits']} vectors to train, got {n}")
+            base = faiss.IndexIVFPQ(quantizer, dimension, params["nlist"], params["m"], params["nbits"])
+        base.train(vectors)
+
+    index = faiss.IndexIDMap2(base)
+    index.add_with_ids(vectors, np.ascontiguousarray(ids, dtype="int64"))
+    set_search_params(index, params)
+    return index, params
+
+def base_index(index):
+    """The underlying index of an id-mapped index"""
+    if isinstance(index, faiss.IndexIDMap):
+        return faiss.downcast_index(index.index)
     return index
 
-def load_faiss_index():
-    return faiss.read_index(FAISS_INDEX_FILE)
+def set_search_params(index, params):
+    """Apply query-time parameters (nprobe for IVF, efSearch for HNSW)"""
+    base = base_index(index)
+    if isinstance(base, faiss.IndexIVF) and "nprobe" in params:
+        base.nprobe = params["nprobe"]
+    elif isinstance(base, faiss.IndexHNSW) and "efSearch" in params:
+        base.hnsw.efSearch = params["efSearch"]
+
+def build_faiss_index(recipes, vectors=None, index_type=None, params=None, path=FAISS_INDEX_FILE):
+    """Build and save the index.
+
+    Vectors are stored under each recipe's stable ``faiss_id`` (row number for
+    recipes without one), so later syncs can update the index in place.
+    ``vectors`` may be the memory-mapped matrix from
+    ``embeddings.load_embedding_store``; it is added without an intermediate copy.
+    The index type and its parameters are saved next to the index file and
+    restored by ``load_faiss_index``.
+    """
+    if vectors is None:
+        vectors = np.array([r["embedding"] for r in recipes]).astype("float32")
+    index_type = index_type or FAISS_INDEX_TYPE
+    index, params = create_index(vectors, _ids(recipes), index_type, {**FAISS_INDEX_PARAMS, **(params or {})})
+    save_faiss_index(index, index_type, params, path)
+    return index
+
+def save_faiss_index(index, index_type, params, path=FAISS_INDEX_FILE):
+    faiss.write_index(index, path)
+    meta = {"type": index_type, "params": params, "dimension": index.d, "ntotal": index.ntotal}
+    tmp_path = _index_meta_path(path) + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(meta, f, indent=2)
+    os.replace(tmp_path, _index_meta_path(path))
+
+def load_index_meta(path=FAISS_INDEX_FILE):
+    """Type and parameters the index was built with (flat for indexes without metadata)"""
+    try:
+        with open(_index_meta_path(path)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {"type": "flat", "params": {}}
+
+def update_faiss_index(index, previous, recipes, vectors=None, path=FAISS_INDEX_FILE, source_path=None):
+    """Apply the difference between two corpus versions to an existing index.
+
+    Recipes missing from ``recipes`` are removed by id, and new or edited
+    ones (different ``content_hash``) are re-added; unchanged vectors stay
+    untouched. Falls back to a full rebuild for indexes without stable ids
+    and for HNSW, which cannot remove vectors.
+    The result is saved to ``path``; ``source_path`` is where ``index`` was
+    loaded from, if elsewhere (its type and parameters are read from there).
+    Returns ``(index, stats)``.
+    """
+    previous_hashes = {r.get("faiss_id"): r.get("content_hash") for r in previous}
+    if not isinstance(index, faiss.IndexIDMap2) or None in previous_hashes \
+            or index.ntotal != len(previous_hashes):
+        print("Index has no stable ids for these recipes, rebuilding")
+        index = build_faiss_index(recipes, vectors, path=path)
+        return index, {"rebuilt": True, "added": len(recipes), "removed": 0}
+    if isinstance(base_index(index), faiss.IndexHNSW):
+        # HNSW graphs do not support removal
+        meta = load_index_meta(source_path or path)
+        index = build_faiss_index(recipes, vectors, meta["type"], meta["params"], path)
+        return index, {"rebuilt": True, "added": len(recipes), "removed": 0}
+
+    current_ids = {r["faiss_id"] for r in recipes}
+    removed = [i for i in previous_hashes if i not in current_ids]
+    changed_rows = [
+        row for row, r in enumerate(recipes)
+        if previous_hashes.get(r["faiss_id"]) != r["content_hash"]
+    ]
+    stale = removed + [recipes[row]["faiss_id"] for row in changed_rows
+                       if recipes[row]["faiss_id"] in previous_hashes]
+
+    if stale:
+        index.remove_ids(np.array(stale, dtype="int64"))
+    if changed_rows:
+        if vectors is None:
+            added = np.array([recipes[row]["embedding"] for row in changed_rows]).astype("float32")
+        else:
+            added = np.ascontiguousarray(vectors[changed_rows], dtype="float32")
+        index.add_with_ids(added, _ids([recipes[row] for row in changed_rows]))
+
+    meta = load_index_meta(source_path or path)
+    save_faiss_index(index, meta["type"], meta["params"], path)
+    return index, {"rebuilt": False, "added": len(changed_rows), "removed": len(removed)}
+
+def search_subset(index, query_vectors, k, ids):
+    """Search ``index`` restricted to the given ids (no temporary index)"""
+    if getattr(index, "sharded", False):
+        # A shards.ShardedIndex splits the ids among its shards itself
+        return index.search_subset(query_vectors, k, ids)
+    ids = np.ascontiguousarray(ids, dtype="int64")
+    selector = faiss.IDSelectorBatch(len(ids), faiss.swig_ptr(ids))
+    return index.search(query_vectors, k, params=_search_parameters(index, selector))
+
+def _search_parameters(index, selector):
+    # Explicit search parameters replace the index's own nprobe / efSearch,
+    # so carry those over
+    base = base_index(index)
+    if isinstance(base, faiss.IndexIVF):
+        return faiss.SearchParametersIVF(sel=selector, nprobe=base.nprobe)
+    if isinstance(base, faiss.IndexHNSW):
+        return faiss.SearchParametersHNSW(sel=selector, efSearch=base.hnsw.efSearch)
+    return faiss.SearchParameters(sel=selector)
+
+def load_faiss_index(path=FAISS_INDEX_FILE, mmap=False):
+    """Load the index, restoring its search parameters.
+
+    With ``mmap`` the index is opened read-only and IVF inverted lists are
+    memory-mapped, so processes serving the same file share those pages.
+    """
+    flags = faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY if mmap else 0
+    index = faiss.read_index(path, flags)
+    set_search_params(index, load_index_meta(path)["params"])
+    return index
 
 def get_id_to_recipe(recipes):
-    return {i: r for i, r in enumerate(recipes)}
+    return {r.get("faiss_id", i): r for i, r in enumerate(recipes)}